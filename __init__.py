@@ -1,28 +1,38 @@
 import threading
-import time
-import requests
 import dollar_server
+from mcp_server import mcp_server, InProcessTransport
 from autogen_gemini_client import interactive_mode
 
+# El hilo del servidor lo señala apenas el socket está escuchando (o si falló al abrirlo)
+server_ready = threading.Event()
+server_error = None
+
 def run_dollar_server():
     """Ejecuta el servidor de dólar en segundo plano"""
+    global server_error
+    from werkzeug.serving import make_server
+    
     print("🚀 Iniciando servidor dólar...")
-    dollar_server.app.run(port=5000, debug=False, use_reloader=False)
+    try:
+        # make_server abre el socket antes de volver: a partir de acá ya acepta conexiones
+        server = make_server("127.0.0.1", 5000, dollar_server.app, threaded=True)
+    except Exception as e:
+        server_error = e
+        server_ready.set()
+        return
+    server_ready.set()
+    server.serve_forever()
 
-def wait_for_server():
-    """Espera a que el servidor esté listo"""
+def wait_for_server(timeout: float = 30):
+    """Espera la señal del hilo del servidor (sin sondear por HTTP ni consultar el upstream)"""
     print("⏳ Esperando servidor...")
-    for i in range(30):
-        try:
-            response = requests.get('http://localhost:5000/types', timeout=2)
-            if response.status_code == 200:
-                print("✅ Servidor dólar listo!")
-                return True
-        except:
-            if i % 5 == 0:
-                print(f"   Intentando conectar... ({i+1}/30)")
-            time.sleep(1)
-    print("❌ Servidor no respondió")
+    if server_ready.wait(timeout) and server_error is None:
+        print("✅ Servidor dólar listo!")
+        return True
+    if server_error is not None:
+        print(f"❌ No se pudo iniciar el servidor: {server_error}")
+    else:
+        print("❌ Servidor no respondió")
     return False
 
 def main():
@@ -33,6 +43,9 @@ def main():
     server_thread = threading.Thread(target=run_dollar_server, daemon=True)
     server_thread.start()
     
+    # Servidor y agente comparten proceso: las herramientas llaman al servicio directamente
+    mcp_server.set_transport(InProcessTransport(dollar_server.dollar_service))
+    
     # Esperar servidor
     if wait_for_server():
         # Iniciar cliente interactivo
@@ -0,0 +1,457 @@
+import json
+import os
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from shared_snapshot import file_lock, write_atomic
+import metrics
+
+ABOVE = "above"
+BELOW = "below"
+DIRECTIONS = (ABOVE, BELOW)
+# brecha: diferencia porcentual de la venta contra la del oficial
+FIELDS = ('compra', 'venta', 'brecha')
+
+MAX_ALERTS_PER_USER = 1000
+# Disparos recientes que se conservan por usuario
+MAX_NOTIFICATIONS = 100
+# Líneas del journal compartido a partir de las cuales se compacta (además de 2 por alerta pendiente)
+COMPACT_MIN_RECORDS = 1000
+
+class Alert(NamedTuple):
+    id: int
+    user: str
+    dollar_type: str
+    field: str
+    direction: str
+    threshold: float
+    created: float
+
+class ThresholdIndex:
+    """Umbrales de una serie y dirección, ordenados, con el id de alerta en paralelo.
+
+    Los umbrales que cruza un cambio de valor forman un rango contiguo del índice:
+    se ubica con dos búsquedas binarias y se elimina de una vez, así que evaluar
+    cuesta O(log n + disparadas) sin importar cuántas alertas haya registradas.
+    """
+
+    def __init__(self):
+        self.thresholds = array('d')
+        self.ids = array('q')
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, threshold: float, alert_id: int):
+        i = bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(i, threshold)
+        self.ids.insert(i, alert_id)
+
+    def remove(self, threshold: float, alert_id: int) -> bool:
+        lo = bisect_left(self.thresholds, threshold)
+        hi = bisect_right(self.thresholds, threshold)
+        for i in range(lo, hi):
+            if self.ids[i] == alert_id:
+                del self.thresholds[i]
+                del self.ids[i]
+                return True
+        return False
+
+    def _pop_range(self, lo: int, hi: int) -> List[int]:
+        if lo >= hi:
+            return []
+        ids = self.ids[lo:hi].tolist()
+        del self.thresholds[lo:hi]
+        del self.ids[lo:hi]
+        return ids
+
+    def crossed_up(self, old: float, new: float) -> List[int]:
+        """Alertas "above" disparadas al subir de old a new: old <= umbral < new"""
+        return self._pop_range(bisect_left(self.thresholds, old), bisect_left(self.thresholds, new))
+
+    def crossed_down(self, old: float, new: float) -> List[int]:
+        """Alertas "below" disparadas al bajar de old a new: new < umbral <= old"""
+        return self._pop_range(bisect_right(self.thresholds, new), bisect_right(self.thresholds, old))
+
+def series_values(data: dict, type_map: Dict[str, str]) -> Dict[Tuple[str, str], float]:
+    """Valores de cada serie alertable de un snapshot: (tipo, campo) -> valor"""
+    values = {}
+    oficial = data.get(type_map.get('oficial', 'oficial'))
+    for dollar_type, key in type_map.items():
+        quote = data.get(key)
+        if not quote:
+            continue
+        values[(dollar_type, 'compra')] = float(quote['compra'])
+        values[(dollar_type, 'venta')] = float(quote['venta'])
+        if dollar_type != 'oficial' and oficial and oficial['venta']:
+            values[(dollar_type, 'brecha')] = round((quote['venta'] / oficial['venta'] - 1) * 100, 4)
+    return values
+
+class AlertEngine:
+    """Alertas de umbral de una sola vez ("avisame cuando el blue venta supere X").
+
+    Las alertas se guardan en un ThresholdIndex por (tipo, campo, dirección). Con
+    cada snapshot nuevo sólo se consultan los índices de las series que se movieron,
+    en la dirección en que se movieron. Cada alerta disparada se quita del índice y
+    queda en los avisos recientes del usuario.
+
+    Con path el estado se comparte entre workers a través de un journal append-only
+    (una línea JSON por operación). Cada worker tiene el estado en memoria y, antes
+    de operar, aplica sólo las líneas que agregaron los demás desde su última
+    lectura; los cambios se escriben con el lock del archivo tomado. Así cada
+    operación cuesta lo que cambia y no lo que hay registrado. Cuando el journal
+    tiene muchas más líneas que alertas pendientes se compacta (se reescribe con
+    el estado vigente), un costo O(n) cada Ω(n) operaciones. Un snapshot se evalúa
+    una sola vez aunque lo reciban todos los workers (el primero lo marca como evaluado).
+    """
+
+    def __init__(self, type_map: Dict[str, str], max_per_user: int = MAX_ALERTS_PER_USER,
+                 max_notifications: int = MAX_NOTIFICATIONS, path: Optional[str] = None,
+                 compact_min: int = COMPACT_MIN_RECORDS):
+        self.type_map = type_map
+        self.max_per_user = max_per_user
+        self.max_notifications = max_notifications
+        self._indexes: Dict[Tuple[str, str, str], ThresholdIndex] = {}
+        self._alerts: Dict[int, Alert] = {}
+        self._by_user: Dict[str, set] = {}
+        # Último valor de cada serie (tipo, campo)
+        self._values: Dict[Tuple[str, str], float] = {}
+        self._notifications: Dict[str, deque] = {}
+        self._next_id = 1
+        self._next_event = 1
+        # Timestamp del último snapshot evaluado: uno igual o más viejo no vuelve a mover los valores
+        self._evaluated = 0.0
+        # Journal compartido entre procesos (None = sólo en memoria)
+        self.path = path
+        self.compact_min = compact_min
+        # Primera línea del journal leído (identifica el archivo: cambia al compactar),
+        # bytes ya aplicados y cantidad de líneas
+        self._header = None
+        self._offset = 0
+        self._records = 0
+        self._listeners: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+        metrics.ALERTS_PENDING.set_function(lambda: len(self._alerts))
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """listener(aviso) se llama con cada alerta disparada (p. ej. para enviar notificaciones)"""
+        self._listeners.append(listener)
+
+    def add(self, user: str, dollar_type: str, threshold: float, direction: str = ABOVE,
+            field: str = 'venta') -> Tuple[Alert, Optional[dict]]:
+        """Registra una alerta; si la condición ya se cumple se dispara en el momento.
+
+        Devuelve (alerta, aviso o None). Lanza ValueError si los parámetros no son válidos.
+        """
+        user = str(user or 'default')
+        dollar_type = str(dollar_type).lower()
+        if dollar_type not in self.type_map:
+            raise ValueError(f"tipo de dólar inválido: {dollar_type} (disponibles: {', '.join(self.type_map)})")
+        if field not in FIELDS:
+            raise ValueError(f"campo inválido: {field} (disponibles: {', '.join(FIELDS)})")
+        if field == 'brecha' and dollar_type == 'oficial':
+            raise ValueError("la brecha se calcula contra el oficial: elegí otro tipo")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"dirección inválida: {direction} (above | below)")
+        try:
+            threshold = float(threshold)
+        except (TypeError, ValueError):
+            raise ValueError("el umbral debe ser un número")
+        if threshold != threshold or threshold in (float('inf'), float('-inf')):
+            raise ValueError("el umbral debe ser un número finito")
+
+        with self._state(write=True):
+            if len(self._by_user.get(user, ())) >= self.max_per_user:
+                raise ValueError(f"máximo de {self.max_per_user} alertas por usuario")
+            alert = Alert(self._next_id, user, dollar_type, field, direction, threshold, time.time())
+            self._next_id += 1
+            current = self._values.get((dollar_type, field))
+            if current is not None and (current > threshold if direction == ABOVE else current < threshold):
+                notification = self._notify(alert, current, None, None)
+                self._write({'op': 'eval', 'fired': [notification]})
+            else:
+                notification = None
+                self._insert(alert)
+                self._write({'op': 'add', 'alert': list(alert)})
+        if notification is not None:
+            self._dispatch([notification])
+        return alert, notification
+
+    def remove(self, alert_id: int, user: Optional[str] = None) -> bool:
+        """Elimina una alerta pendiente (sólo si es del usuario, cuando se indica)"""
+        with self._state(write=True):
+            alert = self._alerts.get(alert_id)
+            if alert is None or (user is not None and alert.user != user):
+                return False
+            self._delete(alert_id)
+            self._write({'op': 'remove', 'id': alert_id})
+            return True
+
+    def pending(self, user: str) -> List[Alert]:
+        """Alertas pendientes del usuario, de la más vieja a la más nueva"""
+        with self._state():
+            return sorted((self._alerts[i] for i in self._by_user.get(user, ())), key=lambda alert: alert.id)
+
+    def notifications(self, user: str, since: int = 0) -> List[dict]:
+        """Avisos recientes del usuario posteriores al evento since"""
+        with self._state():
+            return [n for n in self._notifications.get(user, ()) if n['evento'] > since]
+
+    def value(self, dollar_type: str, field: str) -> Optional[float]:
+        with self._state():
+            return self._values.get((dollar_type, field))
+
+    def evaluate(self, snapshot: dict) -> List[dict]:
+        """Dispara las alertas cruzadas por un snapshot nuevo; devuelve los avisos"""
+        if snapshot.get('fallback'):
+            # Los datos de referencia no son cotizaciones reales
+            return []
+        fired = []
+        timestamp = snapshot.get('timestamp') or 0.0
+        with self._state(write=True):
+            if timestamp and timestamp <= self._evaluated:
+                # Ya lo evaluó otro worker, o es más viejo que el último evaluado
+                return []
+            self._evaluated = max(self._evaluated, timestamp)
+            changed = []
+            for series, new in series_values(snapshot['data'], self.type_map).items():
+                old = self._values.get(series)
+                self._values[series] = new
+                if old == new:
+                    continue
+                changed.append([series[0], series[1], new])
+                for alert in self._cross(series, old, new):
+                    fired.append(self._notify(alert, new, old, snapshot.get('version')))
+            # Se registra aunque nada haya cambiado: el resto de los workers no lo vuelve a evaluar
+            self._write({'op': 'eval', 'evaluated': self._evaluated, 'values': changed, 'fired': fired})
+        if fired:
+            self._dispatch(fired)
+        return fired
+
+    def _cross(self, series: Tuple[str, str], old: Optional[float], new: float) -> List[Alert]:
+        """Quita y devuelve las alertas de la serie que cruza el cambio de old a new"""
+        dollar_type, field = series
+        if old is None:
+            # Primer valor conocido: disparar todo lo que ya se cumple
+            up = self._indexes.get((dollar_type, field, ABOVE))
+            down = self._indexes.get((dollar_type, field, BELOW))
+            ids = (up.crossed_up(float('-inf'), new) if up else []) + (down.crossed_down(new, float('inf')) if down else [])
+        elif new > old:
+            index = self._indexes.get((dollar_type, field, ABOVE))
+            ids = index.crossed_up(old, new) if index else []
+        else:
+            index = self._indexes.get((dollar_type, field, BELOW))
+            ids = index.crossed_down(old, new) if index else []
+        alerts = []
+        for alert_id in ids:
+            alert = self._alerts.pop(alert_id)
+            self._by_user[alert.user].discard(alert_id)
+            alerts.append(alert)
+        return alerts
+
+    @contextmanager
+    def _state(self, write: bool = False):
+        """Lock del motor y, con path, estado al día con el journal (y su lock si se va a escribir)"""
+        with self._lock:
+            if self.path is None:
+                yield
+            elif write:
+                with file_lock(self.path + '.lock'):
+                    self._catch_up(write=True)
+                    yield
+            else:
+                self._catch_up()
+                yield
+
+    def _catch_up(self, write: bool = False):
+        """Aplica las líneas que otros procesos agregaron al journal desde la última lectura (con el lock tomado).
+
+        Sólo se leen los bytes nuevos. Si el archivo es otro (se compactó) se carga entero.
+        Una línea incompleta se deja para la próxima lectura; con el lock del archivo
+        tomado sólo puede ser el resto de una escritura interrumpida, y se descarta.
+        """
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            if self._header:
+                self._reset(b"")
+            return
+        with f:
+            header = f.readline()
+            full = header != self._header
+            if full:
+                self._reset(header)
+                if not header.endswith(b"\n"):
+                    return
+            f.seek(self._offset)
+            chunk = f.read()
+        end = chunk.rfind(b"\n") + 1
+        if write and end < len(chunk):
+            os.truncate(self.path, self._offset + end)
+        if end:
+            lines = chunk[:end].splitlines()
+            for line in lines:
+                self._apply(json.loads(line), index=not full)
+            self._offset += end
+            self._records += len(lines)
+        if full:
+            self._build_indexes()
+
+    def _reset(self, header: bytes):
+        """Estado vacío antes de cargar el journal header desde el principio"""
+        self._alerts = {}
+        self._by_user = {}
+        self._indexes = {}
+        self._values = {}
+        self._notifications = {}
+        self._next_id = 1
+        self._next_event = 1
+        self._evaluated = 0.0
+        self._header = header
+        self._offset = len(header) if header.endswith(b"\n") else 0
+        self._records = 1 if self._offset else 0
+
+    def _apply(self, record: dict, index: bool = True):
+        """Aplica una línea del journal escrita por otro proceso (con index False, sin tocar los índices)"""
+        op = record.get('op')
+        if op == 'add':
+            alert = Alert(*record['alert'])
+            self._insert(alert, index)
+            self._next_id = max(self._next_id, alert.id + 1)
+        elif op == 'remove':
+            self._delete(record['id'])
+        elif op == 'eval':
+            for dollar_type, field, value in record.get('values', ()):
+                # Con el mismo estado, el mismo cruce saca del índice el mismo rango de una vez
+                series = (dollar_type, field)
+                self._cross(series, self._values.get(series), value)
+                self._values[series] = value
+            self._evaluated = max(self._evaluated, record.get('evaluated', 0.0))
+            for notification in record.get('fired', ()):
+                self._delete(notification['id'])
+                self._store_notification(notification)
+                self._next_id = max(self._next_id, notification['id'] + 1)
+                self._next_event = max(self._next_event, notification['evento'] + 1)
+        elif op == 'state':
+            self._values = {(dollar_type, field): value for dollar_type, field, value in record['values']}
+            self._notifications = {
+                user: deque(notifications, maxlen=self.max_notifications)
+                for user, notifications in record['notifications'].items()
+            }
+            self._next_id = record['next_id']
+            self._next_event = record['next_event']
+            self._evaluated = record['evaluated']
+
+    def _write(self, record: dict):
+        """Agrega una operación al journal (con el lock del archivo tomado y el estado al día)"""
+        if self.path is None:
+            return
+        if not self._header:
+            # Todavía no hay journal: se crea con el estado completo, que ya incluye esta operación
+            self._compact()
+            return
+        line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n"
+        with open(self.path, 'ab') as f:
+            f.write(line)
+        self._offset += len(line)
+        self._records += 1
+        if self._records > self.compact_min + 2 * len(self._alerts):
+            self._compact()
+
+    def _compact(self):
+        """Reescribe el journal con el estado vigente: una línea por alerta pendiente (con el lock del archivo)"""
+        header = json.dumps({'op': 'journal', 'id': uuid.uuid4().hex}).encode('utf-8') + b"\n"
+        state = {
+            'op': 'state',
+            'next_id': self._next_id,
+            'next_event': self._next_event,
+            'evaluated': self._evaluated,
+            'values': [[dollar_type, field, value] for (dollar_type, field), value in self._values.items()],
+            'notifications': {user: list(notifications) for user, notifications in self._notifications.items()}
+        }
+        lines = [header, json.dumps(state, ensure_ascii=False).encode('utf-8') + b"\n"]
+        lines.extend(json.dumps({'op': 'add', 'alert': list(alert)}, ensure_ascii=False).encode('utf-8') + b"\n"
+                     for alert in self._alerts.values())
+        payload = b"".join(lines)
+        write_atomic(self.path, payload)
+        self._header = header
+        self._offset = len(payload)
+        self._records = len(lines)
+
+    def _insert(self, alert: Alert, index: bool = True):
+        self._alerts[alert.id] = alert
+        self._by_user.setdefault(alert.user, set()).add(alert.id)
+        if index:
+            self._index(alert).add(alert.threshold, alert.id)
+
+    def _delete(self, alert_id: int) -> Optional[Alert]:
+        """Quita una alerta pendiente del estado y de su índice (si ya está armado)"""
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        self._by_user[alert.user].discard(alert_id)
+        index = self._indexes.get((alert.dollar_type, alert.field, alert.direction))
+        if index is not None:
+            index.remove(alert.threshold, alert_id)
+        return alert
+
+    def _build_indexes(self):
+        """Arma los índices de todas las alertas pendientes: en orden de umbral, agregando al final"""
+        self._indexes = {}
+        for alert in sorted(self._alerts.values(), key=lambda alert: alert.threshold):
+            self._index(alert).add(alert.threshold, alert.id)
+
+    def _index(self, alert: Alert) -> ThresholdIndex:
+        key = (alert.dollar_type, alert.field, alert.direction)
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = ThresholdIndex()
+        return index
+
+    def _notify(self, alert: Alert, value: float, previous: Optional[float], version) -> dict:
+        """Arma el aviso y lo guarda entre los recientes del usuario (con el lock tomado)"""
+        notification = dict(
+            alert_to_dict(alert),
+            evento=self._next_event,
+            valor=value,
+            anterior=previous,
+            version=version,
+            disparada=time.time()
+        )
+        self._next_event += 1
+        self._store_notification(notification)
+        return notification
+
+    def _store_notification(self, notification: dict):
+        queue = self._notifications.get(notification['usuario'])
+        if queue is None:
+            queue = self._notifications[notification['usuario']] = deque(maxlen=self.max_notifications)
+        queue.append(notification)
+
+    def _dispatch(self, notifications: List[dict]):
+        metrics.ALERTS_FIRED.inc(len(notifications))
+        for notification in notifications:
+            for listener in self._listeners:
+                try:
+                    listener(notification)
+                except Exception as e:
+                    print(f"Error notificando alerta {notification['id']}: {e}")
+
+def alert_to_dict(alert: Alert) -> dict:
+    return {
+        'id': alert.id,
+        'usuario': alert.user,
+        'tipo': alert.dollar_type,
+        'campo': alert.field,
+        'direccion': alert.direction,
+        'umbral': alert.threshold,
+        'creada': alert.created
+    }
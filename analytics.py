@@ -0,0 +1,214 @@
+import numpy as np
+from typing import Dict, Sequence
+
+# Brechas calculadas: nombre -> (tipo, tipo de referencia)
+SPREADS = {
+    'blue_oficial': ('blue', 'oficial'),
+    'ccl_mep': ('liqui', 'bolsa'),
+}
+
+SPREAD_NAMES = {
+    'blue_oficial': 'Brecha Blue/Oficial',
+    'ccl_mep': 'Brecha CCL/MEP',
+}
+
+def as_array(values) -> np.ndarray:
+    """Vista float64 sin copia de un array('d') del historial"""
+    if not len(values):
+        return np.empty(0, dtype=np.float64)
+    return np.frombuffer(values, dtype=np.float64)
+
+def _window_starts(ts: np.ndarray, windows: np.ndarray, now: float) -> np.ndarray:
+    return np.searchsorted(ts, now - windows * 86400.0, side='left')
+
+def _suffix(values: np.ndarray, ufunc) -> np.ndarray:
+    """Acumulado desde cada posición hasta el final (mínimo/máximo de cada ventana)"""
+    return ufunc.accumulate(values[::-1])[::-1]
+
+def _rows(windows: np.ndarray, valid: np.ndarray, count: np.ndarray, **columns) -> Dict[str, Dict]:
+    """Arma una fila por ventana (None si la ventana no tiene registros)"""
+    rows = {}
+    for k, w in enumerate(windows):
+        if valid[k]:
+            row = {name: round(float(values[k]), 2) for name, values in columns.items()}
+            row['registros'] = int(count[k])
+        else:
+            row = None
+        rows[str(int(w))] = row
+    return rows
+
+def price_stats(ts: np.ndarray, prices: np.ndarray, windows: np.ndarray, now: float) -> Dict[str, Dict]:
+    """Cambio, mínimo, máximo, media móvil y volatilidad de cada ventana en una sola pasada"""
+    n = prices.size
+    if n == 0:
+        return {str(int(w)): None for w in windows}
+    starts = np.minimum(_window_starts(ts, windows, now), n)
+    valid = starts < n
+    s = np.where(valid, starts, n - 1)
+    count = n - s
+
+    csum = np.concatenate(([0.0], np.cumsum(prices)))
+    first = prices[s]
+    last = prices[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(first != 0, (last / first - 1.0) * 100.0, 0.0)
+
+        # Volatilidad: desvío estándar de los retornos logarítmicos dentro de la ventana
+        returns = np.diff(np.log(np.where(prices > 0, prices, np.nan)))
+        returns = np.nan_to_num(returns)
+        rsum = np.concatenate(([0.0], np.cumsum(returns)))
+        rsq = np.concatenate(([0.0], np.cumsum(returns * returns)))
+        m = count - 1
+        mean_r = np.where(m > 0, (rsum[-1] - rsum[s]) / np.maximum(m, 1), 0.0)
+        var = np.where(m > 1, (rsq[-1] - rsq[s] - m * mean_r * mean_r) / np.maximum(m - 1, 1), 0.0)
+    volatility = np.sqrt(np.maximum(var, 0.0)) * 100.0
+
+    return _rows(
+        windows, valid, count,
+        inicial=first,
+        actual=np.full(windows.size, last),
+        cambio_pct=change,
+        minimo=_suffix(prices, np.minimum)[s],
+        maximo=_suffix(prices, np.maximum)[s],
+        media=(csum[-1] - csum[s]) / count,
+        volatilidad_pct=volatility,
+    )
+
+def spread_series(ts_a: np.ndarray, a: np.ndarray, ts_b: np.ndarray, b: np.ndarray):
+    """Brecha porcentual a/b alineando ambas series con el último valor conocido"""
+    if a.size == 0 or b.size == 0:
+        return np.empty(0), np.empty(0)
+    ts = np.union1d(ts_a, ts_b)
+    ia = np.searchsorted(ts_a, ts, side='right') - 1
+    ib = np.searchsorted(ts_b, ts, side='right') - 1
+    valid = (ia >= 0) & (ib >= 0)
+    va = a[ia[valid]]
+    vb = b[ib[valid]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = np.where(vb != 0, (va / vb - 1.0) * 100.0, 0.0)
+    return ts[valid], spread
+
+def spread_stats(ts: np.ndarray, spread: np.ndarray, windows: np.ndarray, now: float) -> Dict[str, Dict]:
+    """Media, mínimo y máximo de la brecha en cada ventana"""
+    n = spread.size
+    if n == 0:
+        return {str(int(w)): None for w in windows}
+    starts = np.minimum(_window_starts(ts, windows, now), n)
+    valid = starts < n
+    s = np.where(valid, starts, n - 1)
+    count = n - s
+    csum = np.concatenate(([0.0], np.cumsum(spread)))
+    return _rows(
+        windows, valid, count,
+        media=(csum[-1] - csum[s]) / count,
+        minimo=_suffix(spread, np.minimum)[s],
+        maximo=_suffix(spread, np.maximum)[s],
+    )
+
+def compute_analytics(series: Dict[str, tuple], current: Dict[str, Dict], types: Sequence[str],
+                      windows: Sequence[int], now: float) -> Dict:
+    """Analiza varios tipos y ventanas a la vez.
+
+    series: tipo -> (ts, venta) como arrays del historial
+    current: tipo -> cotización actual del snapshot
+    """
+    windows_arr = np.asarray(sorted(set(int(w) for w in windows)), dtype=np.float64)
+    arrays = {t: (as_array(ts), as_array(prices)) for t, (ts, prices) in series.items()}
+
+    result = {'ventanas': [int(w) for w in windows_arr], 'tipos': {}, 'brechas': {}}
+    for dollar_type in types:
+        ts, prices = arrays.get(dollar_type, (np.empty(0), np.empty(0)))
+        quote = current.get(dollar_type)
+        result['tipos'][dollar_type] = {
+            'compra': quote['compra'] if quote else None,
+            'venta': quote['venta'] if quote else None,
+            'ventanas': price_stats(ts, prices, windows_arr, now)
+        }
+
+    for name, (a, b) in SPREADS.items():
+        if a not in arrays or b not in arrays:
+            continue
+        ts, spread = spread_series(*arrays[a], *arrays[b])
+        qa, qb = current.get(a), current.get(b)
+        actual = round((qa['venta'] / qb['venta'] - 1.0) * 100.0, 2) if qa and qb and qb['venta'] else None
+        result['brechas'][name] = {
+            'actual_pct': actual,
+            'ventanas': spread_stats(ts, spread, windows_arr, now)
+        }
+    return result
+
+# Dirección de conversión -> True si el resultado está en pesos
+DIRECTIONS = {'usd_ars': True, 'ars_usd': False}
+
+def convert_amounts(amounts, directions, buy: Sequence[float], sell: Sequence[float]) -> np.ndarray:
+    """Convierte todos los montos contra todos los tipos en una sola pasada.
+
+    directions: una dirección para todos los montos o una por monto (usd_ars | ars_usd).
+    Vender dólares (usd_ars) usa la compra de cada tipo y comprarlos (ars_usd) la venta.
+    Devuelve una matriz montos x tipos; NaN donde el tipo no tiene cotización.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64).ravel()
+    directions = np.asarray(directions).ravel()
+    if directions.size not in (1, amounts.size):
+        raise ValueError("directions debe tener una dirección o una por monto")
+    unknown = ~np.isin(directions, list(DIRECTIONS))
+    if unknown.any():
+        raise ValueError(f"dirección inválida: {directions[unknown][0]} (usd_ars | ars_usd)")
+    if not np.isfinite(amounts).all():
+        raise ValueError("los montos deben ser números finitos")
+
+    to_ars = np.broadcast_to(directions == 'usd_ars', amounts.shape)
+    buy = np.asarray(buy, dtype=np.float64)
+    sell = np.asarray(sell, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Sin cotización (precio 0) el resultado queda en NaN
+        ars = amounts[:, None] * np.where(buy > 0, buy, np.nan)[None, :]
+        usd = amounts[:, None] / np.where(sell > 0, sell, np.nan)[None, :]
+    return np.round(np.where(to_ars[:, None], ars, usd), 2)
+
+def matrix_to_lists(matrix: np.ndarray) -> list:
+    """Matriz a listas para JSON (NaN -> None)"""
+    missing = np.isnan(matrix)
+    if not missing.any():
+        return matrix.tolist()
+    values = matrix.astype(object)
+    values[missing] = None
+    return values.tolist()
+
+def render_conversion(conversion: Dict, type_names: Dict[str, str], max_rows: int = 20) -> str:
+    """Tabla de conversiones en texto (las primeras max_rows filas)"""
+    types = conversion['tipos']
+    lines = [f"💱 Conversión ({len(conversion['montos'])} montos x {len(types)} tipos)"]
+    for dollar_type in types:
+        rate = conversion['tasas'][dollar_type]
+        lines.append(f"• {type_names.get(dollar_type, dollar_type)}: compra ${rate['compra']:.2f} | venta ${rate['venta']:.2f}")
+    directions = conversion['direcciones']
+    for i, (amount, row) in enumerate(zip(conversion['montos'][:max_rows], conversion['resultado'][:max_rows])):
+        direction = directions[i] if len(directions) > 1 else directions[0]
+        source, target = ("USD", "ARS") if direction == 'usd_ars' else ("ARS", "USD")
+        values = [f"{type_names.get(t, t)} {'s/d' if v is None else f'{v:,.2f}'} {target}" for t, v in zip(types, row)]
+        lines.append(f"{amount:,.2f} {source} → " + " | ".join(values))
+    if len(conversion['montos']) > max_rows:
+        lines.append(f"… y {len(conversion['montos']) - max_rows} montos más")
+    return "\n".join(lines)
+
+def render_analytics(analytics: Dict, type_names: Dict[str, str]) -> str:
+    """Resumen compacto en texto, pensado para el contexto del LLM"""
+    lines = [f"📊 Análisis del dólar (ventanas: {', '.join(str(w) for w in analytics['ventanas'])} días)"]
+    for dollar_type, data in analytics['tipos'].items():
+        parts = [f"• {type_names.get(dollar_type, dollar_type)}: venta ${data['venta']:.2f}" if data['venta'] is not None
+                 else f"• {type_names.get(dollar_type, dollar_type)}: sin cotización"]
+        for window, stats in data['ventanas'].items():
+            if stats is None:
+                parts.append(f"{window}d: sin datos")
+            else:
+                parts.append(f"{window}d: {stats['cambio_pct']:+.2f}% min ${stats['minimo']:.2f} max ${stats['maximo']:.2f} "
+                             f"media ${stats['media']:.2f} vol {stats['volatilidad_pct']:.2f}%")
+        lines.append(" | ".join(parts))
+    for name, data in analytics['brechas'].items():
+        parts = [f"• {SPREAD_NAMES.get(name, name)}: " + (f"{data['actual_pct']:.2f}%" if data['actual_pct'] is not None else "s/d")]
+        for window, stats in data['ventanas'].items():
+            if stats is not None:
+                parts.append(f"{window}d: media {stats['media']:.2f}% min {stats['minimo']:.2f}% max {stats['maximo']:.2f}%")
+        lines.append(" | ".join(parts))
+    return "\n".join(lines)
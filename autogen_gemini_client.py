@@ -1,167 +1,201 @@
-import autogen
-import requests
-import os
+import threading
 from dotenv import load_dotenv
-from mcp_server import mcp_server
-from gemini_autogen_adapter import gemini_adapter
+from mcp_server import MUTATING_TOOLS, mcp_server
+from gemini_autogen_adapter import get_gemini_adapter
+from prompt_builder import PromptBuilder
+from intent_parser import parse_intent, answer_locally
+from tool_memo import ToolMemo
+import metrics
 
 load_dotenv()
 
 class AutoGenGeminiClient:
     def __init__(self):
-        # Configurar AutoGen con Gemini
-        self.setup_autogen_with_gemini()
-    
-    def setup_autogen_with_gemini(self):
-        """Configura AutoGen para usar Gemini como backend"""
+        # Los agentes AutoGen se crean en el primer uso: importar autogen es costoso
+        self._agents = None
+        self._agents_lock = threading.Lock()
         
-        # Configuración MÍNIMA para Gemini
-        self.llm_config = {
-            "config_list": [
-                {
-                    "model": "gemini-2.5-flash",
-                    "api_key": "dummy-key",  
-                }
-            ],
-            "functions": mcp_server.get_tools(),
-            "temperature": 0.1,
-        }
+        # Resultados de herramientas ya consultados en la conversación actual
+        self.memo = None
+        self.new_conversation()
         
-        # Agente Usuario
-        self.user_proxy = autogen.UserProxyAgent(
-            name="Usuario",
-            human_input_mode="NEVER",
-            max_consecutive_auto_reply=1,
-            code_execution_config=False,
-            system_message="Eres un usuario consultando sobre el dólar argentino.",
-            default_auto_reply="CONTINUAR"
-        )
+        # Registrar funciones MCP usando el adaptador personalizado
+        self.register_mcp_functions_with_adapter()
         
-        # Agente Asistente Especializado
-        self.assistant = autogen.AssistantAgent(
-            name="AnalistaDolar",
-            system_message="""
-            Eres un analista financiero especializado en el dólar USD/ARS.
+        # Parte variable del prompt; las instrucciones fijas van como system_instruction
+        self.prompts = PromptBuilder()
+    
+    @property
+    def adapter(self):
+        """Adaptador Gemini con las herramientas MCP declaradas para function calling"""
+        adapter = get_gemini_adapter()
+        if not adapter.tools:
+            adapter.set_tools(mcp_server.get_tools(), MUTATING_TOOLS)
+        return adapter
+    
+    @property
+    def user_proxy(self):
+        return self.setup_autogen_with_gemini()[0]
+    
+    @property
+    def assistant(self):
+        return self.setup_autogen_with_gemini()[1]
+    
+    def setup_autogen_with_gemini(self):
+        """Configura AutoGen para usar Gemini como backend; devuelve (user_proxy, assistant)"""
+        if self._agents is not None:
+            return self._agents
+        
+        with self._agents_lock:
+            if self._agents is not None:
+                return self._agents
+            import autogen
             
-            HERRAMIENTAS DISPONIBLES:
-            - get_dollar_price(tipo): Precio actual
-            - get_dollar_history(tipo, dias): Historial  
-            - get_dollar_types(): Tipos disponibles
+            # Configuración MÍNIMA para Gemini
+            self.llm_config = {
+                "config_list": [
+                    {
+                        "model": "gemini-2.5-flash",
+                        "api_key": "dummy-key",  
+                    }
+                ],
+                "functions": mcp_server.get_tools(),
+                "temperature": 0.1,
+            }
             
-            Responde en español de forma clara y profesional.
-            Usa las herramientas para obtener datos actualizados.
-            """,
-            llm_config=self.llm_config
-        )
-        
-        # Registrar funciones MCP usando el adaptador personalizado
-        self.register_mcp_functions_with_adapter()
-        print("✅ AutoGen configurado con Gemini 2.5 Flash")
+            # Agente Usuario
+            user_proxy = autogen.UserProxyAgent(
+                name="Usuario",
+                human_input_mode="NEVER",
+                max_consecutive_auto_reply=1,
+                code_execution_config=False,
+                system_message="Eres un usuario consultando sobre el dólar argentino.",
+                default_auto_reply="CONTINUAR"
+            )
+            
+            # Agente Asistente Especializado
+            assistant = autogen.AssistantAgent(
+                name="AnalistaDolar",
+                system_message="""
+                Eres un analista financiero especializado en el dólar USD/ARS.
+            
+                HERRAMIENTAS DISPONIBLES:
+                - get_dollar_price(tipo): Precio actual
+                - get_dollar_history(tipo, dias): Historial  
+                - get_dollar_analytics(tipos, ventanas): Cambio, volatilidad, medias y brechas de varios tipos
+                - get_dollar_types(): Tipos disponibles
+                - get_dollars(tipos): Varias cotizaciones en una sola llamada
+            
+                Responde en español de forma clara y profesional.
+                Usa las herramientas para obtener datos actualizados.
+                """,
+                llm_config=self.llm_config
+            )
+            
+            user_proxy.register_function(function_map=self.function_map)
+            self._agents = (user_proxy, assistant)
+            print("✅ AutoGen configurado con Gemini 2.5 Flash")
+        return self._agents
+    
+    def new_memo(self) -> ToolMemo:
+        """Memoria de resultados de herramientas para una conversación nueva"""
+        return ToolMemo(mcp_server.get_tools(), mcp_server.data_version, MUTATING_TOOLS)
+    
+    def new_conversation(self):
+        """Empieza una conversación: los resultados de herramientas de la anterior no se reutilizan"""
+        self.memo = self.new_memo()
     
     def register_mcp_functions_with_adapter(self):
         """Registra las funciones MCP usando el adaptador personalizado"""
         
-        def call_mcp_tool(function_name, **kwargs):
-            """Wrapper para llamar herramientas MCP (Síncrono)"""
-            import asyncio
+        def run_mcp_tools(calls):
+            """Ejecuta varias herramientas MCP en paralelo (Síncrono)"""
             try:
-                # Ejecutar de manera síncrona
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                result = loop.run_until_complete(mcp_server.execute_tool(function_name, kwargs))
-                loop.close()
-                return result
+                return mcp_server.run(mcp_server.execute_tools(calls))
             except Exception as e:
-                return f"❌ Error ejecutando {function_name}: {str(e)}"
+                return [f"❌ Error ejecutando {name}: {str(e)}" for name, _ in calls]
+        
+        def call_mcp_tools(calls):
+            """Como run_mcp_tools, pero reutiliza lo ya consultado en la conversación"""
+            return self.memo.call_many(calls, run_mcp_tools)
+        
+        def call_mcp_tool(function_name, **kwargs):
+            """Wrapper para llamar herramientas MCP (Síncrono)"""
+            return call_mcp_tools([(function_name, kwargs)])[0]
+        
+        def bind(function_name):
+            # AutoGen llama a cada función sólo con sus argumentos: el nombre queda fijado acá
+            def call(**kwargs):
+                return call_mcp_tool(function_name, **kwargs)
+            call.__name__ = function_name
+            return call
         
         # Registrar herramientas
+        self.run_mcp_tools = run_mcp_tools
         self.call_mcp_tool = call_mcp_tool 
+        self.call_mcp_tools = call_mcp_tools
         
-        function_map = {}
+        # Se registran en el user_proxy cuando se crean los agentes
+        self.function_map = {}
         for tool in mcp_server.get_tools():
-            function_map[tool["name"]] = call_mcp_tool
-        
-        self.user_proxy.register_function(function_map=function_map)
+            self.function_map[tool["name"]] = bind(tool["name"])
+    
+    def _route(self, question: str):
+        """Respuesta local, o None si hace falta Gemini"""
+        print(f"🔍 Consulta: {question}")
+        intent = parse_intent(question)
+        answer = answer_locally(intent, mcp_server.transport)
+        metrics.QUERY_ROUTES.inc(route="llm" if answer is None else "local")
+        if answer is not None:
+            print("⚡ Respuesta directa con los datos (sin LLM)")
+        return answer
+    
+    def plan_query(self, question: str):
+        """Resuelve todo lo que no necesita a Gemini.
+
+        Devuelve (respuesta local o None, prompt, versión de los datos). El prompt no
+        lleva datos: Gemini pide los que necesita con las herramientas (ver complete).
+        """
+        answer = self._route(question)
+        if answer is not None:
+            return answer, None, None
+        with metrics.timed('prompt_build'):
+            prompt = self.prompts.build_query(question)
+        # Versión vigente en el servidor, no la de la última herramienta: una respuesta
+        # cacheada vale mientras las cotizaciones no cambien (None: sin cache)
+        return None, prompt, mcp_server.current_version()
+    
+    def complete(self, prompt: str, question: str, data_version=None, memo: ToolMemo = None, before_turn=None) -> str:
+        """Respuesta de Gemini con function calling; las herramientas de cada turno corren en paralelo.
+
+        memo es la memoria de herramientas de la conversación (por defecto, la de self.memo)
+        y before_turn() se llama antes de cada llamada al modelo.
+        """
+        execute = self.call_mcp_tools if memo is None else lambda calls: memo.call_many(calls, self.run_mcp_tools)
+        return self.adapter.generate_with_tools(prompt, execute, cache_key=question, data_version=data_version,
+                                                result_version=mcp_server.data_version, before_turn=before_turn)
     
     def query_dollar(self, question: str) -> str:
-        """Consulta usando el adaptador Gemini directamente"""
+        """Responde precios y tipos con los datos; el resto, con el adaptador Gemini"""
         try:
-            print(f"🔍 Consulta: {question}")
-            
-            # --- 1. PREPARACIÓN DEL PROMPT ---
-            prompt = f"""
-            Sos un analista financiero especializado en el dólar argentino.
-            
-            Consulta del usuario: {question}
-            
-            Para responder, puedes usar estas herramientas:
-            - get_dollar_price(tipo): Obtener precio actual
-            - get_dollar_history(tipo, dias): Obtener historial
-            - get_dollar_types(): Ver tipos disponibles
-            
-            Responde en español de forma clara y profesional.
-            """
-            
-            # --- 2. DETECCIÓN DE HERRAMIENTAS Y EJECUCIÓN MANUAL ---
-            
-            # Detectar si se pide historial (Ejecución de get_dollar_history)
-            if any(keyword in question.lower() for keyword in ['evolución', 'historial', 'últimos', 'días']):
-                print("🛠️ Detectada solicitud de historial. Ejecutando herramienta...")
-                
-                # Simple heurística: Extraer tipo (o usar 'blue') y días (o usar 7)
-                dollar_type = 'blue' 
-                days = 7 
-                
-                # Ejecutar la herramienta usando el wrapper MCP
-                history_data = self.call_mcp_tool('get_dollar_history', dollar_type=dollar_type, days=days)
-                
-                # Añadir los datos del historial al prompt para que Gemini los use
-                prompt_with_data = f"""
-                {prompt}
-                
-                DATOS OBTENIDOS DEL HISTORIAL:
-                {history_data}
-                
-                Proporciona una respuesta útil con esta información.
-                """
-                
-                final_response = gemini_adapter.model.generate_content(prompt_with_data)
-                return final_response.text
-
-            # Detectar si se pide precio o tipos (Ejecución de get_dollar_types/get_dollar_price)
-            elif any(keyword in question.lower() for keyword in ['precio', 'tipos', 'cuánto está', 'dólar']):
-                print("🛠️ Detectada solicitud de precios/tipos. Ejecutando herramientas de contexto...")
-                
-                # Obtener datos básicos del servidor
-                try:
-                    types_data = self.call_mcp_tool('get_dollar_types') # Usar el wrapper
-                    blue_data = self.call_mcp_tool('get_dollar_price', dollar_type='blue') # Usar el wrapper
-                    
-                    prompt_with_data = f"""
-                    {prompt}
-                    
-                    DATOS ACTUALES:
-                    {types_data}
-                    
-                    EJEMPLO DÓLAR BLUE:
-                    {blue_data}
-                    
-                    Proporciona una respuesta útil con esta información.
-                    """
-                    
-                    final_response = gemini_adapter.model.generate_content(prompt_with_data)
-                    return final_response.text
-                    
-                except Exception as e:
-                    # Fallback si las herramientas fallan
-                    return f"{gemini_adapter.model.generate_content(prompt).text}\n\n❌ Error obteniendo datos: {str(e)}"
-            
-            # --- 3. CONSULTA SIN HERRAMIENTAS (Pregunta conceptual/general) ---
-            print("🧠 Consulta conceptual. Llamando a Gemini sin herramientas.")
-            return gemini_adapter.model.generate_content(prompt).text
-                
+            answer, prompt, data_version = self.plan_query(question)
+            if answer is not None:
+                return answer
+            return self.complete(prompt, question, data_version)
         except Exception as e:
             return f"❌ Error en la consulta: {str(e)}"
+    
+    def query_dollar_stream(self, question: str):
+        """Igual que query_dollar, pero devuelve la respuesta en fragmentos a medida que se genera"""
+        try:
+            answer, prompt, data_version = self.plan_query(question)
+            if answer is not None:
+                yield answer
+                return
+            yield from self.adapter.stream_with_tools(prompt, self.call_mcp_tools, cache_key=question,
+                                                      data_version=data_version, result_version=mcp_server.data_version)
+        except Exception as e:
+            yield f"❌ Error en la consulta: {str(e)}"
 
 def interactive_mode():
     """Modo interactivo del sistema completo"""
@@ -185,14 +219,17 @@ def interactive_mode():
             user_query = input("\n🔍 Tu consulta: ").strip()
             
             if user_query.lower() in ['salir', 'exit', 'quit']:
+                print(get_gemini_adapter().cache.describe())
+                print(client.memo.describe())
                 print("👋 ¡Hasta luego!")
                 break
                 
             if user_query:
                 print("🔄 Procesando con Gemini 2.5 Flash...")
-                response = client.query_dollar(user_query)
-                print(f"\n📊 RESPUESTA:\n{response}")
-                print("-" * 70)
+                print("\n📊 RESPUESTA:")
+                for chunk in client.query_dollar_stream(user_query):
+                    print(chunk, end="", flush=True)
+                print("\n" + "-" * 70)
                 
         except KeyboardInterrupt:
             print("\n👋 ¡Hasta luego!")
@@ -0,0 +1 @@
+"""Benchmarks offline: dolarapi y Gemini se reemplazan por dobles locales (ver run.py)"""
@@ -0,0 +1,152 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Cotizaciones base con el mismo formato que https://dolarapi.com/v1/dolares
+QUOTES = [
+    ("oficial", "Oficial", 1045.0, 1085.0),
+    ("blue", "Blue", 1180.0, 1200.0),
+    ("bolsa", "Bolsa", 1170.5, 1175.2),
+    ("contadoconliqui", "Contado con liqui", 1185.3, 1190.8),
+    ("turista", "Turista", 1668.0, 1736.0),
+    ("mayorista", "Mayorista", 1042.0, 1048.0),
+    ("cripto", "Cripto", 1195.0, 1205.0),
+]
+
+class FakeDolarAPI:
+    """Servidor local que imita el endpoint /v1/dolares de dolarapi.com.
+
+    También sirve /v2/latest con el formato de Bluelytics (oficial y blue).
+
+    latency/jitter en segundos; failure_rate es la proporción de respuestas 503.
+    Cada respuesta varía levemente los precios para que el historial registre cambios.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, failure_rate: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/dolares"
+
+    @property
+    def bluelytics_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v2/latest"
+
+    def start(self) -> "FakeDolarAPI":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _next(self):
+        """Decide (demora, falla, variación de precio) para la próxima respuesta"""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+            drift = self._random.uniform(-0.01, 0.01)
+        return delay, fail, drift
+
+    def payload(self, drift: float = 0.0) -> bytes:
+        fecha = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        return json.dumps([
+            {
+                "moneda": "USD",
+                "casa": casa,
+                "nombre": nombre,
+                "compra": round(compra * (1 + drift), 2),
+                "venta": round(venta * (1 + drift), 2),
+                "fechaActualizacion": fecha,
+            }
+            for casa, nombre, compra, venta in QUOTES
+        ]).encode("utf-8")
+
+    def bluelytics_payload(self, drift: float = 0.0) -> bytes:
+        fecha = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000000-03:00")
+        quotes = {casa: (compra, venta) for casa, _, compra, venta in QUOTES}
+        body = {"last_update": fecha}
+        for casa in ("oficial", "blue"):
+            compra, venta = quotes[casa]
+            body[casa] = {
+                "value_avg": round((compra + venta) / 2 * (1 + drift), 2),
+                "value_buy": round(compra * (1 + drift), 2),
+                "value_sell": round(venta * (1 + drift), 2),
+            }
+        return json.dumps(body).encode("utf-8")
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path not in ("/v1/dolares", "/v2/latest"):
+                    self._send(404, b'{"error": "not found"}')
+                    return
+                delay, fail, drift = fake._next()
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    self._send(503, b'{"error": "servicio no disponible"}')
+                elif path == "/v2/latest":
+                    self._send(200, fake.bluelytics_payload(drift))
+                else:
+                    self._send(200, fake.payload(drift))
+
+            def _send(self, status: int, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="dolarapi.com local para pruebas y benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeDolarAPI(args.latency, args.jitter, args.failure_rate, port=args.port).start()
+    print(f"🧪 dolarapi falso en {fake.url} (DOLARAPI_URL={fake.url}, BLUELYTICS_URL={fake.bluelytics_url})")
+    try:
+        fake._thread.join()
+    except KeyboardInterrupt:
+        fake.stop()
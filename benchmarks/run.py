@@ -0,0 +1,382 @@
+"""Benchmarks offline del sistema de cotizaciones.
+
+Levanta un dolarapi falso (fake_dolarapi.py) y reemplaza el modelo de Gemini por
+un stub (stub_gemini.py), así que no necesita internet ni una GEMINI_API_KEY real.
+
+    python -m benchmarks.run --concurrency 1,8,32 --output resultados.json
+    python -m benchmarks.run --baseline resultados.json   # falla si hay regresiones
+
+Escenarios:
+    routes        rutas Flask servidas por HTTP (werkzeug, multihilo)
+    tools         DollarMCPServer.execute_tool en el event loop compartido
+    query         AutoGenGeminiClient.query_dollar de punta a punta
+    query_stream  query_dollar_stream, con la latencia hasta el primer fragmento
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.fake_dolarapi import FakeDolarAPI
+from benchmarks import stub_gemini
+
+SCENARIOS = ("routes", "tools", "query", "query_stream")
+
+ROUTES = (
+    "/dollar/blue",
+    "/dollars",
+    "/types",
+    "/history/blue/30",
+    "/analytics?types=blue,oficial&windows=7,30",
+)
+
+TOOLS = (
+    ("get_dollar_price", {"dollar_type": "blue"}),
+    ("get_dollars", {}),
+    ("get_dollar_history", {"dollar_type": "blue", "days": 30}),
+    ("get_dollar_analytics", {"dollar_types": ["blue", "oficial"], "windows": [7, 30]}),
+)
+
+QUESTIONS = (
+    "precio del dólar blue",
+    "evolución del blue últimos 7 días",
+    "qué dólar me conviene para ahorrar",
+)
+
+def summarize(name: str, concurrency: int, latencies: List[float], errors: int, elapsed: float, **extra) -> Dict:
+    """Percentiles en milisegundos y throughput (operaciones completadas por segundo)"""
+    result = {
+        "name": name,
+        "concurrency": concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "duration_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": percentiles(latencies),
+    }
+    for key, values in extra.items():
+        result[key] = percentiles(values)
+    return result
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    ms = np.asarray(values) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "mean": round(float(ms.mean()), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+def run_threads(operation: Callable[[int], bool], total: int, concurrency: int):
+    """Ejecuta operation(i) total veces repartidas en concurrency hilos.
+
+    operation devuelve True si la operación fue exitosa. Devuelve (latencias, errores, duración).
+    """
+    latencies: List[float] = []
+    errors = [0]
+    counter = iter(range(total))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                ok = operation(i)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - start
+
+async def run_tasks(operation, total: int, concurrency: int):
+    """Como run_threads, pero con concurrency tareas asyncio que esperan operation(i)"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                ok = await operation(i)
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+class Bench:
+    """Entorno del benchmark: dobles locales + módulos del sistema configurados para usarlos"""
+
+    def __init__(self, args):
+        self.args = args
+        self.upstream = FakeDolarAPI(args.upstream_latency, args.upstream_jitter, args.upstream_failure_rate).start()
+        self.history_dir = tempfile.TemporaryDirectory(prefix="dollar-bench-")
+
+        # Antes de importar el sistema: las variables de entorno se leen al importar
+        os.environ["DOLARAPI_URL"] = self.upstream.url
+        os.environ["BLUELYTICS_URL"] = self.upstream.bluelytics_url
+        os.environ["DOLLAR_HISTORY_DIR"] = self.history_dir.name
+        os.environ.pop("DOLLAR_SHARED_SNAPSHOT", None)
+        # Sin arranque en caliente: cada corrida empieza en frío y no escribe en data/
+        os.environ["DOLLAR_SNAPSHOT_FILE"] = ""
+        os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+        os.environ["MCP_TRANSPORT"] = "inprocess"
+        self.llm = stub_gemini.install(
+            latency=args.llm_latency,
+            first_token_latency=args.llm_first_token,
+            completion_tokens=args.llm_tokens,
+            tool_calls=args.llm_tool_calls
+        )
+
+        import dollar_server
+        self.dollar_server = dollar_server
+        dollar_server.dollar_service.cache_timeout = args.snapshot_ttl
+
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self.http = make_server("127.0.0.1", 0, dollar_server.app, threaded=True)
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.http.server_port}"
+
+    def close(self):
+        self.http.shutdown()
+        self.upstream.stop()
+        self.dollar_server.dollar_service.stop_refresher()
+        self.history_dir.cleanup()
+
+    def warmup(self, operation: Callable[[int], bool]):
+        for i in range(self.args.warmup):
+            operation(i)
+
+    def scenario_routes(self, concurrency: int) -> List[Dict]:
+        import requests
+
+        local = threading.local()
+        results = []
+        for route in ROUTES:
+            def operation(i, route=route):
+                session = getattr(local, "session", None)
+                if session is None:
+                    session = local.session = requests.Session()
+                return session.get(self.base_url + route, timeout=30).status_code == 200
+
+            self.warmup(operation)
+            latencies, errors, elapsed = run_threads(operation, self.args.requests, concurrency)
+            results.append(summarize(f"route {route}", concurrency, latencies, errors, elapsed))
+        return results
+
+    def scenario_tools(self, concurrency: int) -> List[Dict]:
+        from mcp_server import mcp_server, HTTPTransport, InProcessTransport
+
+        if self.args.transport == "http":
+            mcp_server.set_transport(HTTPTransport(self.base_url, pool_size=max(16, concurrency)))
+        else:
+            mcp_server.set_transport(InProcessTransport(self.dollar_server.dollar_service))
+
+        results = []
+        for tool, arguments in TOOLS:
+            async def operation(i, tool=tool, arguments=arguments):
+                return not (await mcp_server.execute_tool(tool, arguments)).startswith("❌")
+
+            mcp_server.run(run_tasks(operation, self.args.warmup, 1))
+            latencies, errors, elapsed = mcp_server.run(run_tasks(operation, self.args.requests, concurrency))
+            results.append(summarize(f"tool {tool} ({self.args.transport})", concurrency, latencies, errors, elapsed))
+        return results
+
+    def _client(self):
+        from mcp_server import mcp_server, InProcessTransport
+        from autogen_gemini_client import AutoGenGeminiClient
+        from gemini_autogen_adapter import get_gemini_adapter
+
+        gemini_adapter = get_gemini_adapter()
+        mcp_server.set_transport(InProcessTransport(self.dollar_server.dollar_service))
+        if not self.args.llm_cache:
+            # Sin cache cada consulta llega al modelo (mide el camino completo)
+            gemini_adapter.cache.maxsize = 0
+        gemini_adapter.cache.clear()
+        return AutoGenGeminiClient()
+
+    def scenario_query(self, concurrency: int) -> List[Dict]:
+        client = self._client()
+
+        def operation(i):
+            return not client.query_dollar(QUESTIONS[i % len(QUESTIONS)]).startswith("❌")
+
+        self.warmup(operation)
+        latencies, errors, elapsed = run_threads(operation, self.args.llm_requests, concurrency)
+        return [summarize("query_dollar", concurrency, latencies, errors, elapsed)]
+
+    def scenario_query_stream(self, concurrency: int) -> List[Dict]:
+        client = self._client()
+        first_chunk: List[float] = []
+        lock = threading.Lock()
+
+        def operation(i):
+            start = time.perf_counter()
+            chunks = client.query_dollar_stream(QUESTIONS[i % len(QUESTIONS)])
+            first = next(chunks, "")
+            with lock:
+                first_chunk.append(time.perf_counter() - start)
+            text = first + "".join(chunks)
+            return bool(text) and not text.startswith("❌")
+
+        self.warmup(operation)
+        first_chunk.clear()
+        latencies, errors, elapsed = run_threads(operation, self.args.llm_requests, concurrency)
+        return [summarize("query_dollar_stream", concurrency, latencies, errors, elapsed, first_chunk_ms=first_chunk)]
+
+    def run(self) -> Dict:
+        results = []
+        for scenario in self.args.scenarios:
+            for concurrency in self.args.concurrency:
+                print(f"⏱️ {scenario} (concurrencia {concurrency})...", file=sys.stderr)
+                # Los clientes imprimen cada consulta: se descarta para no medir la consola
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results.extend(getattr(self, f"scenario_{scenario}")(concurrency))
+        return {
+            "meta": metadata(self.args),
+            "upstream": {"requests": self.upstream.requests, "failures": self.upstream.failures},
+            "llm": {"calls": sum(model.calls for model in self.llm["models"])},
+            "results": results,
+        }
+
+def metadata(args) -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+    }
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Lista las regresiones: p95 más alto o throughput más bajo que la línea base, más allá de la tolerancia"""
+    previous = {(r["name"], r["concurrency"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        base = previous.get((result["name"], result["concurrency"]))
+        if base is None:
+            continue
+        label = f"{result['name']} (concurrencia {result['concurrency']})"
+        p95, base_p95 = result["latency_ms"]["p95"], base["latency_ms"]["p95"]
+        if p95 is not None and base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{label}: p95 {base_p95:.1f} ms -> {p95:.1f} ms")
+        if base["throughput_rps"] and result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {base['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{label}: errores {base['errors']} -> {result['errors']}")
+    return regressions
+
+def print_table(report: Dict):
+    print(f"{'escenario':<58} {'conc':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'err':>4}", file=sys.stderr)
+    for r in report["results"]:
+        lat = r["latency_ms"]
+        cells = [f"{lat[key]:>9.2f}" if lat[key] is not None else f"{'-':>9}" for key in ("p50", "p95", "p99")]
+        print(f"{r['name']:<58} {r['concurrency']:>4} {' '.join(cells)} {r['throughput_rps']:>9.1f} {r['errors']:>4}", file=sys.stderr)
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks offline (dolarapi y Gemini simulados)")
+    parser.add_argument("--scenarios", type=lambda v: parse_list(v), default=list(SCENARIOS),
+                        help=f"escenarios separados por coma ({', '.join(SCENARIOS)})")
+    parser.add_argument("--concurrency", type=lambda v: parse_list(v, int), default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500, help="operaciones por ruta/herramienta y concurrencia")
+    parser.add_argument("--llm-requests", type=int, default=60, help="consultas por escenario de LLM y concurrencia")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--transport", choices=("inprocess", "http"), default="inprocess", help="transporte del escenario tools")
+    parser.add_argument("--snapshot-ttl", type=float, default=300, help="TTL del snapshot de cotizaciones (segundos)")
+    parser.add_argument("--upstream-latency", type=float, default=0.05)
+    parser.add_argument("--upstream-jitter", type=float, default=0.0)
+    parser.add_argument("--upstream-failure-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-first-token", type=float, default=0.15)
+    parser.add_argument("--llm-tokens", type=int, default=120, help="tokens de salida por respuesta del stub")
+    parser.add_argument("--llm-tool-calls", type=lambda v: parse_list(v), default=["get_dollars"],
+                        help="herramientas que pide el stub en el primer turno (function calling)")
+    parser.add_argument("--llm-cache", action="store_true", help="mantener la cache de respuestas del LLM")
+    parser.add_argument("--output", help="archivo JSON de salida (por defecto, stdout)")
+    parser.add_argument("--baseline", help="resultado JSON anterior con el cual comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="variación admitida frente a la línea base")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"escenarios desconocidos: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    bench = Bench(args)
+    try:
+        report = bench.run()
+    finally:
+        bench.close()
+
+    print_table(report)
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+        print(f"💾 Resultados en {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"⚠️ Regresión: {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("✅ Sin regresiones frente a la línea base", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Iterator, Sequence
+
+class StubUsage:
+    def __init__(self, prompt_tokens: int, completion_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = completion_tokens
+        self.total_token_count = prompt_tokens + completion_tokens
+
+class StubFunctionCall:
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+
+class StubPart:
+    def __init__(self, text: str = "", function_call: StubFunctionCall = None):
+        self.text = text
+        self.function_call = function_call
+
+class StubContent:
+    def __init__(self, parts):
+        self.role = "model"
+        self.parts = parts
+
+class StubCandidate:
+    def __init__(self, parts):
+        self.content = StubContent(parts)
+
+class StubResponse:
+    """Respuesta con la misma forma que la de google.generativeai (candidates, text y usage_metadata)"""
+
+    def __init__(self, text: str, usage: StubUsage, calls: Sequence[StubFunctionCall] = ()):
+        parts = [StubPart(function_call=call) for call in calls] or [StubPart(text)]
+        self.candidates = [StubCandidate(parts)]
+        self._text = text
+        self.usage_metadata = usage
+
+    @property
+    def text(self) -> str:
+        if any(part.function_call for part in self.candidates[0].content.parts):
+            # Como en google.generativeai: una respuesta con function_call no tiene texto
+            raise ValueError("la respuesta sólo contiene llamadas a funciones")
+        return self._text
+
+class StubGenerativeModel:
+    """Reemplazo local de genai.GenerativeModel con latencia y tokens configurables.
+
+    latency es el tiempo total de una respuesta y first_token_latency el tiempo hasta
+    el primer fragmento en modo streaming; el resto se reparte entre los fragmentos.
+    Los tokens del prompt se estiman como len(prompt) / 4.
+
+    Si el modelo se crea con herramientas (tools), el primer turno de cada consulta
+    pide tool_calls (nombres de herramientas, sin argumentos) en paralelo y el
+    segundo, que ya recibe los function_response, responde con texto.
+    """
+
+    def __init__(self, model_name: str = "gemini-2.5-flash", latency: float = 0.5,
+                 first_token_latency: float = 0.15, completion_tokens: int = 120, chunks: int = 8,
+                 tool_calls: Sequence[str] = (), tools=None, **kwargs):
+        self.model_name = model_name
+        self.latency = latency
+        self.first_token_latency = min(first_token_latency, latency)
+        self.completion_tokens = completion_tokens
+        self.chunks = max(1, chunks)
+        # Sólo se piden herramientas declaradas en el modelo
+        declared = {d["name"] for tool in tools or () for d in tool.get("function_declarations", ())}
+        self.tool_calls = [name for name in tool_calls if name in declared]
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, prompt) -> str:
+        # Unas 4 letras por token, como la estimación del prompt
+        words = max(1, self.completion_tokens * 4 // 6)
+        return " ".join(["dólar"] * words)
+
+    def _usage(self, prompt, text: str) -> StubUsage:
+        return StubUsage(max(1, len(str(prompt)) // 4), self.completion_tokens)
+
+    def _pending_calls(self, contents):
+        """Llamadas a pedir en este turno: ninguna si ya llegaron los resultados"""
+        if not self.tool_calls or not isinstance(contents, list):
+            return []
+        answered = any("function_response" in part for content in contents if isinstance(content, dict)
+                       for part in content.get("parts", ()) if isinstance(part, dict))
+        return [] if answered else [StubFunctionCall(name, {}) for name in self.tool_calls]
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        text = self._answer(prompt)
+        calls = self._pending_calls(prompt)
+        if calls:
+            # Un turno de function calling es corto: cuesta lo mismo que el primer fragmento
+            time.sleep(self.first_token_latency)
+            response = StubResponse("", StubUsage(max(1, len(str(prompt)) // 4), 10 * len(calls)), calls)
+            return iter([response]) if stream else response
+        if stream:
+            return self._stream(prompt, text)
+        time.sleep(self.latency)
+        return StubResponse(text, self._usage(prompt, text))
+
+    def _stream(self, prompt, text: str) -> Iterator[StubResponse]:
+        size = -(-len(text) // self.chunks)
+        parts = [text[i:i + size] for i in range(0, len(text), size)]
+        rest = (self.latency - self.first_token_latency) / max(1, len(parts) - 1)
+        for i, part in enumerate(parts):
+            time.sleep(self.first_token_latency if i == 0 else rest)
+            # Como en Gemini, el uso de tokens llega completo en el último fragmento
+            last = i == len(parts) - 1
+            yield StubResponse(part, self._usage(prompt, text) if last else StubUsage(0, 0))
+
+def install(**options) -> dict:
+    """Reemplaza GenerativeModel, configure y list_models de google.generativeai.
+
+    Debe llamarse antes de importar los módulos que crean el modelo. Devuelve
+    {'models': [...]} con cada modelo creado, para inspeccionar las llamadas.
+    """
+    import google.generativeai as genai
+
+    created = {"models": []}
+
+    def factory(model_name="gemini-2.5-flash", tools=None, **kwargs):
+        model = StubGenerativeModel(model_name, tools=tools, **options)
+        created["models"].append(model)
+        return model
+
+    genai.GenerativeModel = factory
+    genai.configure = lambda **kwargs: None
+    genai.list_models = lambda: iter(())
+    return created
@@ -1,35 +1,326 @@
-from flask import Flask, jsonify
-import requests
-import random
+from flask import Flask, Response, jsonify, request
+import hashlib
+import json
+import os
+import threading
 from datetime import datetime
 import time
+from history_store import HistoryStore
+from shared_snapshot import SharedSnapshot, write_atomic
+from upstream import HedgedFetcher
+from live_updates import Broadcaster, StreamServer
+from alerts import AlertEngine, alert_to_dict
+from quotes import DollarType, SnapshotView, data_hash, quote_date
+import metrics
 
 app = Flask(__name__)
 
+# Tipo pedido por el usuario -> clave del snapshot
+TYPE_MAP = {dollar_type.value: dollar_type.key for dollar_type in DollarType}
+
+# Clave del snapshot -> tipo pedido por el usuario
+TYPE_KEYS = {key: dollar_type for dollar_type, key in TYPE_MAP.items()}
+
+TYPE_NAMES = {dollar_type.value: dollar_type.label for dollar_type in DollarType}
+
+MAX_HISTORY_DAYS = 3650
+MAX_ANALYTICS_WINDOWS = 8
+MAX_CONVERSION_AMOUNTS = 1_000_000
+# Modo multi-proceso: ruta del snapshot compartido entre workers (vacío = deshabilitado)
+SHARED_SNAPSHOT_PATH = os.getenv("DOLLAR_SHARED_SNAPSHOT", "")
+# Alertas compartidas entre workers (por defecto junto al snapshot compartido; vacío = en memoria)
+ALERTS_FILE = os.getenv(
+    "DOLLAR_ALERTS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(SHARED_SNAPSHOT_PATH)), 'alerts.jsonl') if SHARED_SNAPSHOT_PATH else ""
+)
+HISTORY_DIR = os.getenv("DOLLAR_HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'history'))
+# Último snapshot real, para arrancar sirviendo datos recientes (vacío = deshabilitado)
+SNAPSHOT_FILE = os.getenv("DOLLAR_SNAPSHOT_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'last_snapshot.json'))
+# Antigüedad máxima del snapshot guardado para servirlo al arrancar (segundos)
+SNAPSHOT_MAX_AGE = float(os.getenv("DOLLAR_SNAPSHOT_MAX_AGE", str(7 * 24 * 3600)))
+
 class DollarServiceReal:
     def __init__(self):
-        self.cache = {}
         self.cache_timeout = 300
+        # Fracción del TTL a partir de la cual el snapshot se renueva en segundo plano
+        self.refresh_ahead = 0.8
+        # Reintento tras un fallo del upstream (segundos)
+        self.retry_delay = 15
+        # Snapshot compartido: {'version', 'data', 'timestamp', 'refresh_at', 'expires_at', 'fallback'}
+        # ('restored' si se cargó del disco al arrancar y todavía no se renovó)
+        self.snapshot = None
+        self.snapshot_file = SNAPSHOT_FILE
+        self._restore_tried = False
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._refresher = None
+        self._stop = threading.Event()
+        self.history = HistoryStore(HISTORY_DIR)
+        # Fuentes de cotizaciones (dolarapi, Bluelytics) con hedging y circuit breaker
+        self.upstream = HedgedFetcher()
+        # Con varios workers sólo el líder consulta el upstream; el resto lee el archivo
+        self.shared = SharedSnapshot(SHARED_SNAPSHOT_PATH) if SHARED_SNAPSHOT_PATH else None
+        # Cada cuánto un worker seguidor revisa el snapshot compartido (segundos)
+        self.shared_poll = 2
+        # Espera máxima del seguidor al primer snapshot del líder antes de buscarlo por su cuenta
+        self.follower_wait = 15
+        # Funciones llamadas con cada snapshot de versión nueva (p. ej. el broadcaster SSE)
+        self._listeners = []
+        # Cotizaciones tipadas y respuestas ya armadas del snapshot vigente
+        self._view = None
+        # Alertas de precio: se evalúan con cada snapshot nuevo
+        self.alerts = AlertEngine(TYPE_MAP, path=ALERTS_FILE or None)
+        self.add_listener(self.alerts.evaluate)
+    
+    def fetch_dollars_real(self):
+        """Descarga las cotizaciones de la primera fuente que responda (lanza excepción si fallan todas)"""
+        data, _ = self.upstream.fetch()
+        return data
+    
+    def add_listener(self, listener):
+        """listener(snapshot) se llama fuera del lock cada vez que cambia la versión del snapshot"""
+        self._listeners.append(listener)
+    
+    def _notify(self, previous):
+        snapshot = self.snapshot
+        if snapshot is None or (previous is not None and previous['version'] == snapshot['version']):
+            return
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"Error notificando snapshot: {e}")
     
     def get_all_dollars_real(self):
-        """Obtiene todos los tipos de dólar de APIs reales"""
+        """Obtiene todos los tipos de dólar desde el snapshot compartido"""
+        return self.get_snapshot()['data']
+    
+    def get_snapshot(self):
+        """Devuelve el snapshot vigente; si está por vencer lo renueva sin bloquear"""
+        self.start_refresher()
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self._restore()
+            if snapshot is not None:
+                # Arranque en caliente: último dato real guardado, renovado en segundo plano
+                metrics.SNAPSHOT_READS.inc(result="warm")
+                if time.time() >= snapshot['refresh_at']:
+                    self._refresh_async()
+                return snapshot
+            # Arranque en frío: todas las consultas esperan la misma descarga
+            metrics.SNAPSHOT_READS.inc(result="cold")
+            return self._refresh()
+        if time.time() >= snapshot['refresh_at']:
+            metrics.SNAPSHOT_READS.inc(result="stale")
+            self._refresh_async()
+        else:
+            metrics.SNAPSHOT_READS.inc(result="fresh")
+        return snapshot
+    
+    def view(self) -> SnapshotView:
+        """Vista del snapshot vigente: se arma una vez por snapshot y cachea lo que se deriva de él"""
+        return self._view_of(self.get_snapshot())
+    
+    def _view_of(self, snapshot) -> SnapshotView:
+        view = self._view
+        if view is None or not view.matches(snapshot):
+            view = self._view = SnapshotView(snapshot)
+        return view
+    
+    def _restore(self):
+        """Adopta el último snapshot real guardado en disco, con su fecha y versión originales.
+
+        Si todavía no le tocaba renovarse no se consulta el upstream, así que un
+        reinicio o un deploy no genera una ráfaga de descargas. Devuelve None si no
+        hay archivo o es demasiado viejo.
+        """
+        if not self.snapshot_file or self._restore_tried:
+            return self.snapshot
+        with self._lock:
+            if self.snapshot is not None or self._restore_tried:
+                return self.snapshot
+            try:
+                saved = self._load_saved()
+                if saved is None:
+                    return None
+                renew_at = saved['timestamp'] + self.cache_timeout * self.refresh_ahead
+                self.snapshot = dict(saved, refresh_at=renew_at, expires_at=renew_at, fallback=False, restored=True)
+            finally:
+                # Se marca al final: quien lo vea en True sin el lock ya ve el snapshot restaurado
+                self._restore_tried = True
+        version, timestamp = self.snapshot['version'], self.snapshot['timestamp']
+        print(f"💾 Snapshot guardado restaurado (versión {version}, de hace {int(time.time() - timestamp)} s)")
+        self._notify(None)
+        return self.snapshot
+    
+    def _load_saved(self):
+        """{'version', 'data', 'timestamp'} del archivo, o None si no existe, es inválido o demasiado viejo"""
         try:
-            response = requests.get('https://dolarapi.com/v1/dolares', timeout=10)
-            if response.status_code == 200:
-                dollars_data = response.json()
-                result = {}
-                for dollar in dollars_data:
-                    result[dollar['nombre'].lower()] = {
-                        'compra': dollar['compra'],
-                        'venta': dollar['venta'],
-                        'nombre': dollar['nombre'],
-                        'fecha': dollar['fechaActualizacion']
-                    }
-                return result
+            with open(self.snapshot_file, 'rb') as f:
+                saved = json.loads(f.read())
+            saved = {'version': int(saved['version']), 'data': dict(saved['data']), 'timestamp': float(saved['timestamp'])}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error leyendo snapshot guardado: {e}")
+            return None
+        if not saved['data'] or time.time() - saved['timestamp'] > SNAPSHOT_MAX_AGE:
+            return None
+        return saved
+    
+    def _save(self):
+        """Guarda el snapshot vigente (sólo datos reales) para el próximo arranque"""
+        snapshot = self.snapshot
+        if not self.snapshot_file or snapshot is None or snapshot['fallback']:
+            return
+        payload = {key: snapshot[key] for key in ('version', 'data', 'timestamp')}
+        try:
+            write_atomic(self.snapshot_file, json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        except OSError as e:
+            print(f"Error guardando snapshot: {e}")
+    
+    def _refresh(self, wait: bool = True):
+        """Renueva el snapshot agrupando las descargas concurrentes en una sola"""
+        with self._lock:
+            event = self._inflight
+            first = event is None
+            if first:
+                event = self._inflight = threading.Event()
+        
+        if not first:
+            if wait:
+                event.wait()
+            return self.snapshot
+        
+        try:
+            if self.shared is not None and not self.shared.try_lead():
+                self._follow()
+            else:
+                self._fetch_and_publish()
+        finally:
+            with self._lock:
+                self._inflight = None
+            event.set()
+        return self.snapshot
+    
+    def _fetch_and_publish(self):
+        """Consulta el upstream y publica el resultado (también en el archivo compartido)"""
+        previous = self.snapshot
+        if self.shared is not None and self.snapshot is None:
+            # Continuar la numeración de versiones del líder anterior (ETags estables)
+            previous = self.shared.read()
+            if previous is not None:
+                self.snapshot = dict(previous, refresh_at=0)
+        try:
+            with metrics.timed('upstream_fetch'):
+                data, fallback = self.fetch_dollars_real(), False
         except Exception as e:
+            # Los errores por fuente ya se cuentan en upstream
             print(f"Error API real: {e}")
+            data, fallback = None, True
+        if not fallback:
+            current = self.snapshot
+            if current is not None and not current['fallback']:
+                # Fuente parcial (Bluelytics sólo trae oficial y blue): conservar el último valor del resto
+                data = {**current['data'], **data}
+        self._publish(data, fallback)
+        if not fallback:
+            # Las cotizaciones se parsean una vez, en la vista que después atiende las consultas;
+            # las que se conservaron del snapshot anterior no son posteriores y el historial las ignora
+            self._record_history(self._view_of(self.snapshot))
+            self._save()
+        if self.shared is not None and self.shared.is_leader:
+            try:
+                self.shared.write(self.snapshot)
+            except OSError as e:
+                print(f"Error publicando snapshot compartido: {e}")
+        self._notify(previous)
+    
+    def _follow(self):
+        """Worker seguidor: adopta el snapshot publicado por el líder"""
+        snapshot = self.shared.read()
+        deadline = time.time() + self.follower_wait
+        while snapshot is None and self.snapshot is None and time.time() < deadline:
+            time.sleep(0.1)
+            snapshot = self.shared.read()
+        
+        if snapshot is None and self.snapshot is None:
+            # El líder todavía no publicó nada: no dejar la consulta sin datos
+            self._fetch_and_publish()
+            return
         
-        return self.get_fallback_data()
+        next_check = time.time() + self.shared_poll
+        with self._lock:
+            previous = self.snapshot
+            if snapshot is None:
+                snapshot = previous
+            self.snapshot = dict(snapshot, refresh_at=next_check)
+        self._notify(previous)
+    
+    def _publish(self, data, fallback: bool):
+        """Publica un nuevo snapshot; la versión sólo cambia si cambian los datos"""
+        now = time.time()
+        with self._lock:
+            current = self.snapshot
+            if fallback:
+                if current is not None:
+                    # Seguir sirviendo el último dato real y reintentar pronto
+                    metrics.UPSTREAM_FALLBACKS.inc(kind="stale")
+                    self.snapshot = dict(current, refresh_at=now + self.retry_delay, expires_at=now + self.retry_delay)
+                    return
+                metrics.UPSTREAM_FALLBACKS.inc(kind="reference")
+                data = self.get_fallback_data()
+            
+            version = current['version'] if current else 0
+            if current is None or current['data'] != data:
+                version += 1
+            refresh_in = self.retry_delay if fallback else self.cache_timeout * self.refresh_ahead
+            self.snapshot = {
+                'version': version,
+                'data': data,
+                'timestamp': now,
+                'refresh_at': now + refresh_in,
+                # Vencimiento publicado a los clientes (refresh_at es la agenda local del worker)
+                'expires_at': now + refresh_in,
+                'fallback': fallback
+            }
+    
+    def _record_history(self, view: SnapshotView):
+        """Registra las cotizaciones del snapshot en el historial local"""
+        try:
+            self.history.append_rows((quote.key, quote.ts, quote.compra, quote.venta)
+                                     for quote in view.quotes.values() if quote.ts is not None)
+        except OSError as e:
+            print(f"Error guardando historial: {e}")
+    
+    def _refresh_async(self):
+        """Lanza una renovación en segundo plano si no hay otra en curso"""
+        if self._inflight is None:
+            threading.Thread(target=self._refresh, kwargs={'wait': False}, daemon=True).start()
+    
+    def start_refresher(self):
+        """Inicia el hilo que renueva el snapshot antes de que venza el TTL"""
+        if self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresher.start()
+    
+    def stop_refresher(self):
+        """Detiene el hilo de renovación"""
+        self._stop.set()
+        self._refresher = None
+    
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            snapshot = self.snapshot or self._restore()
+            delay = snapshot['refresh_at'] - time.time() if snapshot else 0
+            if delay > 0 and self._stop.wait(delay):
+                break
+            self._refresh()
     
     def get_fallback_data(self):
         """Datos de fallback realistas"""
@@ -41,90 +332,528 @@ class DollarServiceReal:
             'turista': {'compra': 0, 'venta': 600, 'nombre': 'Turista', 'fecha': datetime.now().isoformat()}
         }
     
+    def data_version(self):
+        """Huella de las cotizaciones vigentes (None sin snapshot), la misma en todos los procesos"""
+        snapshot = self.snapshot
+        return self._view_of(snapshot).data_hash if snapshot else None
+    
+    def _snapshot_meta(self, snapshot) -> dict:
+        return {
+            'version': snapshot['version'],
+            'hash': data_hash(snapshot['data']),
+            'snapshot': _iso(snapshot['timestamp']),
+            'fuente': _source(snapshot['fallback'], snapshot.get('restored', False))
+        }
+    
+    def _meta(self, view: SnapshotView) -> dict:
+        return view.cached(('meta',), lambda: {
+            'version': view.version,
+            'hash': view.data_hash,
+            'snapshot': _iso(view.timestamp),
+            'fuente': _source(view.fallback, view.restored)
+        })
+    
+    def _derived(self, view: SnapshotView, key, build):
+        """Resultado calculado una sola vez por snapshot (key None: parámetros no normalizados, sin cache).
+
+        Los resultados cacheados se comparten entre consultas: no deben modificarse.
+        """
+        return build() if key is None else view.cached(key, build)
+    
+    def _text(self, view: SnapshotView, key, data, render) -> str:
+        """Texto formateado de un resultado, también una sola vez por snapshot"""
+        return render(data()) if key is None else view.cached(('text',) + key, lambda: render(data()))
+    
+    def get_dollar_price_data(self, dollar_type: str = "blue", view: SnapshotView = None) -> dict:
+        """Cotización actual de un tipo de dólar como datos estructurados"""
+        view = view or self.view()
+        key = TYPE_MAP.get(dollar_type, dollar_type)
+        if key not in view.quotes:
+            key = 'blue'
+        return view.cached(('price', key), lambda: dict(self._meta(view), **view.quotes[key].to_dict()))
+    
     def get_dollar_price(self, dollar_type: str = "blue") -> str:
         """Obtiene el precio actual del dólar"""
-        cache_key = f"price_{dollar_type}"
-        if cache_key in self.cache and time.time() - self.cache[cache_key]['timestamp'] < self.cache_timeout:
-            data = self.cache[cache_key]['data']
-        else:
-            all_dollars = self.get_all_dollars_real()
-            type_map = {
-                'blue': 'blue',
-                'oficial': 'oficial', 
-                'bolsa': 'bolsa',
-                'liqui': 'contado con liqui',
-                'turista': 'turista'
-            }
-            mapped_type = type_map.get(dollar_type, dollar_type)
-            data = all_dollars.get(mapped_type, all_dollars['blue'])
-            self.cache[cache_key] = {'data': data, 'timestamp': time.time()}
-        
-        fuente = "🚀 API en tiempo real" if data.get('fuente') != 'simulado' else "📊 Datos de referencia"
-        return f"💵 Dólar {data['nombre']}:\n• Compra: ${data['compra']:.2f} ARS\n• Venta: ${data['venta']:.2f} ARS\n• Actualizado: {data['fecha'][:16].replace('T', ' ')}\n• Fuente: {fuente}"
+        view = self.view()
+        data = self.get_dollar_price_data(dollar_type, view)
+        return self._text(view, ('price', data['tipo']), lambda: data, render_price)
     
-    def get_dollar_history(self, days: int = 7, dollar_type: str = "blue") -> str:
-        """Obtiene historial del dólar"""
-        current_data = self.get_all_dollars_real()
-        mapped_type = 'blue' if dollar_type == 'blue' else dollar_type
-        
-        if mapped_type in current_data:
-            current_price = current_data[mapped_type]['venta']
-        else:
-            current_price = 1000
-        
-        # Simular historial
-        prices = []
-        base_price = current_price * 0.95
-        
-        for i in range(days):
-            variation = random.uniform(-10, 15)
-            base_price += variation
-            prices.append(max(base_price, current_price * 0.8))
+    def get_dollar_history_data(self, days: int = 7, dollar_type: str = "blue", view: SnapshotView = None) -> dict:
+        """Estadísticas del historial registrado como datos estructurados (ValueError si el tipo no existe)"""
+        if dollar_type not in TYPE_MAP:
+            raise ValueError(f"tipo inválido: {dollar_type} (disponibles: {', '.join(TYPE_MAP)})")
+        days = max(1, min(int(days), MAX_HISTORY_DAYS))
+        # Asegura que la última cotización esté registrada
+        view = view or self.view()
+        return self._derived(view, history_key(dollar_type, days), lambda: self._history_data(view, days, dollar_type))
+    
+    def _history_data(self, view: SnapshotView, days: int, dollar_type: str) -> dict:
+        end = time.time()
+        ts, _, prices = self.history.query(TYPE_MAP[dollar_type], end - days * 86400, end)
+        result = dict(self._meta(view), tipo=dollar_type, nombre=TYPE_NAMES[dollar_type],
+                      dias=days, registros=len(prices))
+        if not prices:
+            return result
         
         first_price = prices[0]
         last_price = prices[-1]
-        change = ((last_price - first_price) / first_price) * 100
-        
-        type_names = {
-            'blue': 'Blue', 'oficial': 'Oficial', 
-            'bolsa': 'Bolsa', 'liqui': 'CCL', 
-            'turista': 'Turista'
-        }
+        result.update({
+            'desde': _iso(ts[0]),
+            'hasta': _iso(ts[-1]),
+            'inicial': first_price,
+            'actual': last_price,
+            'cambio_pct': round(((last_price - first_price) / first_price) * 100 if first_price else 0.0, 4),
+            'minimo': min(prices),
+            'maximo': max(prices)
+        })
+        return result
+    
+    def get_dollar_history(self, days: int = 7, dollar_type: str = "blue") -> str:
+        """Obtiene historial del dólar a partir de las cotizaciones registradas"""
+        days = max(1, min(int(days), MAX_HISTORY_DAYS))
+        view = self.view()
+        return self._text(view, history_key(dollar_type, days),
+                          lambda: self.get_dollar_history_data(days, dollar_type, view), render_history)
+    
+    def get_dollar_analytics_data(self, dollar_types=None, windows=None, view: SnapshotView = None) -> dict:
+        """Analiza varios tipos de dólar y ventanas en una sola consulta vectorizada"""
+        dollar_types, windows = analytics_args(dollar_types, windows)
+        view = view or self.view()
+        return self._derived(view, ('analytics', dollar_types, windows),
+                             lambda: self._analytics_data(view, list(dollar_types), list(windows)))
+    
+    def _analytics_data(self, view: SnapshotView, dollar_types, windows) -> dict:
+        # NumPy se importa con el primer análisis, no al arrancar el servidor
+        from analytics import SPREADS, compute_analytics
+        # Cada serie se lee una sola vez, cubriendo la ventana más larga
+        end = time.time()
+        start = end - max(windows) * 86400
+        needed = set(dollar_types)
+        for pair in SPREADS.values():
+            needed.update(pair)
+        series = {}
+        current = {}
+        for dollar_type in needed:
+            ts, _, venta = self.history.query(TYPE_MAP[dollar_type], start, end)
+            series[dollar_type] = (ts, venta)
+            quote = view.quotes.get(TYPE_MAP[dollar_type])
+            if quote is not None:
+                current[dollar_type] = {'compra': quote.compra, 'venta': quote.venta}
         
-        result = f"📈 Evolución Dólar {type_names.get(dollar_type, dollar_type)} ({days} días):\n"
-        result += f"• Precio inicial: ${first_price:.2f} ARS\n"
-        result += f"• Precio actual: ${last_price:.2f} ARS\n"
-        result += f"• Cambio: {change:+.2f}%\n"
-        result += f"• Mínimo: ${min(prices):.2f} ARS\n"
-        result += f"• Máximo: ${max(prices):.2f} ARS\n"
-        result += f"• Tendencia: {'📈 Alcista' if change > 0 else '📉 Bajista' if change < 0 else '➡️ Estable'}"
+        return dict(self._meta(view), **compute_analytics(series, current, dollar_types, windows, end))
+    
+    def get_dollar_analytics(self, dollar_types=None, windows=None) -> str:
+        """Resumen en texto del análisis de varios tipos de dólar"""
+        from analytics import render_analytics
+        view = self.view()
+        key = ('analytics',) + analytics_args(dollar_types, windows)
+        return self._text(view, key, lambda: self.get_dollar_analytics_data(dollar_types, windows, view),
+                          lambda data: render_analytics(data, TYPE_NAMES))
+    
+    def get_dollars_data(self, dollar_types=None, view: SnapshotView = None) -> dict:
+        """Varias cotizaciones (todas si no se indican) de un mismo snapshot"""
+        view = view or self.view()
+        return self._derived(view, dollars_key(dollar_types), lambda: self._dollars_data(view, dollar_types))
+    
+    def _dollars_data(self, view: SnapshotView, dollar_types) -> dict:
+        if dollar_types:
+            keys = [(t, TYPE_MAP.get(t, t)) for t in dollar_types]
+        else:
+            keys = [(TYPE_KEYS.get(key, key), key) for key in view.quotes]
         
-        return result
+        cotizaciones = []
+        for requested, key in keys:
+            quote = view.quotes.get(key)
+            cotizaciones.append(quote.to_dict() if quote else {'tipo': requested, 'disponible': False})
+        return dict(self._meta(view), cotizaciones=cotizaciones)
     
     def get_dollar_types(self) -> str:
         """Obtiene tipos de dólar disponibles"""
-        dollars = self.get_all_dollars_real()
-        result = "💱 Tipos de dólar disponibles:\n"
-        for key, data in dollars.items():
-            if key != 'fuente':
-                result += f"• {data['nombre']}: Compra ${data['compra']:.2f} | Venta ${data['venta']:.2f}\n"
-        result += f"\n🔄 Actualizado: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-        return result
+        view = self.view()
+        return self._text(view, ('types',), lambda: self.get_dollars_data(None, view), render_types)
+    
+    def get_dollars(self, dollar_types=None) -> str:
+        """Obtiene varias cotizaciones (todas si no se indican) de un mismo snapshot"""
+        view = self.view()
+        return self._text(view, dollars_key(dollar_types), lambda: self.get_dollars_data(dollar_types, view), render_dollars)
+    
+    def get_conversion_data(self, amounts, directions="usd_ars", dollar_types=None) -> dict:
+        """Convierte montos USD↔ARS contra varios tipos de un mismo snapshot en una sola pasada NumPy.
+
+        El resultado es una matriz montos x tipos (None donde el tipo no tiene cotización).
+        Lanza ValueError si los parámetros no son válidos.
+        """
+        from analytics import convert_amounts, matrix_to_lists
+        if isinstance(directions, str):
+            directions = [directions]
+        if not isinstance(directions, (list, tuple)) or not all(isinstance(d, str) for d in directions):
+            raise ValueError("directions debe ser una dirección (usd_ars, ars_usd) o una lista de direcciones")
+        if isinstance(amounts, (int, float, str)) and not isinstance(amounts, bool):
+            # Un solo monto
+            amounts = [amounts]
+        if not isinstance(amounts, (list, tuple)):
+            raise ValueError("amounts debe ser una lista de montos")
+        if not amounts:
+            raise ValueError("faltan los montos (amounts)")
+        if len(amounts) > MAX_CONVERSION_AMOUNTS:
+            raise ValueError(f"máximo de {MAX_CONVERSION_AMOUNTS} montos por consulta")
+        import numpy as np
+        try:
+            amounts = np.asarray(amounts, dtype=np.float64).ravel()
+        except (TypeError, ValueError):
+            raise ValueError("los montos deben ser números")
+        if isinstance(dollar_types, str):
+            dollar_types = _csv(dollar_types)
+        if not dollar_types:
+            dollar_types = list(TYPE_MAP)
+        elif not isinstance(dollar_types, (list, tuple)) or not all(isinstance(t, str) for t in dollar_types):
+            raise ValueError("types debe ser una lista de tipos de dólar")
+        dollar_types = [t.lower() for t in dollar_types]
+        invalid = [t for t in dollar_types if t not in TYPE_MAP]
+        if invalid:
+            raise ValueError(f"tipos inválidos: {', '.join(invalid)} (disponibles: {', '.join(TYPE_MAP)})")
+        
+        view = self.view()
+        quotes = [view.quotes.get(TYPE_MAP[t]) for t in dollar_types]
+        buy = [quote.compra if quote else 0.0 for quote in quotes]
+        sell = [quote.venta if quote else 0.0 for quote in quotes]
+        matrix = convert_amounts(amounts, list(directions), buy, sell)
+        return dict(
+            self._meta(view),
+            tipos=dollar_types,
+            tasas={t: {'compra': b, 'venta': v} for t, b, v in zip(dollar_types, buy, sell)},
+            direcciones=list(directions),
+            montos=amounts.tolist(),
+            resultado=matrix_to_lists(matrix)
+        )
+    
+    def convert_amounts(self, amounts, directions="usd_ars", dollar_types=None) -> str:
+        from analytics import render_conversion
+        return render_conversion(self.get_conversion_data(amounts, directions, dollar_types), TYPE_NAMES)
+    
+    def create_alert_data(self, user: str, dollar_type: str, threshold, direction: str = "above", field: str = "venta") -> dict:
+        """Registra una alerta de precio (lanza ValueError si los parámetros no son válidos)"""
+        # Con un snapshot vigente la alerta se compara contra el valor actual al registrarse
+        self.get_snapshot()
+        alert, notification = self.alerts.add(user, dollar_type, threshold, direction, field)
+        return {
+            'alerta': _alert_data(alert_to_dict(alert)),
+            'disparada': _alert_data(notification) if notification else None,
+            'actual': self.alerts.value(alert.dollar_type, alert.field)
+        }
+    
+    def create_alert(self, user: str, dollar_type: str, threshold, direction: str = "above", field: str = "venta") -> str:
+        return render_alert_created(self.create_alert_data(user, dollar_type, threshold, direction, field))
+    
+    def list_alerts_data(self, user: str, since: int = 0) -> dict:
+        """Alertas pendientes y avisos recientes (posteriores al evento since) de un usuario"""
+        return {
+            'usuario': user,
+            'pendientes': [_alert_data(alert_to_dict(alert)) for alert in self.alerts.pending(user)],
+            'disparadas': [_alert_data(n) for n in self.alerts.notifications(user, since)]
+        }
+    
+    def list_alerts(self, user: str) -> str:
+        return render_alerts(self.list_alerts_data(user))
+    
+    def delete_alert_data(self, user: str, alert_id: int) -> dict:
+        return {'id': alert_id, 'eliminada': self.alerts.remove(int(alert_id), user)}
+    
+    def delete_alert(self, user: str, alert_id: int) -> str:
+        return render_alert_deleted(self.delete_alert_data(user, alert_id))
+
+def history_key(dollar_type: str, days: int):
+    return ('history', dollar_type, days)
+
+def analytics_args(dollar_types, windows):
+    """Tipos y ventanas normalizados (también sirven de clave de cache)"""
+    dollar_types = tuple(t for t in (dollar_types or ['blue', 'oficial']) if t in TYPE_MAP)
+    windows = tuple(max(1, min(int(w), MAX_HISTORY_DAYS)) for w in (windows or [7, 30]))[:MAX_ANALYTICS_WINDOWS]
+    return dollar_types, windows
+
+def dollars_key(dollar_types):
+    if not dollar_types:
+        return ('dollars', ())
+    return ('dollars', tuple(dollar_types)) if all(t in TYPE_MAP for t in dollar_types) else None
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts).astimezone().isoformat(timespec='seconds')
+
+def _short_date(iso: str) -> str:
+    return iso[:16].replace('T', ' ')
+
+def _quote_data(key: str, quote: dict) -> dict:
+    return {
+        'tipo': TYPE_KEYS.get(key, key),
+        'nombre': quote['nombre'],
+        'compra': quote['compra'],
+        'venta': quote['venta'],
+        'fecha': quote['fecha']
+    }
+
+def _alert_data(alert: dict) -> dict:
+    """Alerta o aviso con las fechas en ISO"""
+    data = dict(alert, creada=_iso(alert['creada']))
+    if 'disparada' in data:
+        data['disparada'] = _iso(data['disparada'])
+    return data
+
+DIRECTION_NAMES = {'above': 'por encima de', 'below': 'por debajo de'}
+
+def _alert_value(field: str, value: float) -> str:
+    return f"{value:.2f}%" if field == 'brecha' else f"${value:.2f} ARS"
+
+def _describe_alert(alert: dict) -> str:
+    subject = f"brecha del {TYPE_NAMES.get(alert['tipo'], alert['tipo'])} con el oficial" if alert['campo'] == 'brecha' \
+        else f"Dólar {TYPE_NAMES.get(alert['tipo'], alert['tipo'])} ({alert['campo']})"
+    return f"#{alert['id']} {subject} {DIRECTION_NAMES[alert['direccion']]} {_alert_value(alert['campo'], alert['umbral'])}"
+
+def _source(fallback: bool, restored: bool) -> str:
+    """referencia: datos fijos; guardado: último dato real cargado del disco al arrancar; api: descarga"""
+    return 'referencia' if fallback else 'guardado' if restored else 'api'
+
+FUENTES = {
+    'referencia': "📊 Datos de referencia",
+    'guardado': "💾 Último dato guardado (actualizando)",
+    'api': "🚀 API en tiempo real"
+}
+
+def _fuente(data: dict) -> str:
+    return FUENTES.get(data['fuente'], FUENTES['api'])
+
+def render_price(data: dict) -> str:
+    """Texto de una cotización"""
+    return f"💵 Dólar {data['nombre']}:\n• Compra: ${data['compra']:.2f} ARS\n• Venta: ${data['venta']:.2f} ARS\n• Actualizado: {quote_date(data)}\n• Fuente: {_fuente(data)}"
+
+def render_history(data: dict) -> str:
+    """Texto de las estadísticas del historial"""
+    if not data['registros']:
+        return f"⚠️ Sin cotizaciones registradas del Dólar {data['nombre']} en los últimos {data['dias']} días"
+    change = data['cambio_pct']
+    result = f"📈 Evolución Dólar {data['nombre']} ({data['dias']} días, {data['registros']} registros):\n"
+    result += f"• Precio inicial: ${data['inicial']:.2f} ARS\n"
+    result += f"• Precio actual: ${data['actual']:.2f} ARS\n"
+    result += f"• Cambio: {change:+.2f}%\n"
+    result += f"• Mínimo: ${data['minimo']:.2f} ARS\n"
+    result += f"• Máximo: ${data['maximo']:.2f} ARS\n"
+    result += f"• Tendencia: {'📈 Alcista' if change > 0 else '📉 Bajista' if change < 0 else '➡️ Estable'}"
+    return result
+
+def render_types(data: dict) -> str:
+    """Texto de los tipos de dólar disponibles"""
+    result = "💱 Tipos de dólar disponibles:\n"
+    for quote in data['cotizaciones']:
+        result += f"• {quote['nombre']}: Compra ${quote['compra']:.2f} | Venta ${quote['venta']:.2f}\n"
+    result += f"\n🔄 Actualizado: {_short_date(data['snapshot'])}"
+    return result
+
+def render_alert_created(data: dict) -> str:
+    """Texto de una alerta recién registrada"""
+    fired = data['disparada']
+    if fired:
+        return f"🔔 Alerta {_describe_alert(fired)}: ya se cumple (actual {_alert_value(fired['campo'], fired['valor'])})"
+    result = f"✅ Alerta registrada: {_describe_alert(data['alerta'])}"
+    if data['actual'] is not None:
+        result += f" (actual {_alert_value(data['alerta']['campo'], data['actual'])})"
+    return result
+
+def render_alerts(data: dict) -> str:
+    """Texto de las alertas pendientes y los avisos recientes de un usuario"""
+    if not data['pendientes'] and not data['disparadas']:
+        return f"🔕 Sin alertas registradas para {data['usuario']}"
+    result = f"🔔 Alertas de {data['usuario']}:\n"
+    for alert in data['pendientes']:
+        result += f"• {_describe_alert(alert)}\n"
+    if data['disparadas']:
+        result += "\n📣 Disparadas:\n"
+        for fired in data['disparadas']:
+            result += f"• {_describe_alert(fired)} → {_alert_value(fired['campo'], fired['valor'])} ({_short_date(fired['disparada'])})\n"
+    return result.rstrip("\n")
+
+def render_alert_deleted(data: dict) -> str:
+    """Texto del resultado de eliminar una alerta"""
+    if data['eliminada']:
+        return f"🗑️ Alerta #{data['id']} eliminada"
+    return f"⚠️ La alerta #{data['id']} no existe o ya se disparó"
+
+def render_dollars(data: dict) -> str:
+    """Texto de varias cotizaciones de un mismo snapshot"""
+    result = "💵 Cotizaciones del dólar:\n"
+    for quote in data['cotizaciones']:
+        if quote.get('disponible', True):
+            result += f"• {quote['nombre']}: Compra ${quote['compra']:.2f} | Venta ${quote['venta']:.2f} | Actualizado: {quote_date(quote)}\n"
+        else:
+            result += f"• {quote['tipo']}: no disponible\n"
+    result += f"\n🔄 Snapshot: {_short_date(data['snapshot'])} | Fuente: {_fuente(data)}"
+    return result
 
 dollar_service = DollarServiceReal()
+# Actualizaciones en vivo: cada snapshot nuevo se reparte como delta a los suscriptores
+broadcaster = Broadcaster(dollar_service._snapshot_meta, _quote_data)
+dollar_service.add_listener(broadcaster.publish)
+
+def stream_keys(types: str):
+    """'blue,oficial' -> claves del snapshot a enviar (None = todas)"""
+    requested = [t.strip().lower() for t in types.split(',') if t.strip()]
+    if not requested:
+        return None
+    keys = frozenset(TYPE_MAP[t] for t in requested if t in TYPE_MAP)
+    if not keys:
+        raise ValueError(f"tipos inválidos: {types} (disponibles: {', '.join(TYPE_MAP)})")
+    return keys
+
+def start_stream_server(bind: str, reuse_port: bool = False) -> StreamServer:
+    """Servidor SSE asíncrono para muchos suscriptores (un solo hilo para todos)"""
+    host, port = bind.rsplit(":", 1)
+    return StreamServer(broadcaster, stream_keys, on_subscribe=dollar_service.get_snapshot).start(host, int(port), reuse_port)
+
+def snapshot_response(key, build, render):
+    """Respuesta JSON condicional: ETag según el contenido de la respuesta y 304 si no cambió.
+
+    Con ?format=text se agrega el campo "result" con el texto formateado. El cuerpo
+    y su ETag se calculan una sola vez por snapshot (key None: sin cache) y se reutilizan.
+    """
+    view = dollar_service.view()
+    text = request.args.get('format') == 'text'
+    
+    def serialize():
+        payload = build(view)
+        if text:
+            payload = dict(payload, result=render(payload))
+        body = app.json.dumps(payload).encode('utf-8') + b"\n"
+        # Hash del cuerpo y no la versión: cambia también con la fuente o la hora del snapshot,
+        # y no se repite entre procesos que reinician la numeración de versiones
+        return body, hashlib.blake2b(body, digest_size=12).hexdigest()
+    
+    body, etag = serialize() if key is None else view.cached(('http', text) + key, serialize)
+    if request.if_none_match.contains_weak(etag):
+        metrics.HTTP_CONDITIONAL.inc(status="304")
+        response = app.response_class(status=304)
+    else:
+        metrics.HTTP_CONDITIONAL.inc(status="200")
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    max_age = max(0, int(dollar_service.snapshot['expires_at'] - time.time()))
+    response.headers['Cache-Control'] = f"public, max-age={max_age}, stale-while-revalidate={dollar_service.retry_delay}"
+    return response
 
 @app.route('/dollar/<dollar_type>')
 def get_dollar_price(dollar_type):
-    return jsonify({"result": dollar_service.get_dollar_price(dollar_type)})
+    key = ('price', dollar_type) if dollar_type in TYPE_MAP else None
+    return snapshot_response(key, lambda view: dollar_service.get_dollar_price_data(dollar_type, view), render_price)
 
 @app.route('/history/<dollar_type>/<int:days>')
 def get_dollar_history(dollar_type, days):
-    return jsonify({"result": dollar_service.get_dollar_history(days, dollar_type)})
+    if dollar_type not in TYPE_MAP:
+        return jsonify({"error": f"tipo inválido: {dollar_type} (disponibles: {', '.join(TYPE_MAP)})"}), 404
+    return snapshot_response(history_key(dollar_type, days),
+                             lambda view: dollar_service.get_dollar_history_data(days, dollar_type, view), render_history)
+
+@app.route('/analytics')
+def get_dollar_analytics():
+    dollar_types = [t.strip() for t in request.args.get('types', 'blue,oficial').split(',') if t.strip()]
+    try:
+        windows = [int(w) for w in request.args.get('windows', '7,30').split(',') if w.strip()]
+    except ValueError:
+        return jsonify({"error": "windows debe ser una lista de enteros"}), 400
+    from analytics import render_analytics
+    return snapshot_response(('analytics',) + analytics_args(dollar_types, windows),
+                             lambda view: dollar_service.get_dollar_analytics_data(dollar_types, windows, view),
+                             lambda data: render_analytics(data, TYPE_NAMES))
+
+@app.route('/dollars')
+def get_dollars():
+    dollar_types = [t.strip() for t in request.args.get('types', '').split(',') if t.strip()]
+    return snapshot_response(dollars_key(dollar_types),
+                             lambda view: dollar_service.get_dollars_data(dollar_types, view), render_dollars)
 
 @app.route('/types')
 def get_dollar_types():
-    return jsonify({"result": dollar_service.get_dollar_types()})
+    return snapshot_response(('types',), lambda view: dollar_service.get_dollars_data(None, view), render_types)
+
+@app.route('/stream')
+def stream_updates():
+    """Eventos SSE con cada cambio del snapshot (?types=blue,oficial para filtrar)"""
+    try:
+        keys = stream_keys(request.args.get('types', ''))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Asegura el primer snapshot y el hilo de renovación: los suscriptores no sondean
+    dollar_service.get_snapshot()
+    return Response(
+        broadcaster.iter_sse(request.headers.get('Last-Event-ID'), keys),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _csv(value: str):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+@app.route('/convert', methods=['GET', 'POST'])
+def convert_amounts():
+    """Conversión masiva: JSON {amounts, direction | directions, types} o ?amounts=1500,200&direction=usd_ars&types=blue,bolsa"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        body = {}
+    amounts = body['amounts'] if 'amounts' in body else _csv(request.args.get('amounts', ''))
+    directions = body.get('directions') or body.get('direction') or request.args.get('direction', 'usd_ars')
+    dollar_types = body['types'] if 'types' in body else _csv(request.args.get('types', ''))
+    try:
+        payload = dollar_service.get_conversion_data(amounts, directions, dollar_types)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if request.args.get('format') == 'text':
+        from analytics import render_conversion
+        payload['result'] = render_conversion(payload, TYPE_NAMES)
+    return jsonify(payload)
+
+def alerts_response(payload: dict, render, status: int = 200):
+    """Respuesta JSON de alertas (no depende del snapshot: sin ETag ni cache)"""
+    if request.args.get('format') == 'text':
+        payload['result'] = render(payload)
+    response = jsonify(payload)
+    response.status_code = status
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/alerts', methods=['POST'])
+def create_alert():
+    body = request.get_json(silent=True)
+    if body is None:
+        body = {}
+    elif not isinstance(body, dict):
+        return jsonify({"error": "el cuerpo debe ser un objeto JSON con dollar_type y threshold"}), 400
+    try:
+        payload = dollar_service.create_alert_data(
+            body.get('user', 'default'), body.get('dollar_type', ''), body.get('threshold'),
+            body.get('direction', 'above'), body.get('field', 'venta')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return alerts_response(payload, render_alert_created, 201)
+
+@app.route('/alerts')
+def list_alerts():
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({"error": "since debe ser un entero"}), 400
+    return alerts_response(dollar_service.list_alerts_data(request.args.get('user', 'default'), since), render_alerts)
+
+@app.route('/alerts/<int:alert_id>', methods=['DELETE'])
+def delete_alert(alert_id):
+    payload = dollar_service.delete_alert_data(request.args.get('user', 'default'), alert_id)
+    return alerts_response(payload, render_alert_deleted, 200 if payload['eliminada'] else 404)
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     print("🚀 Servidor Dólar REAL ejecutándose en http://localhost:5000")
+    dollar_service.start_refresher()
+    stream_bind = os.getenv("DOLLAR_STREAM_BIND", "")
+    if stream_bind:
+        start_stream_server(stream_bind)
+        print(f"📡 Actualizaciones en vivo en http://{stream_bind}/stream")
     app.run(port=5000, debug=False)
\ No newline at end of file
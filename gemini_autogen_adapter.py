@@ -1,52 +1,265 @@
-import google.generativeai as genai
+import asyncio
 import os
+import threading
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, AsyncIterator, Callable, Hashable, Iterable, Iterator, Optional, Tuple
 import json
+from datetime import timedelta
+from llm_backends import GeminiBackend, LLMRouter, Part, default_backends
+from llm_cache import LLMResponseCache, cached_stream, make_key
+from prompt_builder import SYSTEM_INSTRUCTION, TOOLS_SYSTEM_INSTRUCTION, PromptBuilder
+import metrics
 
 load_dotenv()
 
+# Cache de contexto explícita de Gemini para SYSTEM_INSTRUCTION (opcional, con vencimiento)
+CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE") == "1"
+CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# Turnos del modelo con llamadas a herramientas antes de abandonar una consulta
+MAX_TOOL_ROUNDS = int(os.getenv("GEMINI_MAX_TOOL_ROUNDS", "4"))
+
+# Claves de JSON Schema que acepta el Schema de Gemini (subconjunto de OpenAPI 3.0)
+SCHEMA_KEYS = ("type", "format", "nullable", "enum", "required")
+
+# execute([(nombre, argumentos), ...]) -> resultados en el mismo orden
+ToolExecutor = Callable[[List[Tuple[str, Dict[str, Any]]]], List[str]]
+
 class GeminiAutogenAdapter:
     """Adaptador para usar Gemini con AutoGen"""
     
     def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
             raise ValueError("❌ GEMINI_API_KEY no encontrada en .env")
         
-        genai.configure(api_key=api_key)
+        # Los modelos de Gemini se crean en la primera consulta (ver model y tool_model)
+        self._models = {}
+        self._model_lock = threading.Lock()
+        # Esquemas de las herramientas (MCP) que puede pedir tool_model, ver set_tools()
+        self.tools: List[dict] = []
+        # Herramientas que modifican estado: una respuesta que las usó no se cachea
+        self.mutating = frozenset()
+        self.max_tool_rounds = MAX_TOOL_ROUNDS
+        
+        # Presupuesto de tokens y compactación de conversaciones largas
+        self.prompts = PromptBuilder()
         
-        # Usar el modelo que sabemos que funciona
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
-        print("✅ Adaptador Gemini 2.5 Flash configurado correctamente")
+        # Todas las llamadas al modelo se reparten entre los proveedores (LLM_BACKENDS) con hedging
+        self.router = LLMRouter(default_backends(gemini_backend(lambda tools: self.tool_model if tools else self.model)))
+        
+        # Respuestas repetidas sobre los mismos datos no vuelven a llamar a Gemini
+        self.cache = LLMResponseCache(
+            maxsize=int(os.getenv("LLM_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "600"))
+        )
+        metrics.register_cache("adapter", self.cache)
+    
+    @property
+    def model(self):
+        """Modelo de Gemini; importar google.generativeai es costoso, así que se hace al primer uso"""
+        return self._get_model("text")
+    
+    @property
+    def tool_model(self):
+        """Modelo con las herramientas declaradas para function calling (ver set_tools)"""
+        return self._get_model("tools")
+    
+    def _get_model(self, kind: str):
+        entry = self._models.get(kind)
+        if entry is None or (CONTEXT_CACHE and time.time() >= entry[1]):
+            with self._model_lock:
+                entry = self._models.get(kind)
+                if entry is None or (CONTEXT_CACHE and time.time() >= entry[1]):
+                    first = not self._models
+                    if kind == "tools":
+                        # Con cache de contexto las herramientas tienen que ir en el contenido cacheado,
+                        # así que se declaran al crear el modelo y no en cada llamada
+                        model = create_model(self.api_key, system_instruction=TOOLS_SYSTEM_INSTRUCTION, context_cache=CONTEXT_CACHE,
+                                             tools=[{"function_declarations": function_declarations(self.tools)}])
+                    else:
+                        model = create_model(self.api_key, system_instruction=SYSTEM_INSTRUCTION, context_cache=CONTEXT_CACHE)
+                    # La cache de contexto vence: se recrea un poco antes de su TTL
+                    entry = self._models[kind] = (model, time.time() + CONTEXT_CACHE_TTL * 0.9)
+                    if first:
+                        print("✅ Adaptador Gemini 2.5 Flash configurado correctamente")
+        return entry[0]
+    
+    def set_tools(self, tools: List[dict], mutating: Iterable[str] = ()):
+        """Herramientas (esquemas de DollarMCPServer.get_tools()) que puede pedir el modelo.
+
+        mutating son las que modifican estado (p. ej. crear una alerta): repetir la
+        consulta tiene que volver a ejecutarlas, así que esas respuestas no se cachean.
+        """
+        with self._model_lock:
+            self.tools = list(tools)
+            self.mutating = frozenset(mutating)
+            self._models.pop("tools", None)
+    
+    def generate(self, prompt: str, cache_key: Optional[str] = None, data_version: Optional[Hashable] = None) -> str:
+        """Genera texto con Gemini, reutilizando la respuesta si la consulta y los datos no cambiaron.
+
+        cache_key es la consulta del usuario (por defecto, el prompt completo) y
+        data_version la versión de las cotizaciones incluidas en el prompt.
+        """
+        key = make_key(cache_key if cache_key is not None else prompt, data_version)
+        return self._complete(prompt, key)[0]
+    
+    def _complete(self, prompt: str, key) -> Tuple[str, Dict[str, int], str]:
+        """Devuelve (texto, uso de tokens, proveedor); un acierto de cache no consume tokens"""
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, usage_dict(0, 0), "cache"
+        text, usage, backend = self.router.complete(prompt)
+        self.cache.set(key, text)
+        return text, usage, backend
+    
+    def stream(self, prompt: str, cache_key: Optional[str] = None, data_version: Optional[Hashable] = None) -> Iterator[str]:
+        """Genera texto en modo streaming, fragmento a fragmento.
+
+        La respuesta completa se guarda en la misma cache que usa generate().
+        """
+        key = make_key(cache_key if cache_key is not None else prompt, data_version)
+        return cached_stream(self.cache, key, lambda: stream_answer(self.router, prompt))
     
-    def create_chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+    def generate_with_tools(self, prompt: str, execute: ToolExecutor, cache_key: Optional[str] = None,
+                            data_version: Optional[Hashable] = None,
+                            result_version: Optional[Callable[[], Hashable]] = None,
+                            before_turn: Optional[Callable[[], None]] = None) -> str:
+        """Como generate(), pero el modelo pide los datos que necesita con function calling.
+
+        execute recibe todas las llamadas de un turno juntas, para ejecutarlas en paralelo.
+        data_version es la versión vigente de los datos (para buscar en la cache) y
+        result_version() la de los datos que devolvieron las herramientas, con la que
+        se guarda la respuesta. before_turn() se llama antes de cada llamada al modelo
+        (p. ej. para descontarla de un límite de tasa); puede bloquear o lanzar una excepción.
+        """
+        return "".join(self._tool_answer(prompt, execute, cache_key, data_version, result_version, stream=False,
+                                         before_turn=before_turn))
+    
+    def stream_with_tools(self, prompt: str, execute: ToolExecutor, cache_key: Optional[str] = None,
+                          data_version: Optional[Hashable] = None,
+                          result_version: Optional[Callable[[], Hashable]] = None,
+                          before_turn: Optional[Callable[[], None]] = None) -> Iterator[str]:
+        """Versión streaming de generate_with_tools(): el texto final llega fragmento a fragmento"""
+        return self._tool_answer(prompt, execute, cache_key, data_version, result_version, stream=True,
+                                 before_turn=before_turn)
+    
+    def _tool_answer(self, prompt: str, execute: ToolExecutor, cache_key: Optional[str], data_version: Optional[Hashable],
+                     result_version: Optional[Callable[[], Hashable]], stream: bool,
+                     before_turn: Optional[Callable[[], None]] = None) -> Iterator[str]:
+        text = cache_key if cache_key is not None else prompt
+        # Sin versión de los datos no se sabe si una respuesta guardada sigue valiendo
+        cached = self.cache.get(make_key(text, data_version)) if data_version is not None else None
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        called = set()
+        for chunk in self._tool_loop(prompt, execute, stream, called, before_turn):
+            parts.append(chunk)
+            yield chunk
+        if called & self.mutating:
+            return
+        version = result_version() if result_version is not None else data_version
+        if version is not None:
+            self.cache.set(make_key(text, version), "".join(parts))
+    
+    def _tool_loop(self, prompt: str, execute: ToolExecutor, stream: bool, called: Optional[set] = None,
+                   before_turn: Optional[Callable[[], None]] = None) -> Iterator[str]:
+        """Turnos de function calling hasta que el modelo responde sólo con texto.
+
+        Todas las llamadas que pide el modelo en un turno se ejecutan juntas y sus
+        resultados vuelven en el turno siguiente como function_response. Cada turno
+        pasa por el router, así que puede responderlo cualquier proveedor. Los nombres
+        de las herramientas ejecutadas se agregan a called. before_turn() se llama
+        antes de cada turno: una consulta con herramientas hace varias llamadas al modelo.
+        """
+        contents = [{"role": "user", "parts": [{"text": prompt}]}]
+        for _ in range(self.max_tool_rounds):
+            if before_turn is not None:
+                before_turn()
+            if stream:
+                parts, backend = self.router.stream(contents, self.tools)
+            else:
+                parts, backend = self.router.turn(contents, self.tools)
+            calls = []
+            model_parts = []
+            for part in parts:
+                model_parts.append(part)
+                call = part.get("function_call")
+                if call:
+                    calls.append((call["name"], call["args"]))
+                else:
+                    yield part["text"]
+            if not calls:
+                return
+            
+            print(f"🛠️ El modelo ({backend}) pidió {len(calls)} herramienta(s): {', '.join(name for name, _ in calls)}")
+            metrics.LLM_TOOL_CALLS.observe(len(calls))
+            if called is not None:
+                called.update(name for name, _ in calls)
+            with metrics.timed('tool_round'):
+                results = execute(calls)
+            contents.append({"role": "model", "parts": model_parts})
+            contents.append({"role": "user", "parts": [
+                {"function_response": {"name": name, "response": {"result": result}}}
+                for (name, _), result in zip(calls, results)
+            ]})
+        raise RuntimeError(f"El modelo siguió pidiendo herramientas después de {self.max_tool_rounds} turnos")
+    
+    async def astream(self, prompt: str, cache_key: Optional[str] = None, data_version: Optional[Hashable] = None) -> AsyncIterator[str]:
+        """Versión asíncrona de stream(): la llamada bloqueante corre en un hilo aparte"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        
+        def produce():
+            try:
+                for chunk in self.stream(prompt, cache_key, data_version):
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+        
+        threading.Thread(target=produce, daemon=True).start()
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    
+    def create_chat_completion(self, messages: List[Dict[str, str]], data_version: Optional[Hashable] = None, stream: bool = False, **kwargs):
         
         # Convertir mensajes de AutoGen a prompt de Gemini
-        prompt = self._format_messages_for_gemini(messages)
+        prompt = self.prompts.build_chat(messages)
+        
+        if stream:
+            return self._stream_chat_completion(prompt, data_version)
         
         try:
-            response = self.model.generate_content(prompt)
+            text, usage, backend = self._complete(prompt, make_key(prompt, data_version))
             
             # Formatear respuesta para AutoGen
             return {
+                "model": backend,
                 "choices": [
                     {
                         "message": {
                             "role": "assistant",
-                            "content": response.text
+                            "content": text
                         },
                         "finish_reason": "stop"
                     }
                 ],
-                "usage": {
-                    "prompt_tokens": 0,
-                    "completion_tokens": 0,
-                    "total_tokens": 0
-                }
+                "usage": usage
             }
         except Exception as e:
-            print(f"❌ Error en Gemini: {e}")
+            # Sólo llega acá si fallaron todos los proveedores
+            print(f"❌ Error en el LLM: {e}")
             return {
                 "choices": [
                     {
@@ -54,29 +267,213 @@ class GeminiAutogenAdapter:
                             "role": "assistant", 
                             "content": f"❌ Error procesando la consulta: {str(e)}"
                         },
-                        "finish_reason": "stop"
+                        "finish_reason": "error"
                     }
                 ]
             }
     
-    def _format_messages_for_gemini(self, messages: List[Dict[str, str]]) -> str:
-        """Formatea los mensajes de AutoGen para Gemini"""
-        
-        formatted_text = "Sos un analista financiero especializado en el dólar argentino. Respondé en español.\n\n"
-        
-        for message in messages:
-            role = message.get("role", "")
-            content = message.get("content", "")
-            
-            if role == "system":
-                formatted_text += f"INSTRUCCIONES: {content}\n\n"
-            elif role == "user":
-                formatted_text += f"USUARIO: {content}\n\n"
-            elif role == "assistant":
-                formatted_text += f"ASISTENTE: {content}\n\n"
-        
-        formatted_text += "ASISTENTE:"
-        return formatted_text
+    def _stream_chat_completion(self, prompt: str, data_version: Optional[Hashable]) -> Iterator[Dict[str, Any]]:
+        """Fragmentos incrementales con formato de chat completion (delta por fragmento)"""
+        try:
+            for text in self.stream(prompt, data_version=data_version):
+                yield {"choices": [{"delta": {"role": "assistant", "content": text}, "finish_reason": None}]}
+        except Exception as e:
+            print(f"❌ Error en Gemini: {e}")
+            yield {"choices": [{"delta": {"role": "assistant", "content": f"❌ Error procesando la consulta: {str(e)}"}, "finish_reason": None}]}
+        yield {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+
+def create_model(api_key: str, model_name: str = 'gemini-2.5-flash', system_instruction: Optional[str] = None,
+                 context_cache: bool = False, tools: Optional[List[dict]] = None):
+    """Configura google.generativeai (importado recién ahora) y crea el modelo.
+
+    system_instruction es el prefijo estático de todas las consultas. Con context_cache
+    se sube una vez a la cache de contexto de Gemini y cada llamada la referencia; si
+    no se puede crear (por ejemplo, por tener menos tokens que el mínimo) se envía
+    como system_instruction, que Gemini también reutiliza por ser un prefijo estable.
+    tools son las declaraciones de funciones que puede pedir el modelo.
+    """
+    import google.generativeai as genai
+    
+    genai.configure(api_key=api_key)
+    if system_instruction and context_cache:
+        try:
+            from google.generativeai import caching
+            cached = caching.CachedContent.create(
+                model=f"models/{model_name}",
+                system_instruction=system_instruction,
+                tools=tools,
+                ttl=timedelta(seconds=CONTEXT_CACHE_TTL)
+            )
+            return genai.GenerativeModel.from_cached_content(cached_content=cached)
+        except Exception as e:
+            print(f"⚠️ Cache de contexto no disponible ({e}); se usa system_instruction")
+    # Usar el modelo que sabemos que funciona
+    if tools:
+        return genai.GenerativeModel(model_name, system_instruction=system_instruction, tools=tools)
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+def gemini_schema(schema: dict) -> dict:
+    """JSON Schema de una herramienta MCP en el formato que acepta Gemini.
+
+    Gemini rechaza las claves que no conoce, como default: el valor por defecto
+    pasa a la descripción para que el modelo sepa que puede omitir el parámetro.
+    """
+    result = {key: schema[key] for key in SCHEMA_KEYS if key in schema}
+    description = schema.get("description", "")
+    if "default" in schema:
+        description = f"{description} (por defecto: {json.dumps(schema['default'], ensure_ascii=False)})".strip()
+    if description:
+        result["description"] = description
+    if "items" in schema:
+        result["items"] = gemini_schema(schema["items"])
+    if "properties" in schema:
+        result["properties"] = {name: gemini_schema(prop) for name, prop in schema["properties"].items()}
+    return result
+
+def function_declarations(tools: List[dict]) -> List[dict]:
+    """Herramientas de DollarMCPServer.get_tools() como declaraciones de funciones de Gemini"""
+    declarations = []
+    for tool in tools:
+        declaration = {"name": tool["name"], "description": tool.get("description", "")}
+        parameters = tool.get("parameters") or {}
+        # Un objeto sin propiedades no es un esquema válido: la función se declara sin parámetros
+        if parameters.get("properties"):
+            declaration["parameters"] = gemini_schema(parameters)
+        declarations.append(declaration)
+    return declarations
+
+def call_arguments(value, schema: Optional[dict] = None):
+    """Argumentos de una llamada de Gemini (Struct de protobuf) como tipos de Python.
+
+    En un Struct todos los números son float: los parámetros declarados integer
+    vuelven a int según el esquema de la herramienta.
+    """
+    schema = schema or {}
+    if hasattr(value, "items"):
+        properties = schema.get("properties", {})
+        return {key: call_arguments(item, properties.get(key)) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) or (hasattr(value, "__iter__") and not isinstance(value, (str, bytes))):
+        return [call_arguments(item, schema.get("items")) for item in value]
+    if schema.get("type") == "integer" and isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def response_parts(response) -> list:
+    """Partes del primer candidato de una respuesta (texto o function_call)"""
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        return []
+    content = getattr(candidates[0], "content", None)
+    return list(getattr(content, "parts", None) or [])
+
+def request_options(timeout: Optional[float]) -> dict:
+    """Argumentos de generate_content para que la llamada no espere más de timeout segundos"""
+    return {"request_options": {"timeout": timeout}} if timeout else {}
+
+def model_turn(model, contents: List[dict], stream: bool, timeout: Optional[float] = None) -> Iterator:
+    """Un turno del modelo con métricas: sus partes, a medida que llegan si stream es True"""
+    if stream:
+        started = time.perf_counter()
+        return (part for chunk in iter_chunks(model.generate_content(contents, stream=True, **request_options(timeout)), started)
+                for part in response_parts(chunk))
+    try:
+        with metrics.timed('llm_call'):
+            response = model.generate_content(contents, **request_options(timeout))
+        parts = response_parts(response)
+    except Exception:
+        metrics.LLM_CALLS.inc(mode="blocking", status="error")
+        raise
+    metrics.LLM_CALLS.inc(mode="blocking", status="ok")
+    record_usage(response)
+    return iter(parts)
+
+def generate_text(model, prompt: str, timeout: Optional[float] = None) -> Tuple[str, Dict[str, int]]:
+    """Llamada bloqueante a Gemini con métricas; devuelve (texto, uso de tokens)"""
+    try:
+        with metrics.timed('llm_call'):
+            response = model.generate_content(prompt, **request_options(timeout))
+        text = response.text
+    except Exception:
+        metrics.LLM_CALLS.inc(mode="blocking", status="error")
+        raise
+    metrics.LLM_CALLS.inc(mode="blocking", status="ok")
+    return text, record_usage(response)
+
+def gemini_turn(model, contents: List[dict], tools: Optional[List[dict]], stream: bool,
+                timeout: Optional[float] = None) -> Iterator[Part]:
+    """Un turno de Gemini con sus partes en el formato común de los proveedores (ver llm_backends.Part)"""
+    schemas = {tool["name"]: tool.get("parameters") for tool in tools or ()}
+    for part in model_turn(model, contents, stream, timeout):
+        call = getattr(part, "function_call", None)
+        if call and call.name:
+            yield {"function_call": {"name": call.name, "args": call_arguments(call.args, schemas.get(call.name))}}
+            continue
+        text = getattr(part, "text", "")
+        if text:
+            yield {"text": text}
+
+def gemini_backend(model: Callable[[bool], Any]) -> GeminiBackend:
+    """Backend del router para Gemini; model(con_herramientas) devuelve el modelo a usar"""
+    return GeminiBackend(
+        lambda prompt, timeout: generate_text(model(False), prompt, timeout),
+        lambda contents, tools, timeout, stream: gemini_turn(model(bool(tools)), contents, tools, stream, timeout)
+    )
+
+def stream_answer(router: LLMRouter, prompt: str) -> Iterator[str]:
+    """Respuesta en streaming a prompt (sin herramientas) del proveedor que gane en el router"""
+    parts, _ = router.stream([{"role": "user", "parts": [{"text": prompt}]}])
+    return (part["text"] for part in parts if part.get("text"))
+
+def usage_dict(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+def record_usage(response) -> Dict[str, int]:
+    """Lee el usage metadata de una respuesta de Gemini y lo suma a las métricas"""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    metrics.record_llm_usage(prompt_tokens, completion_tokens)
+    return usage_dict(prompt_tokens, completion_tokens)
+
+def iter_chunks(response, started: float = None) -> Iterator:
+    """Fragmentos de una respuesta de Gemini en streaming.
+
+    Al terminar registra la latencia total, la del primer fragmento y los tokens usados
+    (el usage metadata acumulado llega en el último fragmento).
+    """
+    started = started if started is not None else time.perf_counter()
+    last = None
+    try:
+        for chunk in response:
+            if last is None:
+                metrics.STAGE_LATENCY.observe(time.perf_counter() - started, stage="llm_first_token")
+            last = chunk
+            yield chunk
+    except Exception:
+        metrics.LLM_CALLS.inc(mode="stream", status="error")
+        raise
+    metrics.STAGE_LATENCY.observe(time.perf_counter() - started, stage="llm_call")
+    metrics.LLM_CALLS.inc(mode="stream", status="ok")
+    record_usage(last)
+
+_adapter = None
+_adapter_lock = threading.Lock()
+
+def get_gemini_adapter() -> GeminiAutogenAdapter:
+    """Adaptador global, creado en el primer uso para que importar el módulo no tenga efectos"""
+    global _adapter
+    if _adapter is None:
+        with _adapter_lock:
+            if _adapter is None:
+                _adapter = GeminiAutogenAdapter()
+    return _adapter
 
-# Instancia global del adaptador
-gemini_adapter = GeminiAutogenAdapter()
\ No newline at end of file
+def __getattr__(name):
+    # Compatibilidad: `gemini_autogen_adapter.gemini_adapter` sigue siendo la instancia global
+    if name == "gemini_adapter":
+        return get_gemini_adapter()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
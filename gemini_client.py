@@ -1,85 +1,142 @@
-import google.generativeai as genai
-import requests
 import os
+import threading
 from dotenv import load_dotenv
+from mcp_server import HTTPTransport
+from llm_cache import LLMResponseCache, cached_stream, make_key
+from gemini_autogen_adapter import create_model, gemini_backend, stream_answer
+from llm_backends import LLMRouter, default_backends
+from prompt_builder import SYSTEM_INSTRUCTION, PromptBuilder, quote_fields, render_quotes
+from intent_parser import parse_intent, answer_locally
+import metrics
 
 load_dotenv()
 
 class DollarClientGemini:
-    def __init__(self):
+    def __init__(self, list_models: bool = False):
         # Configurar Gemini
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
             print("❌ GEMINI_API_KEY no encontrada en .env")
             print("💡 Obtén una API key gratis en: https://aistudio.google.com/")
             exit(1)
         
-        genai.configure(api_key=api_key)
+        # El modelo se crea en la primera consulta (ver model)
+        self._model = None
+        self._model_lock = threading.Lock()
+        
+        # Listar los modelos disponibles es una llamada de red: sólo si se pide
+        if list_models:
+            self.list_models()
+        
+        # Las consultas se reparten entre los proveedores (LLM_BACKENDS) con hedging
+        self.router = LLMRouter(default_backends(gemini_backend(lambda tools: self.model)))
+        
+        # Cliente HTTP con keep-alive y revalidación por ETag
+        self.server = HTTPTransport()
+        
+        # Respuestas por consulta normalizada + versión de las cotizaciones
+        self.cache = LLMResponseCache(
+            maxsize=int(os.getenv("LLM_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "600"))
+        )
+        metrics.register_cache("gemini_client", self.cache)
+        
+        # Parte variable del prompt; las instrucciones fijas van como system_instruction
+        self.prompts = PromptBuilder()
+    
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    try:
+                        self._model = create_model(self.api_key, system_instruction=SYSTEM_INSTRUCTION)
+                        print("✅ Gemini configurado correctamente con gemini-2.5-flash")
+                    except Exception as e:
+                        print(f"❌ Error configurando Gemini: {e}")
+                        exit(1)
+        return self._model
+    
+    def list_models(self):
+        """Muestra los modelos disponibles que soportan generateContent"""
+        import google.generativeai as genai
         
-        # Listar modelos disponibles y usar uno compatible
         try:
-            models = list(genai.list_models())
+            genai.configure(api_key=self.api_key)
             print("🤖 Modelos disponibles:")
-            for model in models:
+            for model in genai.list_models():
                 if 'generateContent' in model.supported_generation_methods:
                     print(f"  ✅ {model.name}")
-            
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-            print("✅ Gemini configurado correctamente con gemini-2.5-flash")
-            
         except Exception as e:
-            print(f"❌ Error configurando Gemini: {e}")
-            exit(1)
+            print(f"❌ Error listando modelos: {e}")
     
     def get_server_data(self, endpoint: str) -> str:
         """Obtiene datos del servidor"""
         try:
-            response = requests.get(f'http://localhost:5000{endpoint}', timeout=10)
-            return response.json()["result"]
+            return self.server.get(endpoint)
         except Exception as e:
             return f"❌ Error conectando al servidor: {str(e)}"
     
+    def _answer_locally(self, intent):
+        """Precios y tipos salen directo de los datos del servidor, sin llamar a Gemini"""
+        answer = answer_locally(intent, self.server)
+        metrics.QUERY_ROUTES.inc(route="llm" if answer is None else "local")
+        return answer
+    
+    def _build_prompt(self, question: str, intent):
+        """Arma el prompt con las cotizaciones actuales; devuelve (prompt, clave de cache)"""
+        # Sólo los tipos mencionados (todos si no se menciona ninguno), del mismo snapshot
+        try:
+            quotes = render_quotes(self.server.get_dollars_data(list(intent.dollar_types)), quote_fields(question))
+        except Exception as e:
+            quotes = f"❌ Error conectando al servidor: {str(e)}"
+        
+        prompt = self.prompts.build_query(question, [("COTIZACIONES ACTUALES", quotes)])
+        
+        # Sin datos del servidor no hay versión válida: no se usa la cache
+        key = None if quotes.startswith("❌") else make_key(question, self.server.data_version)
+        return prompt, key
+    
     def query_dollar(self, question: str) -> str:
         """Consulta información sobre el dólar usando Gemini"""
         try:
-            # Obtener información disponible del servidor
-            available_types = self.get_server_data('/types')
+            intent = parse_intent(question)
+            answer = self._answer_locally(intent)
+            if answer is not None:
+                return answer
             
-            # Obtener datos actuales para contexto
-            blue_price = self.get_server_data('/dollar/blue')
-            oficial_price = self.get_server_data('/dollar/oficial')
+            with metrics.timed('prompt_build'):
+                prompt, key = self._build_prompt(question, intent)
+            cached = self.cache.get(key) if key else None
+            if cached is not None:
+                return cached
             
-            prompt = f"""
-            Sos un experto analista financiero especializado en el dólar estadounidense vs peso argentino.
-
-            DATOS ACTUALES DISPONIBLES:
-            {available_types}
-
-            EJEMPLOS DE PRECIOS ACTUALES:
-            {blue_price}
-            {oficial_price}
-
-            INSTRUCCIONES:
-            - Responde ÚNICAMENTE en español
-            - Sé claro y conciso
-            - Si preguntás por precios actuales, mencioná los tipos disponibles
-            - Si preguntás por evolución, sugerí consultar el historial
-            - Explicá las diferencias entre los tipos de dólar cuando sea relevante
-
-            PREGUNTA DEL USUARIO: {question}
-
-            Proporciona una respuesta útil basada en los datos disponibles.
-            """
-            
-            response = self.model.generate_content(prompt)
-            return response.text
+            text, _, _ = self.router.complete(prompt)
+            if key:
+                self.cache.set(key, text)
+            return text
             
         except Exception as e:
             return f"❌ Error en la consulta: {str(e)}"
+    
+    def query_dollar_stream(self, question: str):
+        """Consulta en modo streaming: devuelve la respuesta en fragmentos a medida que se genera"""
+        try:
+            intent = parse_intent(question)
+            answer = self._answer_locally(intent)
+            if answer is not None:
+                yield answer
+                return
+            
+            with metrics.timed('prompt_build'):
+                prompt, key = self._build_prompt(question, intent)
+            yield from cached_stream(self.cache, key, lambda: stream_answer(self.router, prompt))
+        except Exception as e:
+            yield f"❌ Error en la consulta: {str(e)}"
 
 def interactive_mode():
     """Modo interactivo para consultas"""
-    client = DollarClientGemini()
+    client = DollarClientGemini(list_models=os.getenv("GEMINI_LIST_MODELS") == "1")
     
     print("\n💵 CONSULTAS DE DÓLAR USD/ARS (Google Gemini)")
     print("=" * 50)
@@ -96,14 +153,16 @@ def interactive_mode():
             user_query = input("\n🔍 Tu consulta: ").strip()
             
             if user_query.lower() in ['salir', 'exit', 'quit']:
+                print(client.cache.describe())
                 print("👋 ¡Hasta luego!")
                 break
                 
             if user_query:
                 print("⏳ Consultando datos...")
-                response = client.query_dollar(user_query)
-                print(f"\n📊 Respuesta:\n{response}")
-                print("-" * 60)
+                print("\n📊 Respuesta:")
+                for chunk in client.query_dollar_stream(user_query):
+                    print(chunk, end="", flush=True)
+                print("\n" + "-" * 60)
                 
         except KeyboardInterrupt:
             print("\n👋 ¡Hasta luego!")
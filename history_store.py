@@ -0,0 +1,152 @@
+import os
+import mmap
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+COLUMNS = ('compra', 'venta', 'ts')
+
+# Nombre de directorio válido para una serie: sin separadores ni '.', así no sale de base_dir
+SERIES_NAME = re.compile(r'[\w-]+')
+
+def parse_fecha(fecha: str) -> float:
+    """Convierte una fecha ISO (con 'Z' o sin zona, asumida UTC) a epoch"""
+    parsed = datetime.fromisoformat(fecha.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+class _Column:
+    """Archivo append-only de float64 nativos, leído mediante mmap"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a+b')
+        self._map = None
+        self._mapped = 0
+
+    def append(self, value: float):
+        self._file.write(array('d', [value]).tobytes())
+        self._file.flush()
+
+    def size(self) -> int:
+        """Cantidad de valores completos en disco"""
+        return os.fstat(self._file.fileno()).st_size // 8
+
+    def view(self, n: int) -> memoryview:
+        """Vista de los primeros n valores; re-mapea sólo si el archivo creció"""
+        if n * 8 > self._mapped:
+            if self._map is not None:
+                self._map.close()
+            self._mapped = self.size() * 8
+            self._map = mmap.mmap(self._file.fileno(), self._mapped, access=mmap.ACCESS_READ)
+        return memoryview(self._map)[:n * 8].cast('d')
+
+class _Series:
+    """Serie temporal de un tipo de dólar: una columna por campo, indexada por ts"""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.columns = {name: _Column(os.path.join(directory, f"{name}.f64")) for name in COLUMNS}
+        self.last_ts = None
+
+    def length(self) -> int:
+        # El timestamp se escribe último: una fila sólo es visible cuando está completa
+        return min(column.size() for column in self.columns.values())
+
+    def append(self, ts: float, compra: float, venta: float) -> bool:
+        with self.lock:
+            if self.last_ts is None:
+                n = self.length()
+                if n:
+                    with self.columns['ts'].view(n) as ts_view:
+                        self.last_ts = ts_view[n - 1]
+            if self.last_ts is not None and ts <= self.last_ts:
+                return False
+            self.columns['compra'].append(compra)
+            self.columns['venta'].append(venta)
+            self.columns['ts'].append(ts)
+            self.last_ts = ts
+            return True
+
+    def query(self, start: float, end: float) -> Tuple[array, array, array]:
+        with self.lock:
+            n = self.length()
+            if n == 0:
+                return array('d'), array('d'), array('d')
+            with self.columns['ts'].view(n) as ts_view:
+                i = bisect_left(ts_view, start, 0, n)
+                j = bisect_right(ts_view, end, i, n)
+                ts = array('d', ts_view[i:j])
+            result = []
+            for name in ('compra', 'venta'):
+                with self.columns[name].view(n) as values:
+                    result.append(array('d', values[i:j]))
+            return ts, result[0], result[1]
+
+class HistoryStore:
+    """Almacén local de cotizaciones: un directorio columnar append-only por tipo de dólar"""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self._series: Dict[str, _Series] = {}
+        self._lock = threading.Lock()
+
+    def _directory(self, dollar_type: str) -> str:
+        """Directorio de la serie (lanza ValueError si el nombre podría salir de base_dir)"""
+        name = dollar_type.replace(' ', '_') if isinstance(dollar_type, str) else ''
+        if not SERIES_NAME.fullmatch(name):
+            raise ValueError(f"tipo de dólar inválido para el historial: {dollar_type!r}")
+        return os.path.join(self.base_dir, name)
+
+    def _get_series(self, dollar_type: str, create: bool = True) -> Optional[_Series]:
+        """Serie del tipo; sin create, None si nunca se registró (no se crean archivos al consultar)"""
+        series = self._series.get(dollar_type)
+        if series is None:
+            directory = self._directory(dollar_type)
+            if not create and not os.path.isdir(directory):
+                return None
+            with self._lock:
+                series = self._series.get(dollar_type)
+                if series is None:
+                    series = self._series[dollar_type] = _Series(directory)
+        return series
+
+    def append(self, dollar_type: str, ts: float, compra: float, venta: float) -> bool:
+        """Agrega una cotización si es posterior a la última registrada"""
+        return self._get_series(dollar_type).append(ts, float(compra or 0), float(venta or 0))
+
+    def append_rows(self, rows: Iterable[Tuple[str, float, float, float]]) -> int:
+        """Registra filas (tipo, ts, compra, venta); devuelve cuántas eran nuevas"""
+        added = 0
+        for dollar_type, ts, compra, venta in rows:
+            try:
+                if self.append(dollar_type, ts, compra, venta):
+                    added += 1
+            except (TypeError, ValueError):
+                continue
+        return added
+
+    def append_snapshot(self, data: Dict[str, Dict]) -> int:
+        """Registra todas las cotizaciones de un snapshot (fechas ISO); devuelve cuántas eran nuevas"""
+        rows = []
+        for key, quote in data.items():
+            try:
+                rows.append((key, parse_fecha(quote['fecha']), quote['compra'], quote['venta']))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+        return self.append_rows(rows)
+
+    def query(self, dollar_type: str, start: float, end: float) -> Tuple[array, array, array]:
+        """Devuelve (ts, compra, venta) dentro de [start, end] en O(log n + ventana).
+
+        Un tipo sin registros devuelve series vacías; uno con un nombre inválido lanza ValueError.
+        """
+        series = self._get_series(dollar_type, create=False)
+        if series is None:
+            return array('d'), array('d'), array('d')
+        return series.query(start, end)
@@ -0,0 +1,172 @@
+import re
+from typing import NamedTuple, Optional, Tuple
+from llm_cache import normalize_question
+from prompt_builder import detect_types
+
+PRICE = "price"
+TYPES = "types"
+HISTORY = "history"
+CONVERT = "convert"
+ALERT = "alert"
+REASONING = "reasoning"
+
+MAX_DAYS = 3650
+
+class Intent(NamedTuple):
+    kind: str
+    dollar_types: Tuple[str, ...]
+    # Monto a convertir (CONVERT) y dirección: usd_ars | ars_usd
+    amount: Optional[float] = None
+    direction: str = 'usd_ars'
+
+    @property
+    def needs_llm(self) -> bool:
+        """Precios, tipos y conversiones con un monto claro se responden con los datos, sin LLM"""
+        return not (self.kind in (PRICE, TYPES) or (self.kind == CONVERT and self.amount is not None))
+
+# Unidades de tiempo -> días
+UNITS = {
+    'dia': 1, 'dias': 1,
+    'semana': 7, 'semanas': 7,
+    'quincena': 15, 'quincenas': 15,
+    'mes': 30, 'meses': 30,
+    'ano': 365, 'anos': 365
+}
+
+NUMBER_WORDS = {
+    'un': 1, 'una': 1, 'uno': 1, 'dos': 2, 'tres': 3, 'cuatro': 4, 'cinco': 5,
+    'seis': 6, 'siete': 7, 'ocho': 8, 'nueve': 9, 'diez': 10, 'quince': 15,
+    'veinte': 20, 'treinta': 30, 'sesenta': 60, 'noventa': 90
+}
+
+_NUMBER = re.compile(r"^\d{1,4}$")
+# Monto con separadores opcionales: 1500, 1.500, 1,5, 1.500,50
+_AMOUNT = re.compile(r"^\d+(?:[.,]\d+)*$")
+
+# Moneda del monto -> dirección de la conversión
+CURRENCY_WORDS = {
+    'usd': 'usd_ars', 'dolar': 'usd_ars', 'dolares': 'usd_ars', 'verdes': 'usd_ars',
+    'pesos': 'ars_usd', 'peso': 'ars_usd', 'ars': 'ars_usd'
+}
+CONVERT_PREFIXES = ('convert', 'conversi', 'convier', 'pasame')
+# Pedidos de alertas ("avisame cuando el blue supere 1500"): los atiende el LLM con las herramientas de alertas
+ALERT_PREFIXES = ('avis', 'alert', 'notific')
+ALERT_WORDS = {'supere', 'superen', 'pase', 'pasen', 'baje', 'bajen', 'perfore', 'perforen', 'llegue', 'toque'}
+
+# Palabras (normalizadas) que indican cada intención
+HISTORY_WORDS = {'ultimos', 'ultimas', 'ultimo', 'ultima', 'pasado', 'pasada', 'ayer'}
+HISTORY_PREFIXES = ('evoluc', 'histori', 'tendenc', 'variac')
+TYPES_WORDS = {'tipos', 'disponibles', 'cuales'}
+PRICE_WORDS = {'precio', 'precios', 'cotizacion', 'cotizaciones', 'cuanto', 'vale', 'valor', 'sale', 'compra', 'venta', 'esta'}
+# Cualquier marca de razonamiento manda la consulta al LLM
+REASONING_PHRASES = ('por que', 'que es', 'que son', 'que significa', 'va a', 'me conviene')
+REASONING_PREFIXES = (
+    'convien', 'conven', 'recomend', 'deber', 'explic', 'predic', 'pronost', 'proyec', 'anali',
+    'compar', 'diferenc', 'ahorr', 'invert', 'invier', 'opin', 'brecha', 'subir',
+    'bajar', 'suba', 'baja', 'riesgo', 'estrateg', 'mejor', 'peor', 'porque'
+)
+
+def parse_days(words) -> Optional[int]:
+    """Cantidad de días pedida ('últimos 30 días', 'dos semanas', 'el último mes'), o None"""
+    for i, word in enumerate(words):
+        unit = UNITS.get(word)
+        if unit is None:
+            continue
+        previous = words[i - 1] if i > 0 else ""
+        if _NUMBER.match(previous):
+            count = int(previous)
+        else:
+            count = NUMBER_WORDS.get(previous, 1)
+        return max(1, min(count * unit, MAX_DAYS))
+    if 'ayer' in words:
+        return 1
+    return None
+
+def parse_amount(word: str) -> Optional[float]:
+    """Monto escrito como en Argentina o en inglés: "1.500" y "1,500" son 1500; "1,5" y "2.5" son decimales"""
+    if not _AMOUNT.match(word):
+        return None
+    separators = [c for c in word if c in '.,']
+    if not separators:
+        return float(word)
+    last = word.rfind(separators[-1])
+    if len(set(separators)) == 2 or len(word) - last - 1 != 3:
+        # El último separador es el decimal (con un solo tipo de separador, si no deja 3 dígitos)
+        integer, decimals = word[:last], word[last + 1:]
+    else:
+        integer, decimals = word, ''
+    integer = integer.replace('.', '').replace(',', '')
+    return float(f"{integer}.{decimals}" if decimals else integer)
+
+def parse_conversion(words) -> Tuple[Optional[float], Optional[str]]:
+    """Monto junto a una moneda ('1500 usd', '200 mil pesos', 'usd 300'): (monto, dirección) o (None, None)"""
+    for i, word in enumerate(words):
+        amount = parse_amount(word)
+        if amount is None:
+            continue
+        following = words[i + 1:i + 3]
+        if following[:1] == ['mil']:
+            amount *= 1000
+            following = following[1:]
+        unit = following[0] if following else None
+        if unit not in CURRENCY_WORDS and i > 0:
+            unit = words[i - 1]
+        if unit in CURRENCY_WORDS:
+            return amount, CURRENCY_WORDS[unit]
+    return None, None
+
+def parse_intent(question: str) -> Intent:
+    """Clasifica la consulta y extrae tipos de dólar y el monto a convertir, sin llamar al LLM"""
+    text = normalize_question(question)
+    words = text.split()
+    padded = f" {text} "
+    dollar_types = tuple(detect_types(question))
+    days = parse_days(words)
+    amount, direction = parse_conversion(words)
+
+    reasoning = (
+        any(f" {phrase} " in padded for phrase in REASONING_PHRASES)
+        or any(word.startswith(REASONING_PREFIXES) for word in words)
+    )
+    history = (
+        days is not None
+        or any(word in HISTORY_WORDS or word.startswith(HISTORY_PREFIXES) for word in words)
+    )
+    alert = any(word.startswith(ALERT_PREFIXES) or word in ALERT_WORDS for word in words)
+    convert = amount is not None or any(word.startswith(CONVERT_PREFIXES) for word in words)
+
+    if alert:
+        kind = ALERT
+    elif history:
+        kind = HISTORY
+    elif reasoning:
+        kind = REASONING
+    elif convert:
+        kind = CONVERT
+    elif any(word in TYPES_WORDS for word in words) and not dollar_types:
+        kind = TYPES
+    elif dollar_types or any(word in PRICE_WORDS for word in words):
+        kind = PRICE
+    else:
+        kind = REASONING
+    return Intent(kind, dollar_types, amount, direction or 'usd_ars')
+
+def answer_locally(intent: Intent, transport) -> Optional[str]:
+    """Responde precios, tipos y conversiones directamente con los datos del transporte MCP.
+
+    Devuelve None si la consulta necesita el LLM o si los datos no están disponibles.
+    """
+    if intent.needs_llm:
+        return None
+    try:
+        if intent.kind == TYPES:
+            answer = transport.get_dollar_types()
+        elif intent.kind == CONVERT:
+            answer = transport.convert_amounts([intent.amount], intent.direction, list(intent.dollar_types) or None)
+        elif len(intent.dollar_types) == 1:
+            answer = transport.get_dollar_price(intent.dollar_types[0])
+        else:
+            answer = transport.get_dollars(list(intent.dollar_types))
+    except Exception:
+        return None
+    return None if answer.startswith("❌") else answer
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import Callable, FrozenSet, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import metrics
+
+# Comentario SSE periódico para que proxies y clientes no corten la conexión (segundos)
+HEARTBEAT = 15
+# Cambios de snapshot que se conservan para reenviar a clientes que reconectan con Last-Event-ID
+BACKLOG = 256
+
+def _version(last_event_id) -> Optional[int]:
+    try:
+        return int(last_event_id)
+    except (TypeError, ValueError):
+        return None
+
+class Broadcaster:
+    """Reparte los cambios del snapshot a los suscriptores como eventos SSE.
+
+    Cada cambio se guarda una sola vez como delta (sólo las cotizaciones que
+    cambiaron) y su texto SSE se arma una vez por filtro de tipos, así que un
+    refresh cuesta lo mismo con diez suscriptores que con miles. Los clientes
+    nuevos reciben primero el snapshot completo (evento "snapshot") y después
+    los deltas (evento "delta"); el id de cada evento es la versión del snapshot.
+    """
+
+    def __init__(self, format_meta: Callable[[dict], dict], format_quote: Callable[[str, dict], dict], backlog: int = BACKLOG):
+        self.format_meta = format_meta
+        self.format_quote = format_quote
+        # {'version', 'snapshot', 'changed', 'removed', 'frames'} por cada cambio publicado
+        self._events = deque(maxlen=backlog)
+        self._condition = threading.Condition()
+        self._callbacks: List[Callable[[], None]] = []
+        self.subscribers = 0
+        metrics.STREAM_SUBSCRIBERS.set_function(lambda: self.subscribers)
+
+    def publish(self, snapshot: dict):
+        """Registra un snapshot nuevo; se ignora si la versión no cambió"""
+        with self._condition:
+            previous = self._events[-1]['snapshot'] if self._events else None
+            if previous is not None and previous['version'] == snapshot['version']:
+                return
+            old = previous['data'] if previous else {}
+            self._events.append({
+                'version': snapshot['version'],
+                'snapshot': snapshot,
+                'changed': {key: quote for key, quote in snapshot['data'].items() if old.get(key) != quote},
+                'removed': [key for key in old if key not in snapshot['data']],
+                # (evento, filtro) -> bytes; se completa a medida que los suscriptores lo piden
+                'frames': {}
+            })
+            self._condition.notify_all()
+            callbacks = list(self._callbacks)
+        metrics.STREAM_EVENTS.inc()
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """callback() se llama (desde el hilo que publica) con cada cambio"""
+        with self._condition:
+            self._callbacks.append(callback)
+
+    @property
+    def version(self) -> Optional[int]:
+        events = self._events
+        return events[-1]['version'] if events else None
+
+    def frames_after(self, last_version: Optional[int], keys: Optional[FrozenSet[str]] = None) -> Tuple[List[bytes], Optional[int]]:
+        """Eventos SSE que le faltan a un suscriptor que vio hasta last_version.
+
+        keys filtra por clave del snapshot (None = todas). Devuelve (eventos, nueva última versión).
+        """
+        with self._condition:
+            events = list(self._events)
+        if not events or events[-1]['version'] == last_version:
+            return [], last_version
+
+        versions = [event['version'] for event in events]
+        if last_version not in versions:
+            # Suscriptor nuevo o que se perdió cambios: snapshot completo de la última versión
+            latest = events[-1]
+            return [self._frame(latest, "snapshot", keys)], latest['version']
+
+        frames = []
+        for event in events[versions.index(last_version) + 1:]:
+            frame = self._frame(event, "delta", keys)
+            if frame:
+                frames.append(frame)
+        return frames, events[-1]['version']
+
+    def _frame(self, event: dict, kind: str, keys: Optional[FrozenSet[str]]) -> bytes:
+        cache_key = (kind, keys)
+        frame = event['frames'].get(cache_key)
+        if frame is not None:
+            return frame
+        snapshot = event['snapshot']
+        quotes = snapshot['data'] if kind == "snapshot" else event['changed']
+        removed = [] if kind == "snapshot" else event['removed']
+        if keys is not None:
+            quotes = {key: quote for key, quote in quotes.items() if key in keys}
+            removed = [key for key in removed if key in keys]
+        if kind == "delta" and not quotes and not removed:
+            # Nada que le interese a este filtro
+            frame = b""
+        else:
+            payload = dict(self.format_meta(snapshot), cotizaciones=[self.format_quote(key, quote) for key, quote in quotes.items()])
+            if removed:
+                payload['eliminados'] = removed
+            data = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+            frame = f"id: {event['version']}\nevent: {kind}\ndata: {data}\n\n".encode("utf-8")
+        # Carrera benigna: dos hilos pueden armar el mismo texto, el resultado es idéntico
+        event['frames'][cache_key] = frame
+        return frame
+
+    def _connected(self, delta: int):
+        with self._condition:
+            self.subscribers += delta
+
+    def iter_sse(self, last_event_id=None, keys: Optional[FrozenSet[str]] = None, heartbeat: float = HEARTBEAT) -> Iterator[bytes]:
+        """Flujo SSE bloqueante para servidores WSGI.
+
+        Cada conexión ocupa un hilo del servidor mientras dura; para muchos
+        clientes conviene StreamServer, que atiende a todos desde un event loop.
+        """
+        last_version = _version(last_event_id)
+        self._connected(1)
+        try:
+            yield f"retry: {int(heartbeat * 200)}\n\n".encode("utf-8")
+            while True:
+                frames, last_version = self.frames_after(last_version, keys)
+                for frame in frames:
+                    yield frame
+                with self._condition:
+                    changed = self._condition.wait_for(lambda: self.version != last_version, heartbeat)
+                if not changed:
+                    yield b": ping\n\n"
+        finally:
+            self._connected(-1)
+
+class StreamServer:
+    """Servidor SSE asíncrono: un event loop en un solo hilo atiende a todos los suscriptores.
+
+    Cada cambio del snapshot despierta a los clientes con un único future
+    compartido y cada uno escribe el texto ya armado por el Broadcaster. Un
+    cliente que no lee (buffer de salida lleno) se desconecta en lugar de
+    acumular memoria. Sólo atiende GET /stream?types=blue,oficial.
+    """
+
+    def __init__(self, broadcaster: Broadcaster, resolve_types: Callable[[str], Optional[FrozenSet[str]]],
+                 on_subscribe: Callable[[], object] = None, heartbeat: float = HEARTBEAT, max_buffer: int = 256 * 1024):
+        self.broadcaster = broadcaster
+        # "blue,oficial" -> claves del snapshot (None = todas); ValueError si no hay tipos válidos
+        self.resolve_types = resolve_types
+        # Se llama (en un hilo del pool) antes de atender a cada suscriptor, p. ej. para asegurar el snapshot
+        self.on_subscribe = on_subscribe
+        self.heartbeat = heartbeat
+        self.max_buffer = max_buffer
+        self.loop = None
+        self.server = None
+        self._changed = None
+        self._thread = None
+
+    def start(self, host: str, port: int, reuse_port: bool = False) -> "StreamServer":
+        """Abre el socket y atiende en un hilo propio; lanza la excepción si no pudo abrirlo"""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.server = self.loop.run_until_complete(
+                    asyncio.start_server(self._handle, host, port, reuse_port=reuse_port or None)
+                )
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            self._changed = self.loop.create_future()
+            self.broadcaster.add_callback(lambda: self.loop.call_soon_threadsafe(self._wake))
+            ready.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True, name="sse")
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _wake(self):
+        # Un solo future para todos: se resuelve y se reemplaza por el del próximo cambio
+        changed, self._changed = self._changed, self.loop.create_future()
+        changed.set_result(None)
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            await self._reply(writer, 400, "solicitud inválida")
+            return
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        if method != "GET" or url.path != "/stream":
+            await self._reply(writer, 404, "sólo GET /stream")
+            return
+        try:
+            keys = self.resolve_types(parse_qs(url.query).get('types', [''])[0])
+        except ValueError as e:
+            await self._reply(writer, 400, str(e))
+            return
+        if self.on_subscribe is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.on_subscribe)
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: keep-alive\r\n"
+            b"X-Accel-Buffering: no\r\n\r\n"
+            + f"retry: {int(self.heartbeat * 200)}\n\n".encode("utf-8")
+        )
+        last_version = _version(headers.get("last-event-id"))
+        self.broadcaster._connected(1)
+        try:
+            while not writer.is_closing():
+                frames, last_version = self.broadcaster.frames_after(last_version, keys)
+                if frames:
+                    writer.writelines(frames)
+                if writer.transport.get_write_buffer_size() > self.max_buffer:
+                    metrics.STREAM_DROPPED.inc()
+                    break
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._changed), self.heartbeat)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+        finally:
+            self.broadcaster._connected(-1)
+            writer.close()
+
+    async def _reply(self, writer, status: int, message: str):
+        body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {'Bad Request' if status == 400 else 'Not Found'}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + body
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
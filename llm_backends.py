@@ -0,0 +1,361 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from prompt_builder import SYSTEM_INSTRUCTION, TOOLS_SYSTEM_INSTRUCTION
+from resilience import CircuitBreaker, HedgeFailed, LatencyTracker, hedge_delay, hedged_call
+import metrics
+
+# Proveedores habilitados, en orden de preferencia mientras no haya latencias medidas
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "gemini,anthropic")
+# Tiempo máximo de una respuesta, sumando todos los proveedores (segundos)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# Espera antes de cubrirse con otro proveedor mientras no haya suficientes latencias medidas (segundos)
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "3"))
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-5-haiku-latest")
+ANTHROPIC_MAX_TOKENS = int(os.getenv("ANTHROPIC_MAX_TOKENS", "1024"))
+
+# (texto, uso de tokens)
+Completion = Tuple[str, Dict[str, int]]
+# Parte de un turno, en el formato de contenidos de Gemini que usan todos los proveedores:
+# {"text": ...}, {"function_call": {"name", "args"}} o {"function_response": {"name", "response": {"result"}}}
+Part = Dict[str, Any]
+
+class LLMUnavailable(Exception):
+    """Ningún proveedor de LLM respondió"""
+
+class LLMBackend:
+    """Un proveedor de LLM con su circuit breaker, latencias y tasa de error recientes"""
+    name = ""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30, window: int = 50):
+        self.breaker = CircuitBreaker(self.name, failure_threshold, reset_timeout)
+        self.latency = LatencyTracker(window)
+        # True por cada llamada fallida de las últimas window
+        self._outcomes = deque(maxlen=window)
+
+    def available(self) -> bool:
+        """False si el proveedor no está configurado (por ejemplo, sin API key)"""
+        return True
+
+    @property
+    def error_rate(self) -> float:
+        outcomes = list(self._outcomes)
+        return sum(outcomes) / len(outcomes) if outcomes else 0.0
+
+    def expected_latency(self, default: float) -> float:
+        """Tiempo esperado hasta una respuesta válida: la mediana dividida por la tasa de éxito"""
+        p50 = self.latency.percentile(50)
+        return (p50 if p50 is not None else default) / max(0.05, 1 - self.error_rate)
+
+    def complete(self, prompt: str, timeout: float) -> Completion:
+        """Genera la respuesta; registra latencia y resultado en el breaker"""
+        return self._recorded(lambda: self._complete(prompt, timeout))
+
+    def turn(self, contents: List[dict], tools: Optional[List[dict]], timeout: float) -> List[Part]:
+        """Un turno del modelo sobre la conversación contents: texto o llamadas a tools (esquemas MCP)"""
+        return self._recorded(lambda: list(self._turn(contents, tools, timeout, stream=False)))
+
+    def open_stream(self, contents: List[dict], tools: Optional[List[dict]], timeout: float) -> Iterator[Part]:
+        """Empieza un turno en streaming y espera su primera parte.
+
+        La latencia que se registra es la de la primera parte, que es la que decide el
+        hedging; una falla en el resto del turno también cuenta para el breaker.
+        """
+        def start():
+            parts = iter(self._turn(contents, tools, timeout, stream=True))
+            return next(parts, None), parts
+
+        first, parts = self._recorded(start)
+        return self._rest(first, parts)
+
+    def _rest(self, first: Optional[Part], parts: Iterator[Part]) -> Iterator[Part]:
+        if first is not None:
+            yield first
+        try:
+            yield from parts
+        except Exception:
+            self._failed()
+            raise
+
+    def _recorded(self, call: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = call()
+        except Exception:
+            self._failed()
+            raise
+        elapsed = time.perf_counter() - started
+        self._outcomes.append(False)
+        self.latency.observe(elapsed)
+        metrics.LLM_BACKEND_LATENCY.observe(elapsed, backend=self.name)
+        self.breaker.record_success()
+        return result
+
+    def _failed(self):
+        self._outcomes.append(True)
+        self.breaker.record_failure()
+        metrics.LLM_BACKEND_ERRORS.inc(backend=self.name)
+
+    def _complete(self, prompt: str, timeout: float) -> Completion:
+        raise NotImplementedError
+
+    def _turn(self, contents: List[dict], tools: Optional[List[dict]], timeout: float, stream: bool) -> Iterable[Part]:
+        raise NotImplementedError
+
+class GeminiBackend(LLMBackend):
+    """Gemini a través de generate(prompt, timeout) y run_turn(contents, tools, timeout, stream),
+    que ya registran sus llamadas y tokens (ver gemini_autogen_adapter.gemini_backend)"""
+    name = "gemini"
+
+    def __init__(self, generate: Callable[[str, float], Completion],
+                 run_turn: Callable[[List[dict], Optional[List[dict]], float, bool], Iterable[Part]], **kwargs):
+        super().__init__(**kwargs)
+        self.generate = generate
+        self.run_turn = run_turn
+
+    def _complete(self, prompt: str, timeout: float) -> Completion:
+        return self.generate(prompt, timeout)
+
+    def _turn(self, contents: List[dict], tools: Optional[List[dict]], timeout: float, stream: bool) -> Iterable[Part]:
+        return self.run_turn(contents, tools, timeout, stream)
+
+class AnthropicBackend(LLMBackend):
+    """Claude con la API de Anthropic; el SDK se importa con la primera llamada"""
+    name = "anthropic"
+
+    def __init__(self, api_key: Optional[str] = None, model: str = ANTHROPIC_MODEL,
+                 max_tokens: int = ANTHROPIC_MAX_TOKENS, system: str = SYSTEM_INSTRUCTION,
+                 tools_system: str = TOOLS_SYSTEM_INSTRUCTION, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
+        self.model = model
+        self.max_tokens = max_tokens
+        self.system = system
+        self.tools_system = tools_system
+        self._client = None
+
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    def _get_client(self):
+        if self._client is None:
+            import anthropic
+            # Sin reintentos del SDK: ante una falla el router pasa a otro proveedor
+            self._client = anthropic.Anthropic(api_key=self.api_key, max_retries=0)
+        return self._client
+
+    def _request(self, contents: List[dict], tools: Optional[List[dict]], timeout: float) -> dict:
+        request = {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "system": self.tools_system if tools else self.system,
+            "messages": anthropic_messages(contents),
+            "timeout": timeout
+        }
+        if tools:
+            request["tools"] = anthropic_tools(tools)
+        return request
+
+    def _create(self, request: dict):
+        try:
+            with metrics.timed('llm_call'):
+                response = self._get_client().messages.create(**request)
+        except Exception:
+            metrics.LLM_CALLS.inc(mode="blocking", status="error")
+            raise
+        metrics.LLM_CALLS.inc(mode="blocking", status="ok")
+        return response
+
+    def _complete(self, prompt: str, timeout: float) -> Completion:
+        response = self._create(self._request([{"role": "user", "parts": [{"text": prompt}]}], None, timeout))
+        text = "".join(block.text for block in response.content if getattr(block, "type", "") == "text")
+        return text, _usage(response.usage.input_tokens or 0, response.usage.output_tokens or 0)
+
+    def _turn(self, contents: List[dict], tools: Optional[List[dict]], timeout: float, stream: bool) -> Iterable[Part]:
+        request = self._request(contents, tools, timeout)
+        if stream:
+            return self._stream(request)
+        response = self._create(request)
+        _usage(response.usage.input_tokens or 0, response.usage.output_tokens or 0)
+        parts = []
+        for block in response.content:
+            kind = getattr(block, "type", "")
+            if kind == "text" and block.text:
+                parts.append({"text": block.text})
+            elif kind == "tool_use":
+                parts.append({"function_call": {"name": block.name, "args": dict(block.input or {})}})
+        return parts
+
+    def _stream(self, request: dict) -> Iterator[Part]:
+        """Partes de una respuesta en streaming: el texto a medida que llega y cada
+        llamada a una herramienta cuando terminan de llegar sus argumentos"""
+        started = time.perf_counter()
+        first = True
+        prompt_tokens = completion_tokens = 0
+        # Índice del bloque -> [herramienta, argumentos en JSON recibidos hasta ahora]
+        calls = {}
+        try:
+            for event in self._get_client().messages.create(stream=True, **request):
+                part = None
+                if event.type == "message_start":
+                    prompt_tokens = event.message.usage.input_tokens or 0
+                elif event.type == "message_delta":
+                    completion_tokens = event.usage.output_tokens or 0
+                elif event.type == "content_block_start" and event.content_block.type == "tool_use":
+                    calls[event.index] = [event.content_block.name, ""]
+                elif event.type == "content_block_delta":
+                    if event.delta.type == "text_delta" and event.delta.text:
+                        part = {"text": event.delta.text}
+                    elif event.delta.type == "input_json_delta":
+                        calls[event.index][1] += event.delta.partial_json
+                elif event.type == "content_block_stop" and event.index in calls:
+                    name, arguments = calls.pop(event.index)
+                    part = {"function_call": {"name": name, "args": json.loads(arguments or "{}")}}
+                if part is not None:
+                    if first:
+                        metrics.STAGE_LATENCY.observe(time.perf_counter() - started, stage="llm_first_token")
+                        first = False
+                    yield part
+        except Exception:
+            metrics.LLM_CALLS.inc(mode="stream", status="error")
+            raise
+        metrics.STAGE_LATENCY.observe(time.perf_counter() - started, stage="llm_call")
+        metrics.LLM_CALLS.inc(mode="stream", status="ok")
+        _usage(prompt_tokens, completion_tokens)
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    """Suma los tokens a las métricas y los devuelve con el formato de chat completion"""
+    metrics.record_llm_usage(prompt_tokens, completion_tokens)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+def anthropic_messages(contents: List[dict]) -> List[dict]:
+    """Conversación en el formato de Gemini (ver Part) como mensajes de la API de Anthropic.
+
+    Gemini relaciona cada function_response con su llamada por el orden; Anthropic
+    por id: cada tool_use recibe uno y el tool_result que le corresponde lo repite.
+    """
+    messages = []
+    # Ids de las llamadas del último turno del modelo que todavía no tienen resultado
+    pending = []
+    for turn, content in enumerate(contents):
+        blocks = []
+        for part in content["parts"]:
+            if "text" in part:
+                blocks.append({"type": "text", "text": part["text"]})
+            elif "function_call" in part:
+                call = part["function_call"]
+                call_id = f"toolu_{turn}_{len(blocks)}"
+                pending.append(call_id)
+                blocks.append({"type": "tool_use", "id": call_id, "name": call["name"], "input": call.get("args") or {}})
+            elif "function_response" in part:
+                result = part["function_response"]["response"].get("result", "")
+                blocks.append({"type": "tool_result", "tool_use_id": pending.pop(0), "content": str(result)})
+        messages.append({"role": "assistant" if content["role"] == "model" else "user", "content": blocks})
+    return messages
+
+def anthropic_tools(tools: List[dict]) -> List[dict]:
+    """Herramientas de DollarMCPServer.get_tools() en el formato de la API de Anthropic (JSON Schema)"""
+    return [
+        {
+            "name": tool["name"],
+            "description": tool.get("description", ""),
+            "input_schema": tool.get("parameters") or {"type": "object", "properties": {}}
+        }
+        for tool in tools
+    ]
+
+def default_backends(gemini: GeminiBackend) -> List[LLMBackend]:
+    """Backends de LLM_BACKENDS que están configurados, en orden"""
+    factories = {
+        "gemini": lambda: gemini,
+        "anthropic": lambda: AnthropicBackend()
+    }
+    backends = [factories[name.strip()]() for name in LLM_BACKENDS.split(",") if name.strip() in factories]
+    return [backend for backend in backends if backend.available()]
+
+class LLMRouter:
+    """Reparte las consultas entre varios proveedores de LLM con hedging.
+
+    Cada consulta va primero al proveedor con menor latencia esperada (mediana
+    reciente penalizada por su tasa de error) y, si no respondió dentro de su p95,
+    se lanza la misma consulta al siguiente sin cancelar la primera: gana la que
+    llegue antes. Los proveedores con el circuito abierto se saltean, así que una
+    caída no suma esperas.
+    """
+
+    def __init__(self, backends: List[LLMBackend], timeout: float = LLM_TIMEOUT,
+                 hedge_delay: float = LLM_HEDGE_DELAY, min_hedge_delay: float = 0.5, max_workers: int = 32):
+        if not backends:
+            raise ValueError("❌ No hay proveedores de LLM configurados")
+        self.backends = backends
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        # Las consultas de respaldo que pierden terminan en segundo plano y siguen ocupando un hilo
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        for backend in backends:
+            metrics.LLM_BACKEND_CIRCUIT.set_function(lambda b=backend: 0 if b.breaker.state == CircuitBreaker.CLOSED else 1, backend=backend.name)
+
+    def ranked(self) -> List[LLMBackend]:
+        """Backends en el orden en que se prueban: circuito cerrado primero, después por latencia esperada"""
+        return sorted(self.backends, key=lambda backend: (
+            backend.breaker.state != CircuitBreaker.CLOSED,
+            backend.expected_latency(self.hedge_delay)
+        ))
+
+    def _delay(self, backend: LLMBackend) -> float:
+        return hedge_delay(backend.latency, self.hedge_delay, self.min_hedge_delay)
+
+    def complete(self, prompt: str) -> Tuple[str, Dict[str, int], str]:
+        """Devuelve (texto, uso de tokens, nombre del proveedor que respondió)"""
+        (text, usage), backend = self._hedged(lambda backend, timeout: backend.complete(prompt, timeout))
+        return text, usage, backend.name
+
+    def turn(self, contents: List[dict], tools: Optional[List[dict]] = None) -> Tuple[List[Part], str]:
+        """Un turno de function calling (ver LLMBackend.turn); devuelve (partes, proveedor)"""
+        parts, backend = self._hedged(lambda backend, timeout: backend.turn(contents, tools, timeout))
+        return parts, backend.name
+
+    def stream(self, contents: List[dict], tools: Optional[List[dict]] = None) -> Tuple[Iterator[Part], str]:
+        """Como turn(), en streaming: el hedging se decide con la primera parte de cada proveedor.
+
+        Una vez elegido el proveedor ya no se cambia (su texto puede estar mostrándose),
+        y las respuestas que perdieron quedan sin leer.
+        """
+        parts, backend = self._hedged(lambda backend, timeout: backend.open_stream(contents, tools, timeout))
+        return parts, backend.name
+
+    def _hedged(self, call: Callable[[LLMBackend, float], Any]) -> Tuple[Any, LLMBackend]:
+        try:
+            result, backend = hedged_call(
+                self.ranked(), call, self._delay, self.timeout, self._executor,
+                on_hedge=lambda backend: metrics.LLM_BACKEND_HEDGES.inc(backend=backend.name)
+            )
+        except HedgeFailed as e:
+            if e.all_open:
+                raise LLMUnavailable("todos los proveedores de LLM tienen el circuito abierto")
+            raise LLMUnavailable(f"ningún proveedor de LLM respondió ({str(e) or f'sin respuesta en {self.timeout:.0f} s'})")
+        metrics.LLM_BACKEND_WINS.inc(backend=backend.name)
+        return result, backend
+
+    def describe(self) -> List[Dict]:
+        return [
+            {
+                "backend": backend.name,
+                "circuito": backend.breaker.state,
+                "errores": round(backend.error_rate, 3),
+                "p50_ms": _ms(backend.latency.percentile(50)),
+                "p95_ms": _ms(backend.latency.percentile(95))
+            }
+            for backend in self.backends
+        ]
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
@@ -0,0 +1,86 @@
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Optional, Tuple
+
+# Signos, salvo el punto o la coma entre dígitos: "1.500" y "1,500" son montos distintos
+_PUNCTUATION = re.compile(r"(?!(?<=\d)[.,](?=\d))[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+def normalize_question(text: str) -> str:
+    """Forma canónica de una consulta: minúsculas, sin tildes, sin signos (salvo separadores de números) y con espacios simples"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+def make_key(text: str, data_version: Optional[Hashable] = None) -> Tuple[str, Optional[Hashable]]:
+    """Clave de cache: consulta normalizada + versión de los datos usados en el prompt"""
+    return normalize_question(text), data_version
+
+class LLMResponseCache:
+    """Cache LRU acotada con vencimiento por TTL para respuestas del LLM"""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+    def describe(self) -> str:
+        stats = self.stats()
+        return f"📦 Cache LLM: {stats['hits']} aciertos / {stats['misses']} fallos ({stats['hit_ratio']:.0%})"
+
+def cached_stream(cache: LLMResponseCache, key: Optional[Hashable], produce: Callable[[], Iterable[str]]) -> Iterator[str]:
+    """Itera los fragmentos de produce() y, si la respuesta se completa, guarda el texto entero.
+
+    Con un acierto de cache se devuelve la respuesta completa como un único fragmento.
+    """
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    for chunk in produce():
+        parts.append(chunk)
+        yield chunk
+    if key is not None:
+        cache.set(key, "".join(parts))
@@ -1,9 +1,189 @@
 import asyncio
-import requests
-from typing import Dict, Any
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+import metrics
+
+class HTTPTransport:
+    """Transporte remoto: consulta la API REST de dollar_server.py"""
+    
+    def __init__(self, base_url: str = None, timeout: Tuple[float, float] = (2, 10), pool_size: int = 16):
+        self.base_url = base_url or os.getenv("DOLLAR_SERVER_URL", "http://localhost:5000")
+        # (conexión, lectura) en segundos
+        self.timeout = timeout
+        
+        # requests se importa recién al crear el transporte (no al importar el módulo)
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._requests = requests
+        
+        # Pool de conexiones keep-alive compartido por todas las herramientas
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # URL -> (ETag, payload JSON) para revalidar con If-None-Match en vez de volver a descargar
+        self._etags = {}
+        self.max_cached_urls = 256
+        # Huella de las cotizaciones de la última respuesta recibida (no la versión, que
+        # reinicia con cada proceso del servidor y podría repetirse con otros datos)
+        self.data_version = None
+    
+    def get_json(self, path: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Obtiene la respuesta JSON de un endpoint, revalidando la copia local por ETag"""
+        request = self._requests.Request('GET', f'{self.base_url}{path}', params=params).prepare()
+        cached = self._etags.get(request.url)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        
+        response = self.session.get(request.url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            payload = cached[1]
+        else:
+            if 400 <= response.status_code < 500:
+                # Parámetros inválidos (p. ej. un tipo inexistente): el mensaje del servidor explica por qué
+                try:
+                    error = response.json().get("error")
+                except ValueError:
+                    error = None
+                if error:
+                    raise ValueError(error)
+            response.raise_for_status()
+            payload = response.json()
+            etag = response.headers.get("ETag")
+            if etag:
+                if len(self._etags) >= self.max_cached_urls:
+                    self._etags.clear()
+                self._etags[request.url] = (etag, payload)
+        self.data_version = payload.get("hash")
+        return payload
+    
+    def current_version(self):
+        """Huella vigente en el servidor.
+
+        data_version sólo cambia cuando llega una respuesta; antes de buscar en una
+        cache hay que preguntar. Es un GET revalidado por ETag: casi siempre un 304 sin cuerpo.
+        """
+        return self.get_json('/types').get("hash")
+    
+    def get(self, path: str, params: Dict[str, Any] = None) -> str:
+        """Obtiene el texto formateado de un endpoint"""
+        return self.get_json(path, dict(params or {}, format="text"))["result"]
+    
+    def get_dollar_price(self, dollar_type: str) -> str:
+        return self.get(f'/dollar/{dollar_type}')
+    
+    def get_dollar_history(self, dollar_type: str, days: int) -> str:
+        return self.get(f'/history/{dollar_type}/{days}')
+    
+    def get_dollar_analytics(self, dollar_types: List[str], windows: List[int]) -> str:
+        params = {
+            "types": ",".join(dollar_types),
+            "windows": ",".join(str(w) for w in windows)
+        }
+        return self.get('/analytics', params)
+    
+    def get_dollar_types(self) -> str:
+        return self.get('/types')
+    
+    def get_dollars(self, dollar_types: List[str]) -> str:
+        return self.get('/dollars', {"types": ",".join(dollar_types)})
+    
+    def get_dollars_data(self, dollar_types: List[str]) -> Dict[str, Any]:
+        return self.get_json('/dollars', {"types": ",".join(dollar_types)})
+    
+    def send(self, method: str, path: str, params: Dict[str, Any] = None, body: Dict[str, Any] = None) -> str:
+        """Envía una operación (POST/DELETE) y devuelve el texto formateado de la respuesta"""
+        response = self.session.request(method, f'{self.base_url}{path}', params=dict(params or {}, format="text"),
+                                        json=body, timeout=self.timeout)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        if "result" in payload:
+            return payload["result"]
+        raise ValueError(payload.get("error") or f"HTTP {response.status_code}")
+    
+    def convert_amounts(self, amounts: List[float], directions, dollar_types: List[str]) -> str:
+        return self.send('POST', '/convert', body={"amounts": amounts, "directions": directions, "types": dollar_types})
+    
+    def create_alert(self, user: str, dollar_type: str, threshold: float, direction: str, field: str) -> str:
+        body = {"user": user, "dollar_type": dollar_type, "threshold": threshold, "direction": direction, "field": field}
+        return self.send('POST', '/alerts', body=body)
+    
+    def list_alerts(self, user: str) -> str:
+        return self.get('/alerts', {"user": user})
+    
+    def delete_alert(self, user: str, alert_id: int) -> str:
+        return self.send('DELETE', f'/alerts/{int(alert_id)}', {"user": user})
+
+class InProcessTransport:
+    """Transporte local: llama a DollarServiceReal sin pasar por HTTP ni JSON"""
+    
+    def __init__(self, service=None):
+        if service is None:
+            from dollar_server import dollar_service as service
+        self.service = service
+    
+    @property
+    def data_version(self):
+        """Huella de las cotizaciones vigentes en el servicio"""
+        return self.service.data_version()
+    
+    def current_version(self):
+        """Huella vigente, renovando el snapshot si venció"""
+        return self.service.view().data_hash
+    
+    def get_dollar_price(self, dollar_type: str) -> str:
+        return self.service.get_dollar_price(dollar_type)
+    
+    def get_dollar_history(self, dollar_type: str, days: int) -> str:
+        return self.service.get_dollar_history(days, dollar_type)
+    
+    def get_dollar_analytics(self, dollar_types: List[str], windows: List[int]) -> str:
+        return self.service.get_dollar_analytics(dollar_types, windows)
+    
+    def get_dollar_types(self) -> str:
+        return self.service.get_dollar_types()
+    
+    def get_dollars(self, dollar_types: List[str]) -> str:
+        return self.service.get_dollars(dollar_types)
+    
+    def get_dollars_data(self, dollar_types: List[str]) -> Dict[str, Any]:
+        return self.service.get_dollars_data(dollar_types)
+    
+    def convert_amounts(self, amounts: List[float], directions, dollar_types: List[str]) -> str:
+        return self.service.convert_amounts(amounts, directions, dollar_types)
+    
+    def create_alert(self, user: str, dollar_type: str, threshold: float, direction: str, field: str) -> str:
+        return self.service.create_alert(user, dollar_type, threshold, direction, field)
+    
+    def list_alerts(self, user: str) -> str:
+        return self.service.list_alerts(user)
+    
+    def delete_alert(self, user: str, alert_id: int) -> str:
+        return self.service.delete_alert(user, alert_id)
+
+TRANSPORTS = {
+    "http": HTTPTransport,
+    "inprocess": InProcessTransport
+}
+
+# Herramientas que modifican estado: sus resultados no se reutilizan
+MUTATING_TOOLS = frozenset({"create_price_alert", "delete_price_alert"})
 
 class DollarMCPServer:
-    def __init__(self):
+    def __init__(self, transport=None, max_workers: int = 16):
+        # Sin transporte explícito se crea en el primer uso según MCP_TRANSPORT (http | inprocess)
+        self._transport = transport
+        self._transport_lock = threading.Lock()
+        
+        # Las llamadas HTTP bloqueantes corren en este pool, fuera del event loop
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mcp-tool")
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        
         self.tools = {
             "get_dollar_price": {
                 "name": "get_dollar_price",
@@ -20,6 +200,21 @@ class DollarMCPServer:
                     "required": ["dollar_type"]
                 }
             },
+            "get_dollars": {
+                "name": "get_dollars",
+                "description": "Obtiene varias cotizaciones en una sola consulta, todas del mismo momento. Sin tipos devuelve todas",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "dollar_types": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Tipos de dólar: blue, oficial, bolsa, liqui, turista",
+                            "default": []
+                        }
+                    }
+                }
+            },
             "get_dollar_history": {
                 "name": "get_dollar_history", 
                 "description": "Obtiene el historial del dólar de los últimos días",
@@ -40,6 +235,27 @@ class DollarMCPServer:
                     "required": ["dollar_type", "days"]
                 }
             },
+            "get_dollar_analytics": {
+                "name": "get_dollar_analytics",
+                "description": "Analiza varios tipos de dólar a la vez: cambio, mínimo/máximo, media móvil, volatilidad y brechas Blue/Oficial y CCL/MEP",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "dollar_types": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Tipos de dólar: blue, oficial, bolsa, liqui, turista",
+                            "default": ["blue", "oficial"]
+                        },
+                        "windows": {
+                            "type": "array",
+                            "items": {"type": "integer"},
+                            "description": "Ventanas de análisis en días",
+                            "default": [7, 30]
+                        }
+                    }
+                }
+            },
             "get_dollar_types": {
                 "name": "get_dollar_types",
                 "description": "Obtiene los tipos de dólar disponibles", 
@@ -47,26 +263,185 @@ class DollarMCPServer:
                     "type": "object",
                     "properties": {}
                 }
+            },
+            "convert_amounts": {
+                "name": "convert_amounts",
+                "description": "Convierte montos entre dólares y pesos con varios tipos de dólar a la vez (usd_ars usa la compra, ars_usd la venta). Usala en lugar de hacer cuentas",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "amounts": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "description": "Montos a convertir"
+                        },
+                        "direction": {
+                            "type": "string",
+                            "description": "usd_ars: de dólares a pesos; ars_usd: de pesos a dólares",
+                            "default": "usd_ars"
+                        },
+                        "directions": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Una dirección por monto (reemplaza a direction)"
+                        },
+                        "dollar_types": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Tipos de dólar: blue, oficial, bolsa, liqui, turista (vacío = todos)",
+                            "default": []
+                        }
+                    },
+                    "required": ["amounts"]
+                }
+            },
+            "create_price_alert": {
+                "name": "create_price_alert",
+                "description": "Registra una alerta que avisa cuando una cotización o la brecha con el oficial cruza un umbral",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "dollar_type": {
+                            "type": "string",
+                            "description": "Tipo de dólar: blue, oficial, bolsa, liqui, turista"
+                        },
+                        "threshold": {
+                            "type": "number",
+                            "description": "Umbral en ARS (compra/venta) o en porcentaje (brecha)"
+                        },
+                        "direction": {
+                            "type": "string",
+                            "description": "above: avisar cuando supere el umbral; below: cuando baje del umbral",
+                            "default": "above"
+                        },
+                        "field": {
+                            "type": "string",
+                            "description": "Valor a vigilar: venta, compra o brecha (% contra el oficial)",
+                            "default": "venta"
+                        },
+                        "user": {
+                            "type": "string",
+                            "description": "Usuario dueño de la alerta",
+                            "default": "default"
+                        }
+                    },
+                    "required": ["dollar_type", "threshold"]
+                }
+            },
+            "list_price_alerts": {
+                "name": "list_price_alerts",
+                "description": "Lista las alertas pendientes y las disparadas recientemente de un usuario",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "user": {
+                            "type": "string",
+                            "description": "Usuario",
+                            "default": "default"
+                        }
+                    }
+                }
+            },
+            "delete_price_alert": {
+                "name": "delete_price_alert",
+                "description": "Elimina una alerta pendiente",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "alert_id": {
+                            "type": "integer",
+                            "description": "Número de la alerta"
+                        },
+                        "user": {
+                            "type": "string",
+                            "description": "Usuario dueño de la alerta",
+                            "default": "default"
+                        }
+                    },
+                    "required": ["alert_id"]
+                }
             }
         }
     
-    async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
-        """Ejecuta una herramienta MCP"""
+    def data_version(self):
+        """Versión de los datos que devolvieron las últimas herramientas (para claves de cache)"""
+        return getattr(self._transport, "data_version", None)
+    
+    def current_version(self):
+        """Versión vigente de los datos, consultada ahora (None si el servidor no responde)"""
+        try:
+            return self.transport.current_version()
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar la versión de los datos: {e}")
+            return None
+    
+    @property
+    def transport(self):
+        if self._transport is None:
+            with self._transport_lock:
+                if self._transport is None:
+                    self._transport = TRANSPORTS[os.getenv("MCP_TRANSPORT", "http")]()
+        return self._transport
+    
+    def set_transport(self, transport):
+        """Cambia el transporte usado por las herramientas (HTTP o en proceso)"""
+        self._transport = transport
+    
+    def get_dollars_data(self, dollar_types: List[str] = None) -> Dict[str, Any]:
+        """Cotizaciones estructuradas (no texto) para armar prompts con sólo los campos necesarios"""
+        with metrics.timed('tool_call'):
+            return self.transport.get_dollars_data(dollar_types or [])
+    
+    def _call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
+        """Ejecuta una herramienta de forma bloqueante, registrando latencia y resultado"""
+        with metrics.timed('tool_call'):
+            result = self._dispatch_tool(tool_name, arguments)
+        status = "error" if result.startswith("❌") else "ok"
+        metrics.TOOL_CALLS.inc(tool=tool_name if tool_name in self.tools else "desconocida", status=status)
+        return result
+    
+    def _dispatch_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
         try:
             if tool_name == "get_dollar_price":
-                dollar_type = arguments.get("dollar_type", "blue")
-                response = requests.get(f'http://localhost:5000/dollar/{dollar_type}')
-                return response.json()["result"]
+                return self.transport.get_dollar_price(arguments.get("dollar_type", "blue"))
             
             elif tool_name == "get_dollar_history":
                 dollar_type = arguments.get("dollar_type", "blue")
                 days = arguments.get("days", 7)
-                response = requests.get(f'http://localhost:5000/history/{dollar_type}/{days}')
-                return response.json()["result"]
+                return self.transport.get_dollar_history(dollar_type, days)
+            
+            elif tool_name == "get_dollar_analytics":
+                dollar_types = arguments.get("dollar_types", ["blue", "oficial"])
+                windows = arguments.get("windows", [7, 30])
+                return self.transport.get_dollar_analytics(dollar_types, windows)
             
             elif tool_name == "get_dollar_types":
-                response = requests.get('http://localhost:5000/types')
-                return response.json()["result"]
+                return self.transport.get_dollar_types()
+            
+            elif tool_name == "get_dollars":
+                return self.transport.get_dollars(arguments.get("dollar_types") or [])
+            
+            elif tool_name == "convert_amounts":
+                return self.transport.convert_amounts(
+                    arguments.get("amounts") or [],
+                    arguments.get("directions") or arguments.get("direction", "usd_ars"),
+                    arguments.get("dollar_types") or []
+                )
+            
+            elif tool_name == "create_price_alert":
+                return self.transport.create_alert(
+                    arguments.get("user", "default"),
+                    arguments.get("dollar_type", "blue"),
+                    arguments.get("threshold"),
+                    arguments.get("direction", "above"),
+                    arguments.get("field", "venta")
+                )
+            
+            elif tool_name == "list_price_alerts":
+                return self.transport.list_alerts(arguments.get("user", "default"))
+            
+            elif tool_name == "delete_price_alert":
+                return self.transport.delete_alert(arguments.get("user", "default"), arguments.get("alert_id"))
             
             else:
                 return f"❌ Herramienta {tool_name} no encontrada"
@@ -74,6 +449,29 @@ class DollarMCPServer:
         except Exception as e:
             return f"❌ Error ejecutando {tool_name}: {str(e)}"
     
+    async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
+        """Ejecuta una herramienta MCP sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call_tool, tool_name, arguments or {})
+    
+    async def execute_tools(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        """Ejecuta varias herramientas independientes en paralelo, respetando el orden"""
+        return list(await asyncio.gather(*(self.execute_tool(name, args) for name, args in calls)))
+    
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop de larga vida, corriendo en un hilo propio"""
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="mcp-loop", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+    
+    def run(self, coro):
+        """Ejecuta una corrutina en el loop compartido desde código síncrono"""
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result()
+    
     def get_tools(self):
         """Retorna la lista de herramientas disponibles"""
         return list(self.tools.values())
@@ -0,0 +1,217 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Buckets de latencia en segundos (desde lecturas de cache hasta llamadas al LLM)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Contador monotónico con etiquetas"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # etiquetas -> [conteos por bucket, suma, cantidad]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class CallbackGauge:
+    """Gauge cuyo valor se lee de una función al momento de exportar"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set_function(self, function: Callable[[], float], **labels):
+        self._functions[tuple(str(labels.get(name, "")) for name in self.labelnames)] = function
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, function in list(self._functions.items()):
+            try:
+                value = function()
+            except Exception:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Registry:
+    """Registro de métricas exportables en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> CallbackGauge:
+        return self._register(CallbackGauge(name, documentation, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "dollar_stage_latency_seconds",
+    "Latencia por etapa (upstream_fetch, tool_call, tool_round, prompt_build, llm_call, llm_first_token)",
+    ("stage",)
+)
+UPSTREAM_ERRORS = REGISTRY.counter("dollar_upstream_errors_total", "Errores al consultar las APIs de cotizaciones", ("source",))
+UPSTREAM_LATENCY = REGISTRY.histogram("dollar_upstream_latency_seconds", "Latencia de las respuestas válidas de cada API de cotizaciones", ("source",))
+UPSTREAM_CIRCUIT = REGISTRY.gauge("dollar_upstream_circuit_open", "Circuit breaker de cada API de cotizaciones (1 = abierto o en prueba)", ("source",))
+UPSTREAM_HEDGES = REGISTRY.counter("dollar_upstream_hedges_total", "Consultas de respaldo lanzadas porque la fuente anterior no respondió a tiempo", ("source",))
+UPSTREAM_WINS = REGISTRY.counter("dollar_upstream_wins_total", "Descargas resueltas por cada API de cotizaciones", ("source",))
+UPSTREAM_FALLBACKS = REGISTRY.counter(
+    "dollar_upstream_fallbacks_total",
+    "Snapshots servidos sin datos frescos (stale = último dato real, reference = datos de referencia)",
+    ("kind",)
+)
+SNAPSHOT_READS = REGISTRY.counter("dollar_snapshot_reads_total", "Lecturas del snapshot compartido", ("result",))
+HTTP_CONDITIONAL = REGISTRY.counter("dollar_http_responses_total", "Respuestas de la API por resultado de revalidación", ("status",))
+STREAM_SUBSCRIBERS = REGISTRY.gauge("dollar_stream_subscribers", "Clientes suscriptos a las actualizaciones en vivo (SSE)")
+STREAM_EVENTS = REGISTRY.counter("dollar_stream_events_total", "Cambios de snapshot publicados a los suscriptores")
+STREAM_DROPPED = REGISTRY.counter("dollar_stream_dropped_total", "Suscriptores desconectados por no leer los eventos a tiempo")
+ALERTS_PENDING = REGISTRY.gauge("dollar_alerts_pending", "Alertas de precio registradas que todavía no se dispararon")
+ALERTS_FIRED = REGISTRY.counter("dollar_alerts_fired_total", "Alertas de precio disparadas")
+TOOL_CALLS = REGISTRY.counter("dollar_tool_calls_total", "Llamadas a herramientas MCP", ("tool", "status"))
+TOOL_MEMO = REGISTRY.counter(
+    "dollar_tool_memo_total",
+    "Llamadas a herramientas en conversaciones: hit (ya consultada), coalesced (idéntica en curso) o miss (ejecutada)",
+    ("result",)
+)
+QUERY_ROUTES = REGISTRY.counter("dollar_query_routes_total", "Consultas respondidas directamente con los datos (local) o con el LLM", ("route",))
+QUERY_SERVICE = REGISTRY.counter(
+    "dollar_query_service_total",
+    "Resultado de las consultas del servicio multiusuario (ok, coalesced, shed, timeout, error)",
+    ("outcome",)
+)
+QUERY_PENDING = REGISTRY.gauge("dollar_query_pending", "Consultas del servicio esperando turno para el LLM")
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens consumidos en el LLM según usage metadata", ("kind",))
+LLM_CALLS = REGISTRY.counter("llm_calls_total", "Llamadas al LLM", ("mode", "status"))
+LLM_BACKEND_LATENCY = REGISTRY.histogram("llm_backend_latency_seconds", "Latencia de las respuestas válidas de cada proveedor de LLM", ("backend",))
+LLM_BACKEND_ERRORS = REGISTRY.counter("llm_backend_errors_total", "Errores de cada proveedor de LLM", ("backend",))
+LLM_BACKEND_CIRCUIT = REGISTRY.gauge("llm_backend_circuit_open", "Circuit breaker de cada proveedor de LLM (1 = abierto o en prueba)", ("backend",))
+LLM_BACKEND_HEDGES = REGISTRY.counter("llm_backend_hedges_total", "Consultas de respaldo lanzadas porque el proveedor anterior no respondió a tiempo", ("backend",))
+LLM_BACKEND_WINS = REGISTRY.counter("llm_backend_wins_total", "Consultas resueltas por cada proveedor de LLM", ("backend",))
+LLM_TOOL_CALLS = REGISTRY.histogram(
+    "llm_tool_calls_per_turn",
+    "Herramientas pedidas por el LLM en un mismo turno (se ejecutan en paralelo)",
+    buckets=(1, 2, 3, 4, 6, 8)
+)
+CACHE_EVENTS = REGISTRY.gauge("llm_cache_events", "Aciertos y fallos acumulados de las caches de respuestas del LLM", ("cache", "result"))
+CACHE_HIT_RATIO = REGISTRY.gauge("llm_cache_hit_ratio", "Proporción de aciertos de las caches de respuestas del LLM", ("cache",))
+
+def timed(stage: str):
+    """Mide la duración de una etapa: `with timed('tool_call'): ...`"""
+    return STAGE_LATENCY.time(stage=stage)
+
+def record_llm_usage(prompt_tokens: int, completion_tokens: int):
+    LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, kind="completion")
+
+def register_cache(name: str, cache):
+    """Expone los aciertos, fallos y la proporción de aciertos de una cache con stats()"""
+    CACHE_EVENTS.set_function(lambda: cache.hits, cache=name, result="hit")
+    CACHE_EVENTS.set_function(lambda: cache.misses, cache=name, result="miss")
+    CACHE_HIT_RATIO.set_function(lambda: cache.stats()["hit_ratio"], cache=name)
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,184 @@
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+from llm_cache import normalize_question
+from quotes import quote_date
+
+# Estimación sin llamadas de red: ~4 caracteres por token en español
+CHARS_PER_TOKEN = 4
+
+# Prefijo estático: se envía como system_instruction y no cambia entre consultas,
+# así Gemini puede reutilizarlo (cache implícita o cache de contexto explícita)
+SYSTEM_INSTRUCTION = """Sos un analista financiero especializado en el dólar estadounidense vs peso argentino.
+
+INSTRUCCIONES:
+- Respondé ÚNICAMENTE en español, de forma clara, concisa y profesional
+- Basate en los datos incluidos en la consulta; si no hay datos, respondé de forma conceptual
+- Si preguntan por precios actuales, mencioná los tipos consultados
+- Si preguntan por evolución, usá el historial incluido o sugerí consultarlo
+- Explicá las diferencias entre los tipos de dólar cuando sea relevante
+
+TIPOS DE DÓLAR:
+- Blue: mercado informal
+- Oficial: bancos oficiales
+- Bolsa (MEP): mercado de valores
+- CCL: contado con liquidación
+- Turista: para consumos en el exterior"""
+
+# Variante para function calling: el modelo pide los datos con las herramientas MCP
+# en lugar de recibirlos en la consulta
+TOOLS_SYSTEM_INSTRUCTION = """Sos un analista financiero especializado en el dólar estadounidense vs peso argentino.
+
+INSTRUCCIONES:
+- Respondé ÚNICAMENTE en español, de forma clara, concisa y profesional
+- Obtené cotizaciones, historial, análisis y conversiones con las herramientas; nunca inventes valores
+- Pedí en un mismo turno todas las herramientas que necesites: se ejecutan en paralelo
+- Preferí get_dollars para varias cotizaciones y get_dollar_analytics para comparar varios tipos
+- Usá convert_amounts en lugar de hacer cuentas con las cotizaciones
+- Si la pregunta es conceptual, respondé sin usar herramientas
+- Explicá las diferencias entre los tipos de dólar cuando sea relevante
+
+TIPOS DE DÓLAR:
+- Blue: mercado informal
+- Oficial: bancos oficiales
+- Bolsa (MEP): mercado de valores
+- CCL: contado con liquidación
+- Turista: para consumos en el exterior"""
+
+ROLE_LABELS = {"system": "INSTRUCCIONES", "user": "USUARIO", "assistant": "ASISTENTE"}
+
+# Palabras de la consulta (normalizada) -> tipo de dólar
+TYPE_ALIASES = {
+    'blue': 'blue', 'informal': 'blue', 'paralelo': 'blue',
+    'oficial': 'oficial', 'banco': 'oficial', 'bancos': 'oficial',
+    'bolsa': 'bolsa', 'mep': 'bolsa',
+    'ccl': 'liqui', 'liqui': 'liqui', 'contado': 'liqui',
+    'turista': 'turista', 'tarjeta': 'turista'
+}
+
+# La fecha de cada cotización sólo se incluye si la consulta la pide
+DATE_WORDS = {'actualizado', 'actualizada', 'actualizacion', 'fecha', 'hora', 'cuando'}
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Recorta el texto para que entre en max_tokens"""
+    max_chars = max(0, max_tokens) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 1)] + "…"
+
+def detect_types(question: str) -> List[str]:
+    """Tipos de dólar mencionados en la consulta, en orden y sin repetir (vacío = todos)"""
+    types = []
+    for word in normalize_question(question).split():
+        dollar_type = TYPE_ALIASES.get(word)
+        if dollar_type and dollar_type not in types:
+            types.append(dollar_type)
+    return types
+
+def quote_fields(question: str) -> Tuple[str, ...]:
+    """Campos de cada cotización que necesita la consulta"""
+    if DATE_WORDS.intersection(normalize_question(question).split()):
+        return ('compra', 'venta', 'fecha')
+    return ('compra', 'venta')
+
+def render_quotes(data: dict, fields: Sequence[str] = ('compra', 'venta')) -> str:
+    """Cotizaciones en formato compacto, sólo con los campos pedidos"""
+    lines = []
+    for quote in data['cotizaciones']:
+        if not quote.get('disponible', True):
+            lines.append(f"{quote['tipo']}: no disponible")
+            continue
+        values = [f"{field} {quote[field]:.2f}" for field in fields if field in ('compra', 'venta')]
+        if 'fecha' in fields:
+            values.append(f"actualizado {quote_date(quote)}")
+        lines.append(f"{quote['nombre']}: " + " | ".join(values))
+    if data.get('fuente') == 'referencia':
+        lines.append("(datos de referencia: la API no respondió)")
+    return "\n".join(lines)
+
+class PromptBuilder:
+    """Arma prompts dentro de un presupuesto de tokens.
+
+    La parte estática (SYSTEM_INSTRUCTION) va aparte, como system_instruction del
+    modelo; acá sólo se arma la parte variable de cada consulta. En conversaciones
+    largas se conservan los turnos más recientes y los anteriores se resumen.
+    """
+
+    def __init__(self, budget_tokens: Optional[int] = None, summary_share: float = 0.2, summary_chars: int = 120):
+        self.budget_tokens = budget_tokens or int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+        # Fracción del presupuesto reservada al resumen de turnos viejos
+        self.summary_share = summary_share
+        # Caracteres de cada turno viejo que se conservan en el resumen
+        self.summary_chars = summary_chars
+
+    def build_query(self, question: str, sections: Sequence[Tuple[str, str]] = ()) -> str:
+        """Consulta + secciones de datos (título, texto); los datos se recortan si no entran"""
+        question_part = f"CONSULTA DEL USUARIO: {question}"
+        available = self.budget_tokens - estimate_tokens(question_part)
+        parts = []
+        for title, body in sections:
+            if not body:
+                continue
+            part = truncate(f"{title}:\n{body}", available)
+            available -= estimate_tokens(part)
+            parts.append(part)
+        parts.append(question_part)
+        return "\n\n".join(parts)
+
+    def build_chat(self, messages: Sequence[Dict[str, str]]) -> str:
+        """Convierte mensajes de chat (role/content) en un prompt que respeta el presupuesto"""
+        system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system" and m.get("content"))
+        turns = [
+            f"{ROLE_LABELS[m['role']]}: {m.get('content', '')}"
+            for m in messages if m.get("role") in ("user", "assistant")
+        ]
+        closing = f"{ROLE_LABELS['assistant']}:"
+
+        header = f"{ROLE_LABELS['system']}: {truncate(system, self.budget_tokens // 4)}" if system else ""
+        budget = self.budget_tokens - estimate_tokens(header) - estimate_tokens(closing)
+        costs = [estimate_tokens(turn) + 1 for turn in turns]
+
+        if sum(costs) <= budget:
+            kept, dropped = turns, []
+        else:
+            # Turnos recientes hacia atrás hasta agotar el presupuesto (el último siempre entra)
+            keep_budget = int(budget * (1 - self.summary_share))
+            used = 0
+            first = len(turns)
+            while first > 0 and (first == len(turns) or used + costs[first - 1] <= keep_budget):
+                first -= 1
+                used += costs[first]
+            kept, dropped = turns[first:], turns[:first]
+            if len(kept) == 1 and used > budget:
+                kept = [truncate(kept[0], budget)]
+                used = budget
+            summary = self._summarize(dropped, budget - used)
+            if summary:
+                kept = [summary] + kept
+
+        parts = [header] if header else []
+        parts.extend(kept)
+        parts.append(closing)
+        return "\n\n".join(parts)
+
+    def _summarize(self, turns: Sequence[str], max_tokens: int) -> str:
+        """Resumen de los turnos descartados: el comienzo de cada uno, priorizando los más recientes"""
+        if not turns or max_tokens <= 0:
+            return ""
+        title = "RESUMEN DE LA CONVERSACIÓN ANTERIOR:"
+        available = max_tokens - estimate_tokens(title) - 1
+        lines = []
+        for turn in reversed(turns):
+            line = "- " + truncate(" ".join(turn.split()), self.summary_chars // CHARS_PER_TOKEN)
+            cost = estimate_tokens(line) + 1
+            if cost > available:
+                break
+            available -= cost
+            lines.append(line)
+        omitted = len(turns) - len(lines)
+        if omitted:
+            lines.append(f"- ({omitted} turnos anteriores omitidos)")
+        lines.reverse()
+        return "\n".join([title] + lines)
@@ -0,0 +1,291 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from flask import Flask, Response, jsonify, request
+from llm_cache import make_key, normalize_question
+from mcp_server import mcp_server
+import metrics
+
+class Overloaded(Exception):
+    """La consulta se descarta porque no podría atenderse a tiempo"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    """La consulta superó su tiempo máximo"""
+
+class TokenBucket:
+    """Limitador de tasa: rate tokens por segundo con ráfagas de hasta capacity.
+
+    Se usa desde un único event loop, así que no necesita locks.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, deadline: float):
+        """Toma un token, esperando si hace falta; si no llegaría antes de deadline, descarta"""
+        now = time.monotonic()
+        self._refill(now)
+        # Los tokens pueden quedar negativos: cada consulta reserva su turno en la fila
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        if now + wait > deadline:
+            raise Overloaded("Límite de consultas al LLM alcanzado", retry_after=wait)
+        self.tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class QueryService:
+    """Atiende consultas de muchos usuarios con AutoGenGeminiClient desde un solo proceso.
+
+    - Precios y tipos se responden con los datos, sin pasar por los límites del LLM
+    - Consultas idénticas en curso comparten una única llamada (coalescing)
+    - Las llamadas a Gemini respetan un máximo de concurrencia y un token bucket
+      configurado según la cuota de la API
+    - La fila de espera es acotada y cada consulta tiene un deadline: lo que no
+      podría atenderse a tiempo se rechaza enseguida en lugar de acumular latencia
+    - Los resultados de herramientas se reutilizan sólo dentro de una conversación:
+      la indicada en cada consulta o, si no se indica, la consulta sola
+    """
+
+    def __init__(self, client=None, max_concurrency: int = None, rate_per_minute: float = None,
+                 burst: float = None, max_queue: int = None, timeout: float = None, max_conversations: int = None):
+        if client is None:
+            from autogen_gemini_client import AutoGenGeminiClient
+            client = AutoGenGeminiClient()
+        self.client = client
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        self.rate_per_minute = rate_per_minute or float(os.getenv("GEMINI_RPM", "60"))
+        self.max_queue = max_queue or int(os.getenv("LLM_MAX_QUEUE", "64"))
+        # Tiempo máximo por consulta (segundos), incluida la espera en la fila
+        self.timeout = timeout or float(os.getenv("QUERY_TIMEOUT", "30"))
+        self.bucket = TokenBucket(self.rate_per_minute / 60, burst or float(os.getenv("GEMINI_BURST", str(self.max_concurrency))))
+
+        # Hilos para herramientas y llamadas a Gemini (todas bloqueantes)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency + 8, thread_name_prefix="query")
+        self._semaphore = None
+        # Consulta normalizada -> future compartido por todas las consultas idénticas en curso
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.pending = 0
+        # Conversación -> memoria de herramientas (LRU: se descartan las menos recientes)
+        self._memos: "OrderedDict[str, object]" = OrderedDict()
+        self.max_conversations = max_conversations or int(os.getenv("QUERY_MAX_CONVERSATIONS", "1024"))
+        # /health las lee desde otro hilo
+        self._memos_lock = threading.Lock()
+        self.stats = {"ok": 0, "coalesced": 0, "shed": 0, "timeout": 0, "error": 0}
+        metrics.QUERY_PENDING.set_function(lambda: self.pending)
+
+    def _count(self, outcome: str):
+        self.stats[outcome] += 1
+        metrics.QUERY_SERVICE.inc(outcome=outcome)
+
+    async def _run(self, deadline: float, function, *args):
+        """Ejecuta una función bloqueante en el pool sin esperar más allá del deadline"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Tiempo de espera agotado")
+        future = asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), remaining)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Tiempo de espera agotado")
+
+    def _memo(self, conversation: Optional[str]):
+        """Memoria de herramientas de la conversación (una nueva si no se indica)"""
+        if conversation is None:
+            return self.client.new_memo()
+        with self._memos_lock:
+            memo = self._memos.get(conversation)
+            if memo is None:
+                memo = self._memos[conversation] = self.client.new_memo()
+                while len(self._memos) > self.max_conversations:
+                    self._memos.popitem(last=False)
+            else:
+                self._memos.move_to_end(conversation)
+        return memo
+
+    async def answer(self, question: str, timeout: Optional[float] = None, conversation: Optional[str] = None) -> Tuple[str, str]:
+        """Responde una consulta; devuelve (respuesta, origen: local | cache | llm | coalesced)"""
+        deadline = time.monotonic() + min(timeout or self.timeout, self.timeout)
+        key = normalize_question(question)
+        shared = self._inflight.get(key)
+        if shared is not None:
+            self._count("coalesced")
+            try:
+                text, _ = await asyncio.wait_for(asyncio.shield(shared), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("Tiempo de espera agotado")
+            return text, "coalesced"
+
+        shared = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._answer(question, deadline, conversation)
+        except Exception as e:
+            self._count("shed" if isinstance(e, Overloaded) else "timeout" if isinstance(e, DeadlineExceeded) else "error")
+            shared.set_exception(e)
+            # Evita el aviso de "exception never retrieved" si nadie más esperaba
+            shared.exception()
+            raise
+        else:
+            self._count("ok")
+            shared.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _answer(self, question: str, deadline: float, conversation: Optional[str] = None) -> Tuple[str, str]:
+        answer, prompt, data_version = await self._run(deadline, self.client.plan_query, question)
+        if answer is not None:
+            return answer, "local"
+
+        from gemini_autogen_adapter import get_gemini_adapter
+        adapter = get_gemini_adapter()
+        cached = adapter.cache.get(make_key(question, data_version)) if data_version is not None else None
+        if cached is not None:
+            # Un acierto de cache no consume cuota ni espera turno. Se devuelve el valor leído: volver
+            # a llamar a complete() desde este loop bloquearía (las herramientas corren en él) si la
+            # entrada venció entre tanto
+            return cached, "cache"
+
+        if self.pending >= self.max_queue:
+            # Tiempo aproximado para vaciar la fila al ritmo permitido
+            raise Overloaded("Demasiadas consultas en espera", retry_after=self.pending / self.bucket.rate)
+        self.pending += 1
+        try:
+            await self.bucket.acquire(deadline)
+            try:
+                await asyncio.wait_for(self._get_semaphore().acquire(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("Tiempo de espera agotado en la fila")
+        finally:
+            self.pending -= 1
+
+        loop = asyncio.get_running_loop()
+        # Incluye las rondas de herramientas que pida el modelo: todo ocupa un solo lugar,
+        # pero cada llamada al modelo descuenta su token
+        future = loop.run_in_executor(self._executor, self.client.complete, prompt, question, data_version,
+                                      self._memo(conversation), self._charge(loop, deadline))
+        # El lugar se libera cuando termina la llamada, aunque la consulta ya haya vencido
+        future.add_done_callback(lambda _: self._semaphore.release())
+        try:
+            text = await asyncio.wait_for(asyncio.shield(future), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Gemini no respondió a tiempo")
+        return text, "llm"
+
+    def _charge(self, loop: asyncio.AbstractEventLoop, deadline: float):
+        """before_turn para el tool loop: cada llamada al modelo toma un token del bucket.
+
+        El token de la primera ya se tomó antes de ocupar un lugar; las siguientes
+        (una por ronda de herramientas) esperan el suyo desde el hilo de la consulta.
+        """
+        turns = 0
+
+        def before_turn():
+            nonlocal turns
+            turns += 1
+            if turns > 1:
+                asyncio.run_coroutine_threadsafe(self.bucket.acquire(deadline), loop).result()
+        return before_turn
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Se crea dentro del loop que lo usa
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def ask(self, question: str, timeout: Optional[float] = None, conversation: Optional[str] = None) -> Tuple[str, str]:
+        """Versión síncrona de answer() para los hilos del servidor HTTP"""
+        return mcp_server.run(self.answer(question, timeout, conversation))
+
+    def describe(self) -> Dict:
+        return dict(
+            self.stats,
+            pending=self.pending,
+            in_flight=len(self._inflight),
+            max_concurrency=self.max_concurrency,
+            rate_per_minute=self.rate_per_minute,
+            max_queue=self.max_queue,
+            tool_memo=self._memo_stats()
+        )
+
+    def _memo_stats(self) -> Dict:
+        with self._memos_lock:
+            memos = list(self._memos.values())
+        stats = {"conversations": len(memos), "hits": 0, "misses": 0, "coalesced": 0}
+        for memo in memos:
+            for name, value in memo.stats().items():
+                if name in stats:
+                    stats[name] += value
+        return stats
+
+app = Flask(__name__)
+_service = None
+
+def get_service() -> QueryService:
+    global _service
+    if _service is None:
+        _service = QueryService()
+    return _service
+
+@app.route('/query', methods=['GET', 'POST'])
+def query():
+    body = request.get_json(silent=True) or {}
+    question = (body.get('question') or request.args.get('q') or '').strip()
+    if not question:
+        return jsonify({"error": "falta la consulta (question)"}), 400
+    try:
+        timeout = float(body.get('timeout') or request.args.get('timeout') or 0) or None
+    except (TypeError, ValueError):
+        return jsonify({"error": "timeout debe ser un número de segundos"}), 400
+
+    # Las consultas con el mismo id de conversación reutilizan los resultados de herramientas
+    conversation = body.get('conversation') or request.args.get('conversation')
+
+    started = time.perf_counter()
+    try:
+        answer, source = get_service().ask(question, timeout, str(conversation) if conversation else None)
+    except Overloaded as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+        return response
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        return jsonify({"error": f"Error en la consulta: {str(e)}"}), 500
+    return jsonify({
+        "question": question,
+        "answer": answer,
+        "source": source,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+@app.route('/health')
+def health():
+    return jsonify(get_service().describe())
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+if __name__ == '__main__':
+    from werkzeug.serving import run_simple
+    bind = os.getenv("QUERY_BIND", "0.0.0.0:5001")
+    host, port = bind.rsplit(":", 1)
+    get_service()
+    print(f"🚀 Servicio de consultas en http://{bind} (POST /query)")
+    run_simple(host, int(port), app, threaded=True)
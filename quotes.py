@@ -0,0 +1,138 @@
+import hashlib
+import json
+import threading
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Dict, Optional
+from history_store import parse_fecha
+
+class DollarType(Enum):
+    """Tipos de dólar consultables; el valor es el nombre que usan las herramientas y la API"""
+    BLUE = 'blue'
+    OFICIAL = 'oficial'
+    BOLSA = 'bolsa'
+    LIQUI = 'liqui'
+    TURISTA = 'turista'
+
+    @property
+    def key(self) -> str:
+        """Clave en el snapshot (nombre de dolarapi en minúsculas)"""
+        return SNAPSHOT_KEYS[self]
+
+    @property
+    def label(self) -> str:
+        return LABELS[self]
+
+SNAPSHOT_KEYS = {
+    DollarType.BLUE: 'blue',
+    DollarType.OFICIAL: 'oficial',
+    DollarType.BOLSA: 'bolsa',
+    DollarType.LIQUI: 'contado con liqui',
+    DollarType.TURISTA: 'turista'
+}
+
+LABELS = {
+    DollarType.BLUE: 'Blue',
+    DollarType.OFICIAL: 'Oficial',
+    DollarType.BOLSA: 'Bolsa',
+    DollarType.LIQUI: 'CCL',
+    DollarType.TURISTA: 'Turista'
+}
+
+# Clave del snapshot -> tipo
+BY_KEY = {key: dollar_type for dollar_type, key in SNAPSHOT_KEYS.items()}
+
+class Quote:
+    """Cotización de un tipo de dólar con los precios ya convertidos a número y la fecha a epoch"""
+    __slots__ = ('key', 'type', 'nombre', 'compra', 'venta', 'fecha', 'ts')
+
+    def __init__(self, key: str, nombre: str, compra: float, venta: float, fecha: str):
+        self.key = key
+        # None para tipos que publica la API pero no son consultables (mayorista, cripto)
+        self.type = BY_KEY.get(key)
+        self.nombre = nombre
+        self.compra = float(compra)
+        self.venta = float(venta)
+        self.fecha = fecha
+        # Epoch de la fecha, calculado una sola vez (None si la fuente mandó una fecha inválida)
+        self.ts = _epoch(fecha)
+
+    @classmethod
+    def from_dict(cls, key: str, quote: dict) -> "Quote":
+        return cls(key, quote['nombre'], quote['compra'], quote['venta'], quote['fecha'])
+
+    @property
+    def tipo(self) -> str:
+        return self.type.value if self.type else self.key
+
+    def to_dict(self) -> dict:
+        """Formato de las respuestas de la API"""
+        return {
+            'tipo': self.tipo,
+            'nombre': self.nombre,
+            'compra': self.compra,
+            'venta': self.venta,
+            'fecha': self.fecha,
+            'ts': self.ts
+        }
+
+def data_hash(data: dict) -> str:
+    """Huella del contenido de las cotizaciones.
+
+    A diferencia de la versión, que cada proceso numera desde 1, es la misma en
+    cualquier proceso con los mismos datos: sirve de clave de cache en los clientes.
+    """
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+def _epoch(fecha) -> Optional[float]:
+    try:
+        return parse_fecha(fecha)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def short_date(ts: float) -> str:
+    """Fecha y hora local de un epoch, como se muestra en los textos (AAAA-MM-DD HH:MM)"""
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M')
+
+def quote_date(quote: dict) -> str:
+    """Fecha para mostrar de una cotización de la API: de su ts si lo tiene, si no de la fecha original"""
+    ts = quote.get('ts')
+    return short_date(ts) if ts is not None else str(quote['fecha'])[:16].replace('T', ' ')
+
+class SnapshotView:
+    """Cotizaciones tipadas de un snapshot y cache de todo lo que se deriva de él.
+
+    Se arma una vez por snapshot publicado. Las respuestas (JSON, texto) se
+    calculan la primera vez que se piden y después se reutilizan hasta el
+    próximo snapshot, así que atender una consulta repetida no formatea nada.
+    """
+    # Entradas máximas de la cache (las combinaciones de parámetros son acotadas pero no fijas)
+    MAX_ENTRIES = 1024
+
+    def __init__(self, snapshot: dict):
+        self.version = snapshot['version']
+        self.timestamp = snapshot['timestamp']
+        self.fallback = snapshot['fallback']
+        # Cargado del disco al arrancar y todavía no renovado
+        self.restored = snapshot.get('restored', False)
+        self.quotes: Dict[str, Quote] = {key: Quote.from_dict(key, quote) for key, quote in snapshot['data'].items()}
+        self.data_hash = data_hash(snapshot['data'])
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def matches(self, snapshot: dict) -> bool:
+        return snapshot['version'] == self.version and snapshot['timestamp'] == self.timestamp
+
+    def cached(self, key, build: Callable[[], object]):
+        """Valor derivado del snapshot; build() se llama sólo la primera vez.
+
+        El resultado se comparte entre consultas: no debe modificarse.
+        """
+        value = self._cache.get(key)
+        if value is None:
+            value = build()
+            with self._lock:
+                if len(self._cache) < self.MAX_ENTRIES:
+                    value = self._cache.setdefault(key, value)
+        return value
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+class CircuitBreaker:
+    """Corta las llamadas a una dependencia que viene fallando.
+
+    closed: todo pasa. Tras failure_threshold fallas seguidas pasa a open y rechaza
+    al instante durante reset_timeout segundos; después (half-open) deja pasar una
+    sola llamada de prueba: si sale bien vuelve a closed, si falla vuelve a open.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """True si se puede llamar a la dependencia ahora"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # half-open: una sola llamada de prueba a la vez
+            if self._trial:
+                return False
+            self._state = self.HALF_OPEN
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+class LatencyTracker:
+    """Latencias recientes de una dependencia (ventana deslizante) para decidir hedging"""
+
+    def __init__(self, window: int = 100):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Percentil q (0-100) de la ventana, o None si todavía no hay muestras"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+def hedge_delay(latency: LatencyTracker, default: float, minimum: float, min_samples: int = 5) -> float:
+    """Cuánto esperar a una dependencia antes de cubrirse con otra: su p95, acotado.
+
+    Sin muestras suficientes se usa default; el resultado queda entre minimum y 4 * default.
+    """
+    p95 = latency.percentile(95) if len(latency) >= min_samples else None
+    if p95 is None:
+        return default
+    return min(default * 4, max(minimum, p95))
+
+class HedgeFailed(Exception):
+    """Ningún destino respondió a tiempo.
+
+    errors tiene (destino, excepción) de cada falla; all_open indica que no se
+    llamó a ninguno porque todos tenían el circuito abierto.
+    """
+
+    def __init__(self, errors: List[Tuple[Any, Exception]], all_open: bool):
+        super().__init__("; ".join(f"{getattr(target, 'name', target)}: {error}" for target, error in errors))
+        self.errors = errors
+        self.all_open = all_open
+
+def hedged_call(targets: Sequence, call: Callable[[Any, float], Any], delay: Callable[[Any], float], timeout: float,
+                executor: Executor, on_hedge: Callable[[Any], None] = None) -> Tuple[Any, Any]:
+    """Llama a los destinos en orden con hedging: la primera respuesta válida gana.
+
+    call(destino, segundos restantes) corre en executor. Se llama al primer destino
+    y, si no respondió en delay(destino) segundos, se lanza el siguiente sin
+    cancelar el anterior; si falla, el siguiente se lanza enseguida. Cada destino
+    tiene un .breaker: los que tienen el circuito abierto se saltean sin esperar.
+    Devuelve (resultado, destino que respondió) o lanza HedgeFailed.
+    """
+    deadline = time.monotonic() + timeout
+    # allow() se consulta recién al lanzar cada destino: en half-open reserva la única llamada de prueba
+    candidates = [target for target in targets if target.breaker.state != CircuitBreaker.OPEN]
+    running = {}
+    errors = []
+    while candidates or running:
+        if candidates:
+            target = candidates.pop(0)
+            if not target.breaker.allow():
+                continue
+            if running and on_hedge is not None:
+                on_hedge(target)
+            running[executor.submit(call, target, max(0.1, deadline - time.monotonic()))] = target
+            # Si hay otro destino disponible, esperar sólo hasta el momento de cubrirse con él
+            wait_for = delay(target) if candidates else deadline - time.monotonic()
+        else:
+            wait_for = deadline - time.monotonic()
+        if wait_for <= 0 and not candidates:
+            break
+
+        done, _ = wait(running, timeout=max(0, min(wait_for, deadline - time.monotonic())), return_when=FIRST_COMPLETED)
+        for future in done:
+            target = running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append((target, e))
+                continue
+            return result, target
+        if time.monotonic() >= deadline:
+            break
+    # Las llamadas que sigan en curso terminan solas y actualizan su breaker
+    raise HedgeFailed(errors, all_open=not errors and not running and time.monotonic() < deadline)
@@ -0,0 +1,69 @@
+import os
+import multiprocessing
+
+# Todos los workers comparten un único snapshot: sólo uno consulta el upstream por TTL
+os.environ.setdefault(
+    "DOLLAR_SHARED_SNAPSHOT",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'snapshot.json')
+)
+
+BIND = os.getenv("DOLLAR_BIND", "0.0.0.0:5000")
+WORKERS = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+THREADS = int(os.getenv("DOLLAR_THREADS", "8"))
+# Servidor SSE asíncrono (vacío = deshabilitado); los workers comparten el puerto con SO_REUSEPORT
+STREAM_BIND = os.getenv("DOLLAR_STREAM_BIND", "")
+
+def post_worker_init(worker):
+    """Cada worker arranca su hilo de renovación (el líder refresca, el resto sigue el archivo)"""
+    from dollar_server import dollar_service, start_stream_server
+    dollar_service.start_refresher()
+    if STREAM_BIND:
+        start_stream_server(STREAM_BIND, reuse_port=True)
+
+def run_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    class DollarApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": BIND,
+                "workers": WORKERS,
+                "worker_class": "gthread",
+                "threads": THREADS,
+                "keepalive": 5,
+                "timeout": 30,
+                "post_worker_init": post_worker_init,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Se importa en cada worker (sin preload) para que cada uno tenga su servicio
+            from dollar_server import app
+            return app
+
+    DollarApplication().run()
+
+def run_waitress():
+    """Windows: un proceso con varios hilos (gunicorn no está disponible)"""
+    from waitress import serve
+    from dollar_server import app, dollar_service, start_stream_server
+    dollar_service.start_refresher()
+    if STREAM_BIND:
+        start_stream_server(STREAM_BIND)
+    host, port = BIND.rsplit(":", 1)
+    serve(app, host=host, port=int(port), threads=THREADS * WORKERS)
+
+def main():
+    print(f"🚀 Servidor Dólar (producción) en http://{BIND} | workers: {WORKERS} | hilos: {THREADS}")
+    if STREAM_BIND:
+        print(f"📡 Actualizaciones en vivo en http://{STREAM_BIND}/stream")
+    try:
+        import gunicorn
+    except ImportError:
+        run_waitress()
+    else:
+        run_gunicorn()
+
+if __name__ == "__main__":
+    main()
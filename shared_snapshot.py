@@ -0,0 +1,105 @@
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+def write_atomic(path: str, payload: bytes):
+    """Escribe un archivo de forma atómica: los lectores ven el contenido viejo o el nuevo, nunca uno a medias"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextmanager
+def file_lock(path: str):
+    """Lock exclusivo entre procesos sobre path (bloqueante); se libera al salir o si el proceso muere"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def file_key(path: str):
+    """Identifica una versión del archivo (cambia con cada write_atomic); None si no existe"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+class SharedSnapshot:
+    """Snapshot de cotizaciones compartido entre procesos worker a través de un archivo.
+
+    Un único worker (el líder, que tiene el lock del archivo) consulta el upstream
+    y publica el snapshot; el resto sólo lo lee cuando el archivo cambia.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock_file = None
+        self._key = None
+        self._cached = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_file is not None
+
+    def try_lead(self) -> bool:
+        """Intenta tomar el rol de refresher sin bloquear; el lock se libera si el proceso muere"""
+        if self._lock_file is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        lock_file = open(self.lock_path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def read(self) -> Optional[dict]:
+        """Devuelve el último snapshot publicado; sólo vuelve a parsear si el archivo cambió"""
+        key = file_key(self.path)
+        if key is None:
+            return None
+        if key != self._key:
+            with open(self.path, 'rb') as f:
+                self._cached = json.loads(f.read())
+            self._key = key
+        return self._cached
+
+    def write(self, snapshot: dict):
+        """Publica un snapshot (sólo el líder)"""
+        write_atomic(self.path, json.dumps(snapshot, ensure_ascii=False).encode('utf-8'))
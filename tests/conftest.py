@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# Los módulos del proyecto están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sin archivos del repositorio: historial en un directorio temporal, sin snapshot guardado ni compartido
+os.environ["DOLLAR_HISTORY_DIR"] = tempfile.mkdtemp(prefix="dollar-history-")
+os.environ["DOLLAR_SNAPSHOT_FILE"] = ""
+os.environ["DOLLAR_SHARED_SNAPSHOT"] = ""
+os.environ.setdefault("GEMINI_API_KEY", "test")
@@ -0,0 +1,170 @@
+import os
+import pytest
+from alerts import ABOVE, BELOW, AlertEngine, ThresholdIndex
+from intent_parser import ALERT, parse_intent
+
+TYPE_MAP = {'blue': 'blue', 'oficial': 'oficial'}
+
+def snapshot(blue: float, timestamp: float = 0.0, oficial: float = 1000.0, fallback: bool = False) -> dict:
+    return {
+        'version': 1,
+        'timestamp': timestamp,
+        'fallback': fallback,
+        'data': {
+            'blue': {'compra': blue - 20, 'venta': blue},
+            'oficial': {'compra': oficial - 20, 'venta': oficial}
+        }
+    }
+
+def test_index_crossed_up_takes_thresholds_in_range():
+    index = ThresholdIndex()
+    for alert_id, threshold in enumerate([1100, 1200, 1200, 1300, 1400], start=1):
+        index.add(threshold, alert_id)
+    # old <= umbral < new
+    assert sorted(index.crossed_up(1200, 1350)) == [2, 3, 4]
+    assert list(index.thresholds) == [1100, 1400]
+    assert index.crossed_up(1350, 1400) == []
+
+def test_index_crossed_down_takes_thresholds_in_range():
+    index = ThresholdIndex()
+    for alert_id, threshold in enumerate([900, 1000, 1100], start=1):
+        index.add(threshold, alert_id)
+    # new < umbral <= old
+    assert sorted(index.crossed_down(1100, 950)) == [2, 3]
+    assert index.crossed_down(950, 900) == []
+    assert list(index.ids) == [1]
+
+def test_index_remove():
+    index = ThresholdIndex()
+    index.add(1200, 1)
+    index.add(1200, 2)
+    assert index.remove(1200, 2)
+    assert not index.remove(1200, 2)
+    assert list(index.ids) == [1]
+
+def test_engine_fires_once_in_the_direction_of_the_move():
+    engine = AlertEngine(TYPE_MAP)
+    engine.evaluate(snapshot(1200, 1))
+    up, _ = engine.add('ana', 'blue', 1250, ABOVE)
+    down, _ = engine.add('ana', 'blue', 1150, BELOW)
+
+    fired = engine.evaluate(snapshot(1300, 2))
+    assert [n['id'] for n in fired] == [up.id]
+    assert engine.evaluate(snapshot(1240, 3)) == []
+    assert [n['id'] for n in engine.evaluate(snapshot(1100, 4))] == [down.id]
+    assert engine.pending('ana') == []
+    assert [n['id'] for n in engine.notifications('ana')] == [up.id, down.id]
+
+def test_engine_fires_immediately_when_already_met():
+    engine = AlertEngine(TYPE_MAP)
+    engine.evaluate(snapshot(1200, 1))
+    alert, notification = engine.add('ana', 'blue', 1100, ABOVE)
+    assert notification is not None and notification['valor'] == 1200
+    assert engine.pending('ana') == []
+
+def test_engine_brecha_and_fallback():
+    engine = AlertEngine(TYPE_MAP)
+    engine.evaluate(snapshot(1200, 1))
+    alert, _ = engine.add('ana', 'blue', 25, ABOVE, field='brecha')
+    assert engine.evaluate(snapshot(1300, 2, fallback=True)) == []
+    assert [n['id'] for n in engine.evaluate(snapshot(1300, 3))] == [alert.id]
+
+def test_engine_validation():
+    engine = AlertEngine(TYPE_MAP)
+    with pytest.raises(ValueError):
+        engine.add('ana', 'cripto', 100)
+    with pytest.raises(ValueError):
+        engine.add('ana', 'oficial', 10, field='brecha')
+    with pytest.raises(ValueError):
+        engine.add('ana', 'blue', float('nan'))
+    with pytest.raises(ValueError):
+        engine.add('ana', 'blue', 'x')
+    limited = AlertEngine(TYPE_MAP, max_per_user=1)
+    limited.add('ana', 'blue', 1500)
+    with pytest.raises(ValueError):
+        limited.add('ana', 'blue', 1600)
+
+def test_shared_file_across_engines(tmp_path):
+    """Dos workers con el mismo archivo: ven las mismas alertas y cada snapshot dispara una sola vez"""
+    path = str(tmp_path / 'alerts.jsonl')
+    first = AlertEngine(TYPE_MAP, path=path)
+    second = AlertEngine(TYPE_MAP, path=path)
+    fired_first, fired_second = [], []
+    first.add_listener(fired_first.append)
+    second.add_listener(fired_second.append)
+
+    first.evaluate(snapshot(1200, 1))
+    second.evaluate(snapshot(1200, 1))
+    alert, _ = first.add('ana', 'blue', 1250)
+    kept, _ = second.add('ana', 'blue', 1500)
+    assert alert.id != kept.id
+    assert [a.id for a in second.pending('ana')] == [alert.id, kept.id]
+
+    second.evaluate(snapshot(1300, 2))
+    first.evaluate(snapshot(1300, 2))
+    assert fired_first == [] and [n['id'] for n in fired_second] == [alert.id]
+    assert [n['id'] for n in first.notifications('ana')] == [alert.id]
+
+    # Un snapshot más viejo (worker atrasado) no mueve los valores
+    assert first.evaluate(snapshot(1100, 1.5)) == []
+    assert first.value('blue', 'venta') == 1300
+
+    assert first.remove(kept.id, 'ana')
+    assert second.pending('ana') == []
+
+def test_shared_file_survives_restart(tmp_path):
+    path = str(tmp_path / 'alerts.jsonl')
+    alert, _ = AlertEngine(TYPE_MAP, path=path).add('ana', 'blue', 1250)
+    restarted = AlertEngine(TYPE_MAP, path=path)
+    assert [a.id for a in restarted.pending('ana')] == [alert.id]
+    assert restarted.add('ana', 'blue', 1300)[0].id == alert.id + 1
+
+def test_shared_file_appends_and_compacts(tmp_path):
+    """Cada operación agrega una línea al journal; con muchas líneas se reescribe con las alertas vigentes"""
+    path = str(tmp_path / 'alerts.jsonl')
+    first = AlertEngine(TYPE_MAP, path=path, compact_min=10)
+    second = AlertEngine(TYPE_MAP, path=path, compact_min=10)
+    first.evaluate(snapshot(1200, 1))
+    kept, _ = first.add('ana', 'blue', 1500)
+    size = os.path.getsize(path)
+    alert, _ = first.add('ana', 'blue', 1600)
+    with open(path, encoding='utf-8') as f:
+        assert len(f.read()[size:].splitlines()) == 1
+    assert [a.id for a in second.pending('ana')] == [kept.id, alert.id]
+
+    with open(path, encoding='utf-8') as f:
+        header = f.readline()
+    for _ in range(10):
+        alert, _ = second.add('ana', 'blue', 1600)
+        assert second.remove(alert.id)
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    # 2 (inicio) + 2 (altas) + 20 (altas y bajas) sin compactar
+    assert lines[0] != header.strip() and len(lines) <= 10 + 2 * 2 + 1
+    assert [a.id for a in first.pending('ana')] == [kept.id, kept.id + 1]
+    assert first.add('ana', 'blue', 1700)[0].id == alert.id + 1
+    assert [n['id'] for n in second.evaluate(snapshot(1550, 2))] == [kept.id]
+    assert [n['id'] for n in first.notifications('ana')] == [kept.id]
+
+def test_shared_file_drops_a_partial_line(tmp_path):
+    """Una escritura interrumpida no rompe la lectura y se descarta en la próxima escritura"""
+    path = str(tmp_path / 'alerts.jsonl')
+    engine = AlertEngine(TYPE_MAP, path=path)
+    alert, _ = engine.add('ana', 'blue', 1500)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "add", "alert": [9')
+    other = AlertEngine(TYPE_MAP, path=path)
+    assert [a.id for a in other.pending('ana')] == [alert.id]
+    other.add('ana', 'blue', 1600)
+    assert [a.id for a in AlertEngine(TYPE_MAP, path=path).pending('ana')] == [alert.id, alert.id + 1]
+
+@pytest.mark.parametrize("question", [
+    "avisame cuando el blue supere 1500",
+    "alertame si el blue venta pasa 1500",
+    "avisame si el oficial baja de 1000",
+    "mis alertas"
+])
+def test_alert_questions_go_to_the_llm(question):
+    intent = parse_intent(question)
+    assert intent.kind == ALERT
+    assert intent.needs_llm
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from analytics import convert_amounts, matrix_to_lists, price_stats, spread_series
+
+DAY = 86400.0
+
+def test_price_stats_per_window():
+    now = 10 * DAY
+    ts = np.array([1, 5, 8, 9, 10]) * DAY
+    prices = np.array([100.0, 110.0, 120.0, 90.0, 150.0])
+    stats = price_stats(ts, prices, np.array([2, 7]), now)
+
+    # 2 días: registros de los días 8, 9 y 10
+    assert stats['2']['registros'] == 3
+    assert stats['2']['cambio_pct'] == pytest.approx(25.0)
+    assert stats['2']['minimo'] == 90.0
+    assert stats['2']['maximo'] == 150.0
+    assert stats['2']['media'] == pytest.approx(120.0)
+    # 7 días: desde el día 3
+    assert stats['7']['registros'] == 4
+    assert stats['7']['inicial'] == 110.0
+    assert stats['7']['cambio_pct'] == pytest.approx(36.36, abs=0.01)
+    assert stats['7']['minimo'] == 90.0
+
+def test_price_stats_volatility_matches_log_returns():
+    now = 4 * DAY
+    ts = np.array([1, 2, 3, 4]) * DAY
+    prices = np.array([100.0, 110.0, 99.0, 120.0])
+    stats = price_stats(ts, prices, np.array([30]), now)
+    expected = np.std(np.diff(np.log(prices)), ddof=1)
+    assert stats['30']['volatilidad_pct'] == pytest.approx(expected * 100, abs=0.01)
+
+def test_price_stats_empty_window():
+    now = 100 * DAY
+    stats = price_stats(np.array([1.0]) * DAY, np.array([100.0]), np.array([7]), now)
+    assert stats == {'7': None}
+    assert price_stats(np.empty(0), np.empty(0), np.array([7, 30]), now) == {'7': None, '30': None}
+
+def test_spread_series_aligns_last_known_value():
+    ts_a = np.array([1.0, 3.0])
+    a = np.array([120.0, 130.0])
+    ts_b = np.array([2.0, 3.0, 4.0])
+    b = np.array([100.0, 100.0, 125.0])
+    ts, spread = spread_series(ts_a, a, ts_b, b)
+
+    # En t=1 todavía no hay valor de b
+    assert ts.tolist() == [2.0, 3.0, 4.0]
+    assert spread == pytest.approx([20.0, 30.0, 4.0])
+
+def test_spread_series_empty():
+    ts, spread = spread_series(np.empty(0), np.empty(0), np.array([1.0]), np.array([100.0]))
+    assert ts.size == 0 and spread.size == 0
+
+def test_convert_amounts_both_directions():
+    # Tipos: blue (compra 1180, venta 1200) y bolsa (compra 1150, venta 1160)
+    matrix = convert_amounts([100, 120000], ['usd_ars', 'ars_usd'], [1180, 1150], [1200, 1160])
+    # Vender dólares usa la compra; comprarlos, la venta
+    assert matrix.tolist() == [[118000.0, 115000.0], [100.0, 103.45]]
+
+def test_convert_amounts_single_direction_broadcasts():
+    matrix = convert_amounts([1, 2, 3], 'usd_ars', [1000], [1100])
+    assert matrix[:, 0].tolist() == [1000.0, 2000.0, 3000.0]
+
+def test_convert_amounts_missing_quote_is_null():
+    matrix = convert_amounts([10], 'ars_usd', [0.0, 1000.0], [0.0, 1000.0])
+    assert matrix_to_lists(matrix) == [[None, 0.01]]
+
+@pytest.mark.parametrize("amounts, directions", [
+    ([1, 2, 3], ['usd_ars', 'ars_usd']),
+    ([1], ['eur_ars']),
+    ([float('inf')], 'usd_ars')
+])
+def test_convert_amounts_rejects_invalid_input(amounts, directions):
+    with pytest.raises(ValueError):
+        convert_amounts(amounts, directions, [1000], [1100])
@@ -0,0 +1,170 @@
+import copy
+import os
+import pytest
+import dollar_server
+
+QUOTES = {
+    'blue': {'compra': 1180, 'venta': 1200, 'nombre': 'Blue', 'fecha': '2026-01-01T10:00:00.000Z'},
+    'oficial': {'compra': 980, 'venta': 1000, 'nombre': 'Oficial', 'fecha': '2026-01-01T10:00:00.000Z'},
+    'bolsa': {'compra': 1150, 'venta': 1160, 'nombre': 'Bolsa', 'fecha': '2026-01-01T10:00:00.000Z'}
+}
+
+@pytest.fixture
+def upstream():
+    """Cotizaciones que devuelve el upstream (se pueden modificar en el test)"""
+    return copy.deepcopy(QUOTES)
+
+@pytest.fixture
+def service(monkeypatch, upstream):
+    service = dollar_server.DollarServiceReal()
+    service.fetch_dollars_real = lambda: copy.deepcopy(upstream)
+    monkeypatch.setattr(dollar_server, "dollar_service", service)
+    yield service
+    service.stop_refresher()
+
+@pytest.fixture
+def client(service):
+    return dollar_server.app.test_client()
+
+def test_etag_304_when_unchanged(client):
+    response = client.get('/dollar/blue')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    revalidated = client.get('/dollar/blue', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == etag
+    assert revalidated.data == b""
+
+def test_etag_differs_by_format_and_route(client):
+    etags = {
+        client.get('/dollar/blue').headers['ETag'],
+        client.get('/dollar/blue?format=text').headers['ETag'],
+        client.get('/dollar/oficial').headers['ETag'],
+        client.get('/dollars?types=blue,oficial').headers['ETag']
+    }
+    assert len(etags) == 4
+
+def test_etag_changes_with_data(client, service, upstream):
+    etag = client.get('/dollar/blue').headers['ETag']
+    upstream['blue']['venta'] = 1250
+    service._fetch_and_publish()
+
+    response = client.get('/dollar/blue', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['venta'] == 1250
+    assert response.headers['ETag'] != etag
+
+def test_etag_changes_after_warm_restart_refresh(client, service):
+    """El snapshot restaurado y el mismo dato ya renovado tienen la misma versión pero otra fuente"""
+    service.get_snapshot()
+    service.snapshot = dict(service.snapshot, restored=True, timestamp=service.snapshot['timestamp'] - 60)
+    restored = client.get('/dollar/blue')
+    assert restored.get_json()['fuente'] == 'guardado'
+
+    service._fetch_and_publish()
+    response = client.get('/dollar/blue', headers={'If-None-Match': restored.headers['ETag']})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == restored.get_json()['version']
+    assert response.get_json()['fuente'] == 'api'
+
+def test_etag_not_reused_by_a_fresh_process(client, service, upstream):
+    """La numeración de versiones reinicia en otro proceso: el ETag no debe coincidir con otros datos"""
+    etag = client.get('/dollar/blue').headers['ETag']
+    assert client.get('/dollar/blue').get_json()['version'] == 1
+
+    upstream['blue']['venta'] = 1300
+    service.snapshot = None
+    service._view = None
+    response = client.get('/dollar/blue', headers={'If-None-Match': etag})
+    assert response.get_json()['version'] == 1
+    assert response.status_code == 200
+
+def test_convert_matrix(client):
+    response = client.post('/convert', json={"amounts": [100, 2], "direction": "usd_ars", "types": ["blue", "bolsa"]})
+    assert response.status_code == 200
+    assert response.get_json()['resultado'] == [[118000.0, 115000.0], [2360.0, 2300.0]]
+
+def test_convert_query_params_and_scalar_amount(client):
+    assert client.get('/convert?amounts=100&types=blue').get_json()['resultado'] == [[118000.0]]
+    response = client.post('/convert', json={"amounts": 1500, "types": "blue"})
+    assert response.status_code == 200
+    assert response.get_json()['resultado'] == [[1770000.0]]
+
+@pytest.mark.parametrize("body", [
+    {"amounts": {"a": 1}},
+    {"amounts": []},
+    {"amounts": ["x"]},
+    {"amounts": [1], "types": [1]},
+    {"amounts": [1], "types": ["cripto"]},
+    {"amounts": [1, 2], "directions": ["usd_ars", "x"]},
+    {"amounts": [1], "directions": 5},
+    {"amounts": [1], "directions": ["usd_ars", 5]},
+    [1, 2]
+])
+def test_convert_invalid_input_is_400(client, body):
+    response = client.post('/convert', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['error']
+
+def test_create_alert(client):
+    response = client.post('/alerts', json={"user": "ana", "dollar_type": "blue", "threshold": 1500})
+    assert response.status_code == 201
+    assert response.get_json()['alerta']['umbral'] == 1500
+    assert [a['umbral'] for a in client.get('/alerts?user=ana').get_json()['pendientes']] == [1500]
+
+@pytest.mark.parametrize("body", [
+    [1, 2],
+    "blue",
+    {"dollar_type": "cripto", "threshold": 1500},
+    {"dollar_type": "blue", "threshold": "x"}
+])
+def test_create_alert_invalid_input_is_400(client, body):
+    response = client.post('/alerts', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['error']
+
+@pytest.mark.parametrize("path", ['/history/foo/7', '/history/../7', '/history/%2E%2E/7'])
+def test_history_of_unknown_type_is_404(client, path):
+    history_dir = dollar_server.HISTORY_DIR
+    before = set(os.listdir(history_dir)) if os.path.isdir(history_dir) else set()
+    parent = set(os.listdir(os.path.dirname(history_dir)))
+    assert client.get(path).status_code == 404
+    after = set(os.listdir(history_dir)) if os.path.isdir(history_dir) else set()
+    assert after == before
+    assert set(os.listdir(os.path.dirname(history_dir))) == parent
+
+def test_history_tool_reports_unknown_type(service):
+    from mcp_server import DollarMCPServer, InProcessTransport
+    server = DollarMCPServer(InProcessTransport(service))
+    assert server._call_tool('get_dollar_history', {'dollar_type': 'foo', 'days': 7}).startswith("❌")
+    assert server._call_tool('get_dollar_history', {'dollar_type': 'blue', 'days': 7})[0] != "❌"
+
+def test_quote_timestamp_is_parsed_once_and_recorded(client, service):
+    from history_store import parse_fecha
+    data = client.get('/dollar/blue').get_json()
+    ts = parse_fecha(QUOTES['blue']['fecha'])
+    assert data['ts'] == ts and data['fecha'] == QUOTES['blue']['fecha']
+    assert service.view().quotes['blue'].ts == ts
+    assert list(service.history.query('blue', ts, ts)[2]) == [1200]
+
+def test_data_version_is_a_content_hash(client, service, upstream):
+    """Las claves de cache de los clientes no deben repetirse con otros datos tras un reinicio"""
+    from mcp_server import InProcessTransport
+    transport = InProcessTransport(service)
+    first = client.get('/types').get_json()
+    assert transport.data_version == first['hash']
+
+    # Otro proceso (versión reiniciada) con los mismos datos: misma huella
+    service.snapshot = None
+    service._view = None
+    assert client.get('/types').get_json()['hash'] == first['hash']
+
+    # Otro proceso con otros datos: misma versión, otra huella
+    upstream['blue']['venta'] = 1300
+    service.snapshot = None
+    service._view = None
+    data = client.get('/types').get_json()
+    assert data['version'] == first['version']
+    assert data['hash'] != first['hash']
+    assert transport.data_version == data['hash']
@@ -0,0 +1,36 @@
+import os
+import pytest
+from history_store import HistoryStore
+
+def test_query_returns_the_window(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    for ts in range(10):
+        store.append('blue', float(ts), 100 + ts, 110 + ts)
+    assert not store.append('blue', 5.0, 1, 1)
+    ts, compra, venta = store.query('blue', 3, 6)
+    assert list(ts) == [3, 4, 5, 6]
+    assert list(compra) == [103, 104, 105, 106]
+    assert list(venta) == [113, 114, 115, 116]
+
+def test_unknown_series_is_empty_and_creates_nothing(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    assert [list(column) for column in store.query('foo', 0, 1e12)] == [[], [], []]
+    assert os.listdir(tmp_path) == []
+
+@pytest.mark.parametrize("name", ["..", ".", "../blue", "a/b", "a\\b", ""])
+def test_names_outside_the_store_are_rejected(tmp_path, name):
+    store = HistoryStore(str(tmp_path / 'history'))
+    with pytest.raises(ValueError):
+        store.query(name, 0, 1)
+    with pytest.raises(ValueError):
+        store.append(name, 1.0, 1, 1)
+    assert not os.path.exists(tmp_path / 'history')
+
+def test_snapshot_keys_with_spaces(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    data = {
+        'contado con liqui': {'compra': 1, 'venta': 2, 'fecha': '2026-01-01T10:00:00.000Z'},
+        '../x': {'compra': 1, 'venta': 2, 'fecha': '2026-01-01T10:00:00.000Z'}
+    }
+    assert store.append_snapshot(data) == 1
+    assert os.listdir(tmp_path) == ['contado_con_liqui']
@@ -0,0 +1,58 @@
+import pytest
+from intent_parser import CONVERT, HISTORY, PRICE, REASONING, answer_locally, parse_amount, parse_intent
+
+class FakeTransport:
+    """Registra las llamadas del camino local"""
+
+    def __init__(self):
+        self.calls = []
+
+    def convert_amounts(self, amounts, directions, dollar_types):
+        self.calls.append(('convert_amounts', amounts, directions, dollar_types))
+        return "💱 Conversión"
+
+    def get_dollar_price(self, dollar_type):
+        self.calls.append(('get_dollar_price', dollar_type))
+        return "💵 Dólar"
+
+@pytest.mark.parametrize("word, amount", [
+    ("1500", 1500.0),
+    ("1.500", 1500.0),
+    ("1,500", 1500.0),
+    ("1,5", 1.5),
+    ("2.5", 2.5),
+    ("1.500,50", 1500.5),
+    ("1,500.50", 1500.5),
+    ("blue", None)
+])
+def test_parse_amount(word, amount):
+    assert parse_amount(word) == amount
+
+@pytest.mark.parametrize("question, amount, direction, types", [
+    ("cuánto son 1500 USD al blue vs MEP", 1500.0, 'usd_ars', ('blue', 'bolsa')),
+    ("cuánto es 200 usd en pesos al oficial", 200.0, 'usd_ars', ('oficial',)),
+    ("cuántos dólares son 100.000 pesos al blue", 100000.0, 'ars_usd', ('blue',)),
+    ("convertí 50 mil pesos a dólares", 50000.0, 'ars_usd', ())
+])
+def test_conversion_is_answered_locally(question, amount, direction, types):
+    intent = parse_intent(question)
+    assert intent.kind == CONVERT
+    assert (intent.amount, intent.direction, intent.dollar_types) == (amount, direction, types)
+    assert not intent.needs_llm
+
+    transport = FakeTransport()
+    assert answer_locally(intent, transport) == "💱 Conversión"
+    assert transport.calls == [('convert_amounts', [amount], direction, list(types) or None)]
+
+def test_conversion_without_amount_goes_to_the_llm():
+    intent = parse_intent("convertir dólares al mep")
+    assert intent.kind == CONVERT and intent.needs_llm
+
+@pytest.mark.parametrize("question, kind", [
+    ("precio del dólar blue", PRICE),
+    ("evolución del oficial últimos 7 días", HISTORY),
+    ("qué dólar me conviene para ahorrar", REASONING),
+    ("me conviene convertir 1000 usd al blue?", REASONING)
+])
+def test_other_intents(question, kind):
+    assert parse_intent(question).kind == kind
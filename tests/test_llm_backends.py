@@ -0,0 +1,132 @@
+import time
+from types import SimpleNamespace
+import pytest
+from benchmarks.stub_gemini import StubGenerativeModel
+from gemini_autogen_adapter import GeminiAutogenAdapter, gemini_backend
+from llm_backends import AnthropicBackend, LLMBackend, LLMRouter, LLMUnavailable, anthropic_messages
+
+TOOLS = [{"name": "get_dollars", "description": "Cotizaciones", "parameters": {"type": "object", "properties": {}}}]
+
+class FakeBackend(LLMBackend):
+    """Proveedor que responde su nombre después de latency segundos (o falla)"""
+
+    def __init__(self, name: str, latency: float = 0.0, fail: bool = False, **kwargs):
+        self.name = name
+        super().__init__(**kwargs)
+        self.latency_seconds = latency
+        self.fail = fail
+        self.calls = 0
+
+    def _complete(self, prompt, timeout):
+        self.calls += 1
+        time.sleep(self.latency_seconds)
+        if self.fail:
+            raise RuntimeError(f"{self.name} caído")
+        return self.name, {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+
+    def _turn(self, contents, tools, timeout, stream):
+        text, _ = self._complete("", timeout)
+        return [{"text": part} for part in (text, "!")]
+
+def test_router_fails_over_to_the_next_backend():
+    broken, backup = FakeBackend("a", fail=True), FakeBackend("b")
+    router = LLMRouter([broken, backup], hedge_delay=1.0)
+    assert router.complete("hola")[2] == "b"
+    assert broken.calls == 1 and broken.error_rate == 1.0
+
+def test_router_hedges_a_slow_backend():
+    slow, fast = FakeBackend("lento", latency=0.5), FakeBackend("rápido")
+    router = LLMRouter([slow, fast], hedge_delay=0.05, min_hedge_delay=0.05)
+    started = time.monotonic()
+    assert router.complete("hola")[0] == "rápido"
+    assert time.monotonic() - started < 0.4
+
+def test_router_skips_an_open_circuit_until_its_trial():
+    broken = FakeBackend("a", fail=True, failure_threshold=1, reset_timeout=0.1)
+    backup = FakeBackend("b")
+    router = LLMRouter([broken, backup], hedge_delay=1.0)
+    router.complete("hola")
+    assert broken.breaker.state == "open"
+    assert [backend.name for backend in router.ranked()] == ["b", "a"]
+    backup.fail = True
+    with pytest.raises(LLMUnavailable):
+        router.complete("hola")
+    assert broken.calls == 1
+
+    # Pasado reset_timeout la llamada de prueba sale bien y el circuito se cierra
+    time.sleep(0.12)
+    broken.fail = False
+    assert router.complete("hola")[2] == "a"
+    assert broken.breaker.state == "closed"
+
+def test_router_raises_when_every_circuit_is_open():
+    broken = FakeBackend("a", fail=True, failure_threshold=1)
+    router = LLMRouter([broken])
+    with pytest.raises(LLMUnavailable):
+        router.complete("hola")
+    with pytest.raises(LLMUnavailable, match="circuito abierto"):
+        router.complete("hola")
+
+def test_router_streams_from_the_winner():
+    router = LLMRouter([FakeBackend("a", fail=True), FakeBackend("b")], hedge_delay=1.0)
+    parts, backend = router.stream([{"role": "user", "parts": [{"text": "hola"}]}])
+    assert backend == "b"
+    assert [part["text"] for part in parts] == ["b", "!"]
+
+class TimedModel(StubGenerativeModel):
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        self.options = kwargs
+        return super().generate_content(prompt, stream=stream)
+
+def test_gemini_backend_passes_the_timeout():
+    model = TimedModel(latency=0, first_token_latency=0)
+    backend = gemini_backend(lambda tools: model)
+    backend.complete("hola", 7)
+    assert model.options == {"request_options": {"timeout": 7}}
+    backend.turn([{"role": "user", "parts": [{"text": "hola"}]}], None, 5)
+    assert model.options == {"request_options": {"timeout": 5}}
+
+def test_anthropic_messages_pair_tool_results_with_their_calls():
+    contents = [
+        {"role": "user", "parts": [{"text": "precio del blue"}]},
+        {"role": "model", "parts": [{"function_call": {"name": "get_dollars", "args": {}}},
+                                    {"function_call": {"name": "get_dollar_history", "args": {"days": 7}}}]},
+        {"role": "user", "parts": [{"function_response": {"name": "get_dollars", "response": {"result": "1200"}}},
+                                   {"function_response": {"name": "get_dollar_history", "response": {"result": "ok"}}}]}
+    ]
+    messages = anthropic_messages(contents)
+    assert [message["role"] for message in messages] == ["user", "assistant", "user"]
+    calls, results = messages[1]["content"], messages[2]["content"]
+    assert [block["input"] for block in calls] == [{}, {"days": 7}]
+    assert [block["tool_use_id"] for block in results] == [block["id"] for block in calls]
+    assert [block["content"] for block in results] == ["1200", "ok"]
+
+class FakeAnthropicMessages:
+    """messages.create de Anthropic: pide get_dollars y, con su resultado, responde con texto"""
+
+    def __init__(self):
+        self.requests = []
+
+    def create(self, **request):
+        self.requests.append(request)
+        usage = SimpleNamespace(input_tokens=10, output_tokens=5)
+        last = request["messages"][-1]["content"]
+        if any(block["type"] == "tool_result" for block in last):
+            return SimpleNamespace(content=[SimpleNamespace(type="text", text="El blue está a 1200")], usage=usage)
+        return SimpleNamespace(content=[SimpleNamespace(type="tool_use", name="get_dollars", input={})], usage=usage)
+
+def test_tool_calls_fail_over_to_anthropic():
+    adapter = GeminiAutogenAdapter()
+    adapter.set_tools(TOOLS)
+    gemini = gemini_backend(lambda tools: (_ for _ in ()).throw(RuntimeError("Gemini caído")))
+    anthropic = AnthropicBackend(api_key="test")
+    messages = FakeAnthropicMessages()
+    anthropic._client = SimpleNamespace(messages=messages)
+    adapter.router = LLMRouter([gemini, anthropic], hedge_delay=1.0)
+
+    executed = []
+    answer = adapter.generate_with_tools("precio del blue", lambda calls: executed.extend(calls) or ["1200"] * len(calls))
+    assert answer == "El blue está a 1200"
+    assert executed == [("get_dollars", {})]
+    assert [tool["name"] for tool in messages.requests[0]["tools"]] == ["get_dollars"]
+    assert gemini.error_rate == 1.0
@@ -0,0 +1,64 @@
+import time
+from llm_cache import LLMResponseCache, cached_stream, make_key, normalize_question
+
+def test_normalize_question():
+    assert normalize_question("¿Cuánto está el Dólar  BLUE?") == "cuanto esta el dolar blue"
+    assert make_key("Precio del blue!", 3) == make_key("precio del BLUE", 3)
+
+def test_normalize_keeps_number_separators():
+    assert normalize_question("¿Cuánto son 1.500 USD?") == "cuanto son 1.500 usd"
+    assert normalize_question("1,500 usd") == "1,500 usd"
+    assert make_key("cuánto son 1.500 usd", 1) != make_key("cuánto son 1,500 usd", 1)
+    assert make_key("cuánto son 1.500 usd", 1) != make_key("cuánto son 1 500 usd", 1)
+    # Los signos fuera de un número se siguen quitando
+    assert normalize_question("hola, qué tal. 2.") == "hola que tal 2"
+
+def test_key_depends_on_data_version():
+    cache = LLMResponseCache()
+    cache.set(make_key("precio del blue", 1), "respuesta")
+    assert cache.get(make_key("precio del blue", 1)) == "respuesta"
+    assert cache.get(make_key("precio del blue", 2)) is None
+
+def test_ttl_expires_entries(monkeypatch):
+    cache = LLMResponseCache(ttl=10)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache.set("k", "v")
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("k") is None
+    assert cache.stats()["size"] == 0
+
+def test_lru_eviction():
+    cache = LLMResponseCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+def test_clear_and_stats():
+    cache = LLMResponseCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("x")
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    cache.clear()
+    assert cache.get("a") is None
+
+def test_cached_stream_stores_complete_answers_only():
+    cache = LLMResponseCache()
+    assert list(cached_stream(cache, "k", lambda: iter(["ho", "la"]))) == ["ho", "la"]
+    assert list(cached_stream(cache, "k", lambda: iter(["otra"]))) == ["hola"]
+
+    def failing():
+        yield "par"
+        raise RuntimeError("cortado")
+
+    stream = cached_stream(cache, "roto", failing)
+    assert next(stream) == "par"
+    try:
+        next(stream)
+    except RuntimeError:
+        pass
+    assert cache.get("roto") is None
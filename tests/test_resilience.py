@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from resilience import CircuitBreaker, HedgeFailed, hedged_call
+
+class Target:
+    """Destino que responde su nombre después de latency segundos (o falla)"""
+
+    def __init__(self, name: str, latency: float = 0.0, fail: bool = False):
+        self.name = name
+        self.latency = latency
+        self.fail = fail
+        self.breaker = CircuitBreaker(name, failure_threshold=1, reset_timeout=60)
+        self.calls = 0
+
+    def __call__(self, timeout: float) -> str:
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError(f"{self.name} caído")
+        return self.name
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=True)
+
+def call(targets, executor, delay: float = 0.05, timeout: float = 2.0, hedges=None):
+    return hedged_call(targets, lambda target, timeout: target(timeout), lambda target: delay, timeout, executor,
+                       on_hedge=hedges.append if hedges is not None else None)
+
+def test_fast_first_target_is_not_hedged(executor):
+    first, second = Target("a"), Target("b")
+    assert call([first, second], executor) == ("a", first)
+    assert second.calls == 0
+
+def test_slow_target_is_hedged_and_the_first_answer_wins(executor):
+    slow, fast = Target("lento", latency=0.5), Target("rápido")
+    hedges = []
+    started = time.monotonic()
+    assert call([slow, fast], executor, hedges=hedges) == ("rápido", fast)
+    assert time.monotonic() - started < 0.4
+    assert hedges == [fast]
+
+def test_failure_launches_the_next_target_without_waiting(executor):
+    broken, backup = Target("caído", fail=True), Target("respaldo")
+    started = time.monotonic()
+    assert call([broken, backup], executor, delay=1.0) == ("respaldo", backup)
+    assert time.monotonic() - started < 0.5
+
+def test_open_circuits_are_skipped(executor):
+    broken, backup = Target("caído"), Target("respaldo")
+    broken.breaker.record_failure()
+    assert call([broken, backup], executor) == ("respaldo", backup)
+    assert broken.calls == 0
+    backup.breaker.record_failure()
+    with pytest.raises(HedgeFailed) as error:
+        call([broken, backup], executor)
+    assert error.value.all_open
+
+def test_all_failures_raise_with_every_error(executor):
+    with pytest.raises(HedgeFailed) as error:
+        call([Target("a", fail=True), Target("b", fail=True)], executor)
+    assert [target.name for target, _ in error.value.errors] == ["a", "b"]
+    assert not error.value.all_open
+
+def test_timeout_raises(executor):
+    with pytest.raises(HedgeFailed) as error:
+        call([Target("lento", latency=0.5)], executor, timeout=0.1)
+    assert error.value.errors == [] and not error.value.all_open
+
+def test_breaker_opens_and_closes_after_a_successful_trial():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Una sola llamada de prueba a la vez
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
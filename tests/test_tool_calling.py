@@ -0,0 +1,136 @@
+import threading
+import pytest
+import gemini_autogen_adapter
+from benchmarks.stub_gemini import StubGenerativeModel
+from gemini_autogen_adapter import GeminiAutogenAdapter
+from llm_cache import make_key
+from query_service import QueryService
+
+TOOLS = [
+    {"name": "get_dollars", "description": "Cotizaciones", "parameters": {"type": "object", "properties": {}}},
+    {"name": "create_price_alert", "description": "Crea una alerta", "parameters": {"type": "object", "properties": {}}}
+]
+
+def adapter_calling(*tool_calls) -> GeminiAutogenAdapter:
+    """Adaptador cuyo modelo pide tool_calls en el primer turno y después responde con texto"""
+    adapter = GeminiAutogenAdapter()
+    adapter.set_tools(TOOLS, {"create_price_alert"})
+    model = StubGenerativeModel(latency=0, first_token_latency=0, tool_calls=tool_calls,
+                                tools=[{"function_declarations": TOOLS}])
+    adapter._models["tools"] = (model, float("inf"))
+    return adapter
+
+class Executions:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, calls):
+        self.calls.append([name for name, _ in calls])
+        return ["ok"] * len(calls)
+
+def test_tool_answer_is_cached():
+    adapter = adapter_calling("get_dollars")
+    execute = Executions()
+    first = adapter.generate_with_tools("prompt", execute, cache_key="precio del blue", data_version=1)
+    second = adapter.generate_with_tools("prompt", execute, cache_key="precio del blue", data_version=1)
+    assert first == second
+    assert execute.calls == [["get_dollars"]]
+
+def test_mutating_tool_answer_is_not_cached():
+    adapter = adapter_calling("get_dollars", "create_price_alert")
+    execute = Executions()
+    for _ in range(2):
+        adapter.generate_with_tools("prompt", execute, cache_key="avisame cuando el blue supere 1500", data_version=1)
+    assert execute.calls == [["get_dollars", "create_price_alert"]] * 2
+    assert adapter.cache.stats()["size"] == 0
+
+class FakeClient:
+    """Cliente que nunca debe llamar a complete() desde el event loop"""
+
+    def __init__(self, answer: str = "respuesta nueva"):
+        self.answer = answer
+        self.completed = []
+
+    def plan_query(self, question):
+        return None, "prompt", 1
+
+    def new_memo(self):
+        return None
+
+    def complete(self, prompt, question, data_version=None, memo=None, before_turn=None):
+        # Como el cliente real: las herramientas corren en el loop de mcp_server
+        assert threading.current_thread().name != "mcp-loop", "complete() en el event loop"
+        self.completed.append(question)
+        return self.answer
+
+@pytest.fixture
+def adapter(monkeypatch):
+    adapter = GeminiAutogenAdapter()
+    monkeypatch.setattr(gemini_autogen_adapter, "_adapter", adapter)
+    return adapter
+
+def test_query_service_serves_cache_hits_without_calling_the_model(adapter):
+    adapter.cache.set(make_key("por qué sube el blue", 1), "respuesta cacheada")
+    client = FakeClient()
+    service = QueryService(client=client)
+    assert service.ask("por qué sube el blue", timeout=3) == ("respuesta cacheada", "cache")
+    assert client.completed == []
+
+def test_query_service_calls_the_model_off_the_loop(adapter):
+    client = FakeClient()
+    service = QueryService(client=client)
+    assert service.ask("por qué baja el blue", timeout=3) == ("respuesta nueva", "llm")
+    assert client.completed == ["por qué baja el blue"]
+
+class VersionedTransport:
+    """Transporte cuya huella de datos cambia cuando lo indica el test"""
+
+    def __init__(self, version: str):
+        self.version = version
+        self.data_version = None
+
+    def current_version(self):
+        self.data_version = self.version
+        return self.version
+
+def test_cached_answer_is_dropped_when_the_server_data_changes(adapter, monkeypatch):
+    from autogen_gemini_client import AutoGenGeminiClient
+    from mcp_server import mcp_server
+    transport = VersionedTransport("v1")
+    monkeypatch.setattr(mcp_server, "_transport", transport)
+    client = AutoGenGeminiClient()
+    client.adapter.set_tools(TOOLS)
+    model = StubGenerativeModel(latency=0, first_token_latency=0)
+    adapter._models["tools"] = (model, float("inf"))
+    service = QueryService(client=client)
+
+    question = "por qué sube el blue"
+    assert service.ask(question, timeout=3)[1] == "llm"
+    assert service.ask(question, timeout=3)[1] == "cache"
+    # Nadie consultó herramientas entre tanto: la versión se pregunta antes de buscar en la cache
+    transport.version = "v2"
+    assert service.ask(question, timeout=3)[1] == "llm"
+    assert model.calls == 2
+
+def test_each_model_call_takes_a_rate_limit_token(adapter, monkeypatch):
+    from autogen_gemini_client import AutoGenGeminiClient
+    from mcp_server import mcp_server
+    monkeypatch.setattr(mcp_server, "_transport", VersionedTransport("v1"))
+    client = AutoGenGeminiClient()
+    client.adapter.set_tools(TOOLS)
+    model = StubGenerativeModel(latency=0, first_token_latency=0, tool_calls=("get_dollars",),
+                                tools=[{"function_declarations": TOOLS}])
+    adapter._models["tools"] = (model, float("inf"))
+    service = QueryService(client=client)
+    acquired = []
+    acquire = service.bucket.acquire
+
+    async def counting_acquire(deadline):
+        acquired.append(deadline)
+        await acquire(deadline)
+
+    service.bucket.acquire = counting_acquire
+    assert service.ask("por qué sube el blue", timeout=3)[1] == "llm"
+    # Un turno pide la herramienta y otro responde con su resultado
+    assert model.calls == 2
+    assert len(acquired) == 2
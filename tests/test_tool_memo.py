@@ -0,0 +1,105 @@
+import threading
+import time
+from tool_memo import ToolMemo
+
+TOOLS = [
+    {"name": "get_dollar_history", "parameters": {"type": "object", "properties": {
+        "dollar_type": {"type": "string", "default": "blue"},
+        "days": {"type": "integer", "default": 7}
+    }}},
+    {"name": "get_dollars", "parameters": {"type": "object", "properties": {}}},
+    {"name": "create_price_alert", "parameters": {"type": "object", "properties": {}}}
+]
+
+class Executor:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, calls):
+        with self._lock:
+            self.calls.extend(calls)
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("falló la herramienta")
+        return [f"{name}:{len(self.calls)}" for name, _ in calls]
+
+def make_memo(version=None, **kwargs) -> ToolMemo:
+    version = version if version is not None else [1]
+    return ToolMemo(TOOLS, lambda: version[0], {"create_price_alert"}, **kwargs)
+
+def test_defaults_are_part_of_the_key():
+    memo = make_memo()
+    execute = Executor()
+    first = memo.call("get_dollar_history", {}, execute)
+    assert memo.call("get_dollar_history", {"dollar_type": "blue", "days": 7}, execute) == first
+    assert memo.call("get_dollar_history", {"days": 30}, execute) != first
+    assert len(execute.calls) == 2
+    assert memo.stats()["hits"] == 1
+
+def test_duplicate_calls_in_one_turn_run_once():
+    memo = make_memo()
+    execute = Executor()
+    results = memo.call_many([("get_dollars", {}), ("get_dollars", {}), ("get_dollar_history", {})], execute)
+    assert results[0] == results[1]
+    assert [name for name, _ in execute.calls] == ["get_dollars", "get_dollar_history"]
+    assert memo.stats()["coalesced"] == 1
+
+def test_concurrent_identical_calls_share_one_execution():
+    memo = make_memo()
+    execute = Executor(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(memo.call("get_dollars", {}, execute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(execute.calls) == 1
+    assert len(set(results)) == 1
+
+def test_data_version_change_invalidates():
+    version = [1]
+    memo = make_memo(version)
+    execute = Executor()
+    first = memo.call("get_dollars", {}, execute)
+    version[0] = 2
+    assert memo.call("get_dollars", {}, execute) != first
+    assert len(execute.calls) == 2
+
+def test_ttl_expires(monkeypatch):
+    memo = make_memo(ttl=10)
+    execute = Executor()
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    memo.call("get_dollars", {}, execute)
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    memo.call("get_dollars", {}, execute)
+    assert len(execute.calls) == 2
+
+def test_mutating_tools_run_every_time_and_clear_the_memo():
+    memo = make_memo()
+    execute = Executor()
+    memo.call("get_dollars", {}, execute)
+    memo.call("create_price_alert", {}, execute)
+    memo.call("create_price_alert", {}, execute)
+    memo.call("get_dollars", {}, execute)
+    assert [name for name, _ in execute.calls] == ["get_dollars", "create_price_alert", "create_price_alert", "get_dollars"]
+
+def test_errors_are_not_memoized():
+    memo = make_memo()
+    assert memo.call("get_dollars", {}, lambda calls: ["❌ Error"]) == "❌ Error"
+    execute = Executor()
+    memo.call("get_dollars", {}, execute)
+    assert len(execute.calls) == 1
+
+def test_exceptions_release_waiters():
+    memo = make_memo()
+    try:
+        memo.call("get_dollars", {}, Executor(fail=True))
+    except RuntimeError:
+        pass
+    execute = Executor()
+    memo.call("get_dollars", {}, execute)
+    assert len(execute.calls) == 1
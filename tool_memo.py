@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+import metrics
+
+# execute([(nombre, argumentos), ...]) -> resultados en el mismo orden
+Executor = Callable[[List[Tuple[str, Dict[str, Any]]]], List[str]]
+
+class ToolMemo:
+    """Resultados de herramientas ya consultadas en una conversación.
+
+    La clave es la herramienta más sus argumentos normalizados (completados con
+    los valores por defecto del esquema) y la memoria vale para una sola versión
+    de los datos: cuando cambia el snapshot se vacía. Las llamadas idénticas
+    simultáneas comparten una sola ejecución. Las herramientas que modifican estado
+    (mutating) no se memorizan y vacían la memoria, porque cambian lo que
+    devuelven otras (por ejemplo, la lista de alertas).
+    """
+
+    def __init__(self, tools: Iterable[dict], data_version: Callable[[], Hashable], mutating: Iterable[str] = (),
+                 ttl: float = 60, maxsize: int = 256):
+        self.defaults = {
+            tool["name"]: {
+                name: schema["default"]
+                for name, schema in (tool.get("parameters") or {}).get("properties", {}).items() if "default" in schema
+            }
+            for tool in tools
+        }
+        self.data_version = data_version
+        self.mutating = frozenset(mutating)
+        # Con el transporte HTTP la versión sólo se actualiza al consultar: el TTL acota lo que puede atrasar
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict[Hashable, Tuple[float, str]] = {}
+        self._inflight: Dict[Hashable, Future] = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def key(self, name: str, arguments: Optional[Dict[str, Any]]) -> Hashable:
+        merged = dict(self.defaults.get(name, {}), **(arguments or {}))
+        return name, json.dumps(merged, sort_keys=True, ensure_ascii=False, default=str)
+
+    def _check_version(self):
+        """Vacía la memoria si cambió la versión de los datos (con el lock tomado)"""
+        version = self.data_version()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def call(self, name: str, arguments: Optional[Dict[str, Any]], execute: Executor) -> str:
+        return self.call_many([(name, arguments)], execute)[0]
+
+    def call_many(self, calls: List[Tuple[str, Dict[str, Any]]], execute: Executor) -> List[str]:
+        """Resultados de calls en orden; execute recibe juntas (en paralelo) sólo las que faltan"""
+        results: List[Optional[str]] = [None] * len(calls)
+        # clave -> (future, índices de calls que esperan ese resultado)
+        owned: Dict[Hashable, Tuple[Future, List[int]]] = {}
+        waiting: List[Tuple[int, Future]] = []
+        mutations: List[int] = []
+        counts = {"hit": 0, "miss": 0, "coalesced": 0}
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            for i, (name, arguments) in enumerate(calls):
+                if name in self.mutating:
+                    mutations.append(i)
+                    continue
+                key = self.key(name, arguments)
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    results[i] = entry[1]
+                    counts["hit"] += 1
+                elif key in owned:
+                    owned[key][1].append(i)
+                    counts["coalesced"] += 1
+                elif key in self._inflight:
+                    # Otra llamada idéntica ya está en curso: se espera su resultado
+                    waiting.append((i, self._inflight[key]))
+                    counts["coalesced"] += 1
+                else:
+                    future = self._inflight[key] = Future()
+                    owned[key] = (future, [i])
+                    counts["miss"] += 1
+            self.hits += counts["hit"]
+            self.misses += counts["miss"]
+            self.coalesced += counts["coalesced"]
+        for result, count in counts.items():
+            if count:
+                metrics.TOOL_MEMO.inc(count, result=result)
+
+        pending = [(key, indices[0]) for key, (_, indices) in owned.items()] + [(None, i) for i in mutations]
+        if pending:
+            try:
+                outputs = execute([calls[i] for _, i in pending])
+            except Exception as e:
+                with self._lock:
+                    for key in owned:
+                        self._inflight.pop(key, None)
+                for future, _ in owned.values():
+                    future.set_exception(e)
+                raise
+            with self._lock:
+                if mutations:
+                    # Las lecturas del mismo turno pudieron correr antes o después del cambio: no se guardan
+                    self._entries.clear()
+                else:
+                    # La versión pudo avanzar con esta misma consulta: los resultados nuevos son de la vigente
+                    self._check_version()
+                expires = time.time() + self.ttl
+                for (key, i), output in zip(pending, outputs):
+                    if key is None:
+                        continue
+                    self._inflight.pop(key, None)
+                    if not mutations and not str(output).startswith("❌"):
+                        if len(self._entries) >= self.maxsize:
+                            self._entries.clear()
+                        self._entries[key] = (expires, output)
+            for (key, i), output in zip(pending, outputs):
+                if key is None:
+                    results[i] = output
+                    continue
+                future, indices = owned[key]
+                future.set_result(output)
+                for index in indices:
+                    results[index] = output
+        for i, future in waiting:
+            results[i] = future.result()
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._entries),
+            "hit_ratio": (self.hits + self.coalesced) / total if total else 0.0
+        }
+
+    def describe(self) -> str:
+        stats = self.stats()
+        return (f"🧮 Herramientas: {stats['hits']} reutilizadas / {stats['coalesced']} compartidas / "
+                f"{stats['misses']} ejecutadas ({stats['hit_ratio']:.0%} evitadas)")
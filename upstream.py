@@ -0,0 +1,148 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from resilience import CircuitBreaker, HedgeFailed, LatencyTracker, hedge_delay, hedged_call
+import metrics
+
+DOLARAPI_URL = os.getenv("DOLARAPI_URL", "https://dolarapi.com/v1/dolares")
+BLUELYTICS_URL = os.getenv("BLUELYTICS_URL", "https://api.bluelytics.com.ar/v2/latest")
+# Fuentes habilitadas, en orden de preferencia
+UPSTREAM_SOURCES = os.getenv("UPSTREAM_SOURCES", "dolarapi,bluelytics")
+# Tiempo máximo total de una descarga, sumando todas las fuentes (segundos)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "5"))
+
+class UpstreamUnavailable(Exception):
+    """Ninguna fuente devolvió cotizaciones válidas"""
+
+class Source:
+    """Una API de cotizaciones con su propio circuit breaker y registro de latencias"""
+    name = ""
+
+    def __init__(self, url: str, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.url = url
+        self.breaker = CircuitBreaker(self.name, failure_threshold, reset_timeout)
+        self.latency = LatencyTracker()
+        self._session = None
+
+    def _get_session(self):
+        # requests se importa con la primera descarga; la sesión mantiene la conexión abierta
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def fetch(self, timeout: float) -> Dict[str, dict]:
+        """Descarga y normaliza las cotizaciones; registra latencia y resultado en el breaker"""
+        started = time.perf_counter()
+        try:
+            response = self._get_session().get(self.url, timeout=(min(2, timeout), timeout))
+            response.raise_for_status()
+            data = self.parse(response.json())
+            if not data:
+                raise ValueError("respuesta sin cotizaciones")
+        except Exception:
+            self.breaker.record_failure()
+            metrics.UPSTREAM_ERRORS.inc(source=self.name)
+            raise
+        elapsed = time.perf_counter() - started
+        self.latency.observe(elapsed)
+        metrics.UPSTREAM_LATENCY.observe(elapsed, source=self.name)
+        self.breaker.record_success()
+        return data
+
+    def parse(self, payload) -> Dict[str, dict]:
+        """Convierte la respuesta al formato del snapshot: {clave: {compra, venta, nombre, fecha}}"""
+        raise NotImplementedError
+
+class DolarAPISource(Source):
+    name = "dolarapi"
+
+    def parse(self, payload) -> Dict[str, dict]:
+        result = {}
+        for dollar in payload:
+            result[dollar['nombre'].lower()] = {
+                'compra': dollar['compra'],
+                'venta': dollar['venta'],
+                'nombre': dollar['nombre'],
+                'fecha': dollar['fechaActualizacion']
+            }
+        return result
+
+class BluelyticsSource(Source):
+    """Bluelytics sólo publica oficial y blue"""
+    name = "bluelytics"
+
+    QUOTES = {'oficial': 'Oficial', 'blue': 'Blue'}
+
+    def parse(self, payload) -> Dict[str, dict]:
+        result = {}
+        for key, nombre in self.QUOTES.items():
+            quote = payload.get(key)
+            if quote:
+                result[key] = {
+                    'compra': quote['value_buy'],
+                    'venta': quote['value_sell'],
+                    'nombre': nombre,
+                    'fecha': payload['last_update']
+                }
+        return result
+
+SOURCES = {
+    "dolarapi": lambda: DolarAPISource(DOLARAPI_URL),
+    "bluelytics": lambda: BluelyticsSource(BLUELYTICS_URL)
+}
+
+def default_sources() -> List[Source]:
+    return [SOURCES[name.strip()]() for name in UPSTREAM_SOURCES.split(",") if name.strip() in SOURCES]
+
+class HedgedFetcher:
+    """Consulta varias fuentes con hedging: la primera respuesta válida gana.
+
+    Se consulta la fuente preferida y, si no respondió dentro de su p95 histórico
+    (hedge_delay si todavía no hay muestras), se lanza la siguiente sin cancelar la
+    anterior. Las fuentes con el circuito abierto se saltean sin esperar, así que
+    una caída del upstream no se traduce en esperas largas.
+    """
+
+    def __init__(self, sources: List[Source] = None, timeout: float = UPSTREAM_TIMEOUT,
+                 hedge_delay: float = 0.5, min_hedge_delay: float = 0.1):
+        self.sources = sources if sources is not None else default_sources()
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self._executor = ThreadPoolExecutor(max_workers=max(2, len(self.sources) * 2), thread_name_prefix="upstream")
+        for source in self.sources:
+            metrics.UPSTREAM_CIRCUIT.set_function(lambda s=source: 0 if s.breaker.state == CircuitBreaker.CLOSED else 1, source=source.name)
+
+    def _delay(self, source: Source) -> float:
+        """Cuánto esperar a una fuente antes de consultar la siguiente"""
+        return hedge_delay(source.latency, self.hedge_delay, self.min_hedge_delay)
+
+    def fetch(self) -> Tuple[Dict[str, dict], str]:
+        """Devuelve (cotizaciones, nombre de la fuente que respondió primero)"""
+        try:
+            data, source = hedged_call(
+                self.sources, lambda source, timeout: source.fetch(timeout), self._delay, self.timeout, self._executor,
+                on_hedge=lambda source: metrics.UPSTREAM_HEDGES.inc(source=source.name)
+            )
+        except HedgeFailed as e:
+            if e.all_open:
+                raise UpstreamUnavailable("todas las fuentes tienen el circuito abierto")
+            raise UpstreamUnavailable(f"ninguna fuente respondió ({str(e) or f'sin respuesta en {self.timeout:.0f} s'})")
+        metrics.UPSTREAM_WINS.inc(source=source.name)
+        return data, source.name
+
+    def describe(self) -> List[Dict]:
+        return [
+            {
+                "fuente": source.name,
+                "circuito": source.breaker.state,
+                "p50_ms": _ms(source.latency.percentile(50)),
+                "p95_ms": _ms(source.latency.percentile(95))
+            }
+            for source in self.sources
+        ]
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None